@@ -0,0 +1,333 @@
+"""第四层离线批处理模式 - 通过服务商的Batch API以更低价格生成场景文字"""
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from openai import OpenAI
+
+from src.utils.config import get_api_key, get_api_base_url
+from src.utils.file_utils import read_input_file
+from src.core.novel_generator import NovelGenerator
+from src.core.metrics import usage_from_openai
+from src.core.token_budget import trim_truncated
+
+BATCH_ENDPOINT_URL = "/v1/chat/completions"
+
+# 批处理任务的终止状态（与OpenAI Batch API一致）
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# langchain消息类型 -> OpenAI角色
+_ROLE_MAP = {"human": "user", "ai": "assistant", "system": "system"}
+
+
+class BatchJob(NamedTuple):
+    """一部小说的批处理任务"""
+    name: str
+    generator: NovelGenerator
+    input_path: str
+    output_path: Optional[str] = None
+
+
+def to_openai_messages(messages) -> List[Dict]:
+    """将langchain消息转换为OpenAI请求格式"""
+    return [{"role": _ROLE_MAP.get(m.type, "user"), "content": m.content} for m in messages]
+
+
+def _read_jsonl(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class OpenAIBatchEndpoint:
+    """OpenAI兼容的Batch API"""
+
+    name = "openai"
+
+    def __init__(self):
+        self.client = OpenAI(api_key=get_api_key(), base_url=get_api_base_url())
+
+    def submit(self, input_path: str) -> str:
+        """上传请求文件并创建批处理任务，返回任务ID"""
+        with open(input_path, "rb") as f:
+            batch_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT_URL,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        """查询批处理任务状态"""
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> List[Dict]:
+        """下载批处理结果（包括失败的请求）"""
+        batch = self.client.batches.retrieve(batch_id)
+        results = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = self.client.files.content(file_id).text
+                results.extend(json.loads(line) for line in content.splitlines() if line.strip())
+        return results
+
+
+class LocalBatchEndpoint:
+    """
+    基于本地文件的Batch API替身（用于测试）
+
+    请求文件复制到 directory/<batch_id>/ 下，查询状态时逐条处理请求并把结果
+    追加写入 output.jsonl；处理中断后再次查询会跳过已完成的请求。
+    """
+
+    name = "local"
+
+    def __init__(self, directory: str = "intermediate/local_batches",
+                 responder: Callable[[Dict], str] = None):
+        """
+        Args:
+            directory: 存放本地批处理任务的目录
+            responder: 根据请求体生成回复文本的函数，默认返回占位文本
+        """
+        self.directory = Path(directory)
+        self.responder = responder or self._placeholder_response
+
+    @staticmethod
+    def _placeholder_response(body: Dict) -> str:
+        prompt = body["messages"][-1]["content"]
+        return f"[local batch] {body['model']}: {len(prompt)} chars prompt"
+
+    def _batch_dir(self, batch_id: str) -> Path:
+        return self.directory / batch_id
+
+    def _write_status(self, batch_id: str, status: str):
+        with open(self._batch_dir(batch_id) / "status.json", "w", encoding="utf-8") as f:
+            json.dump({"id": batch_id, "status": status}, f)
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex[:12]}"
+        batch_dir = self._batch_dir(batch_id)
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        (batch_dir / "input.jsonl").write_bytes(Path(input_path).read_bytes())
+        self._write_status(batch_id, "validating")
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        batch_dir = self._batch_dir(batch_id)
+        with open(batch_dir / "status.json", "r", encoding="utf-8") as f:
+            status = json.load(f)["status"]
+        if status in TERMINAL_STATUSES:
+            return status
+
+        self._write_status(batch_id, "in_progress")
+        output_path = batch_dir / "output.jsonl"
+        done = {line["custom_id"] for line in _read_jsonl(output_path)}
+        with open(output_path, "a", encoding="utf-8") as out:
+            for request in _read_jsonl(batch_dir / "input.jsonl"):
+                if request["custom_id"] in done:
+                    continue
+                text = self.responder(request["body"])
+                out.write(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {
+                            "model": request["body"]["model"],
+                            "choices": [{
+                                "index": 0,
+                                "message": {"role": "assistant", "content": text},
+                                "finish_reason": "stop",
+                            }],
+                            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                        },
+                    },
+                    "error": None,
+                }, ensure_ascii=False) + "\n")
+                out.flush()
+        self._write_status(batch_id, "completed")
+        return "completed"
+
+    def results(self, batch_id: str) -> List[Dict]:
+        return _read_jsonl(self._batch_dir(batch_id) / "output.jsonl")
+
+
+class BatchRunner:
+    """
+    批处理运行器：为一部或多部小说准备前三层，把全部第四层请求提交为一个批处理任务，
+    轮询完成后导入结果并组装输出。
+
+    进度保存在状态文件中，进程重启后再次运行会跳过已完成的前三层和已提交的任务，
+    继续轮询并导入结果。
+    """
+
+    def __init__(self, endpoint, state_path: str = "intermediate/batch_state.json",
+                 poll_interval: float = 60):
+        """
+        Args:
+            endpoint: 批处理端点（OpenAIBatchEndpoint 或 LocalBatchEndpoint）
+            state_path: 状态文件路径
+            poll_interval: 轮询间隔（秒）
+        """
+        self.endpoint = endpoint
+        self.state_path = Path(state_path)
+        self.poll_interval = poll_interval
+
+    def _load_state(self) -> Dict:
+        if not self.state_path.exists():
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        # 上一次批处理已完整导入，本次作为新任务重新开始
+        if state.get("status") == "ingested":
+            return {}
+        return state
+
+    def _save_state(self, state: Dict):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+
+    def _prepare_upstream(self, job: BatchJob, state: Dict):
+        """准备前三层：已完成的从中间文件恢复，否则重新生成"""
+        messages = job.generator.run_messages()
+        print(messages["batch_upstream"].format(job=job.name))
+
+        job_state = state.setdefault("jobs", {}).setdefault(job.name, {})
+        if job_state.get("upstream") and job.generator.load_intermediate():
+            print(f"✓ {messages['batch_resumed']}")
+            return
+
+        job.generator.run_upstream(read_input_file(job.input_path))
+        job_state["upstream"] = True
+        self._save_state(state)
+
+    def build_requests(self, jobs: List[BatchJob]) -> List[Dict]:
+        """为所有任务的所有场景构建批处理请求"""
+        requests = []
+        for job in jobs:
+            generator = job.generator
+            for i, scene in enumerate(generator.scenes):
+                scene_num = scene.get("number", i + 1)
+                messages, _ = generator.build_scene_messages(scene, i)
+                body = {
+                    "model": generator.model_name,
+                    "messages": to_openai_messages(messages),
+                    "temperature": generator.llm.temperature,
+                }
+                max_tokens = generator.clamp_budget(generator.scene_budget(scene), messages)
+                if max_tokens:
+                    body["max_tokens"] = max_tokens
+                requests.append({
+                    "custom_id": f"{job.name}::{scene_num}",
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT_URL,
+                    "body": body,
+                })
+        return requests
+
+    def _wait(self, state: Dict, messages: Dict[str, str]) -> str:
+        """轮询批处理任务直到进入终止状态"""
+        while True:
+            status = self.endpoint.status(state["batch_id"])
+            if status != state.get("status"):
+                state["status"] = status
+                self._save_state(state)
+                print(messages["batch_status"].format(batch_id=state["batch_id"], status=status))
+            if status in TERMINAL_STATUSES:
+                return status
+            time.sleep(self.poll_interval)
+
+    def _ingest(self, jobs: List[BatchJob], results: List[Dict]):
+        """把批处理结果写回各生成器的 novel_texts，失败的场景改为实时生成"""
+        jobs_by_name = {job.name: job for job in jobs}
+        for result in results:
+            job_name, scene_num = result["custom_id"].rsplit("::", 1)
+            job = jobs_by_name.get(job_name)
+            response = result.get("response") or {}
+            if job is None or result.get("error") or response.get("status_code") != 200:
+                continue
+
+            body = response["body"]
+            usage = body.get("usage") or {}
+            choice = body["choices"][0]
+            # 被 max_tokens 截断的结果回退到最后一个完整的句子
+            truncated = choice.get("finish_reason") == "length"
+            content = choice["message"]["content"]
+            job.generator.novel_texts[int(scene_num)] = trim_truncated(content) if truncated else content
+            job.generator.metrics.record(
+                "textualization", body.get("model", job.generator.model_name),
+                usage_from_openai(usage), 0.0, scene_number=int(scene_num), batch=True,
+                **({"truncated": True} if truncated else {}),
+            )
+
+        for job in jobs:
+            generator = job.generator
+            for i, scene in enumerate(generator.scenes):
+                scene_num = scene.get("number", i + 1)
+                if scene_num not in generator.novel_texts:
+                    print(f"警告: 批处理中场景 {job.name}::{scene_num} 失败，改为实时生成")
+                    generator.generate_scene_text(scene, i)
+                elif generator.consistency_check:
+                    # 批处理结果同样经过一致性检查，只有未通过的场景实时重新生成
+                    generator.novel_texts[scene_num] = generator.ensure_consistency(
+                        scene, i, generator.novel_texts[scene_num]
+                    )
+            print(f"✓ {generator.run_messages()['batch_ingested'].format(count=len(generator.novel_texts))}")
+
+    def run(self, jobs: List[BatchJob]) -> Dict[str, str]:
+        """
+        运行批处理流程
+
+        Args:
+            jobs: 批处理任务列表
+
+        Returns:
+            任务名称 -> 完整小说文本（分片输出时为None）
+        """
+        messages = jobs[0].generator.run_messages()
+        state = self._load_state()
+        if state.get("batch_id") and sorted(state.get("jobs", {})) != sorted(job.name for job in jobs):
+            raise ValueError(f"状态文件 {self.state_path} 中的任务与本次任务不一致，请删除状态文件后重试")
+
+        for job in jobs:
+            self._prepare_upstream(job, state)
+
+        if not state.get("batch_id"):
+            requests = self.build_requests(jobs)
+            input_path = self.state_path.with_name("batch_requests.jsonl")
+            with open(input_path, "w", encoding="utf-8") as f:
+                for request in requests:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            state.update({
+                "batch_id": self.endpoint.submit(str(input_path)),
+                "endpoint": self.endpoint.name,
+                "input_file": str(input_path),
+                "status": "submitted",
+                "submitted_at": time.time(),
+            })
+            self._save_state(state)
+            print(messages["batch_submitted"].format(
+                batch_id=state["batch_id"], count=len(requests)))
+
+        status = self._wait(state, messages)
+        if status == "expired":
+            # 过期的任务仍有已完成请求的结果，导入后其余场景在 _ingest 中改为实时生成
+            print(f"警告: 批处理任务 {state['batch_id']} 已过期，导入已完成的部分结果，其余场景改为实时生成")
+        elif status != "completed":
+            # 清除失效的任务ID，下次运行时重新提交，而不是继续轮询同一个任务
+            batch_id = state.pop("batch_id")
+            state.setdefault("dead_batches", []).append({"batch_id": batch_id, "status": status})
+            self._save_state(state)
+            raise RuntimeError(f"批处理任务 {batch_id} 未完成，状态：{status}；已从状态文件中清除，重新运行将重新提交")
+
+        self._ingest(jobs, self.endpoint.results(state["batch_id"]))
+        novels = {job.name: job.generator.finalize(job.output_path) for job in jobs}
+
+        state["status"] = "ingested"
+        self._save_state(state)
+        return novels
@@ -0,0 +1,299 @@
+"""本地一致性检查 - 基于第一层世界设定构建实体词典，线性时间扫描场景文字，不调用LLM"""
+import re
+from collections import deque
+from typing import Dict, Iterator, List, NamedTuple, Set, Tuple
+
+from src.core.scene_scorer import split_names
+
+# 世界设定各节标题中的关键词（与三种语言的 WORLD_BUILDING_PROMPT 对应）
+_CHARACTER_SECTION_KEYWORDS = ["角色", "Character", "キャラクター"]
+_CONSTRAINT_SECTION_KEYWORDS = ["约束", "Constraints", "制約"]
+_FOUNDATION_SECTION_KEYWORDS = ["世界观基础", "World Foundation", "世界観の基礎"]
+
+_NAME_LABELS = ["姓名", "名字", "名称", "Name", "名前"]
+_ALIAS_LABELS = ["别名", "外号", "称号", "Alias", "Aliases", "Nickname", "a.k.a.", "通称", "異名", "あだ名"]
+_LOCATION_LABELS = ["地理", "地点", "重要地点", "主要区域", "Geographic", "Locations", "Regions", "場所", "地域"]
+_FORBIDDEN_LABELS = ["不允许", "禁止", "不得出现", "not allowed", "forbidden", "prohibited", "許可されない", "禁止"]
+
+_SECTION_RE = re.compile(r"^#{1,2}(?!#)\s*\d+[.．、]\s*(.+)$", re.M)
+_LIST_SPLIT_RE = re.compile(r"[、,，;；/]|\band\b|和|与|及|と")
+_PAREN_RE = re.compile(r"[（(][^）)]*[）)]")
+_CAPITALIZED_RE = re.compile(r"\b([A-Z][a-z]{2,})\b")
+# 紧跟在这些字符（及空白）之后的大写词位于句首、行首、破折号或引号之后，不一定是专有名词
+_SENTENCE_BOUNDARY_CHARS = set(".!?:;…\n—–-\"'“”‘’")
+
+# 英文中常见的大写开头但不是人名的词
+_COMMON_CAPITALIZED = {
+    "The", "And", "But", "She", "Her", "His", "They", "Their", "Then", "There", "This", "That",
+    "When", "What", "Where", "Who", "Why", "How", "You", "Your", "Yes", "Not", "For", "With",
+    "Lord", "Lady", "Sir", "Master", "God", "Gods", "King", "Queen", "Prince", "Princess",
+    "Captain", "Commander", "General", "Colonel", "Major", "Sergeant", "Lieutenant", "Admiral", "Emperor",
+    "Empress", "Empire", "Kingdom", "Duke", "Duchess", "Count", "Baron", "Knight", "Doctor", "Professor",
+    "Mister", "Miss", "Madam", "Father", "Mother", "Brother", "Sister", "Uncle", "Aunt", "Elder", "Saint",
+    "Heaven", "Hell", "Council", "Guild", "Academy", "Church", "Temple", "City", "North", "South", "East", "West",
+    "Mrs", "Oh", "Ah", "Well", "Still", "Even", "Just", "Now", "Here", "Once", "After", "Before", "Only",
+    "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday",
+    "January", "February", "March", "April", "June", "July", "August", "September", "October",
+    "November", "December",
+}
+
+# 术语过长时无法逐字匹配，只保留较短的条目
+_MAX_TERM_LENGTH = 24
+
+# 世界设定中的人物至少被提及这么多次才算出场（只提及一次多为回忆或对话中的引用）
+_UNEXPECTED_MIN_MENTIONS = 2
+
+
+class ConsistencyIssue(NamedTuple):
+    """一条一致性问题"""
+    kind: str      # unknown_character / unexpected_character / unknown_name / constraint_violation
+    term: str
+    detail: str
+
+    @property
+    def triggers_regeneration(self) -> bool:
+        # 场景字段中的未知人物来自第三层，重新生成正文无法修正；
+        # 未知英文人名是启发式判断，只记录在报告中
+        return self.kind not in ("unknown_character", "unknown_name")
+
+
+class AhoCorasick:
+    """Aho-Corasick 多模式匹配自动机，构建后扫描文本的时间与文本长度成线性关系"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, object]]] = [[]]
+        self._built = False
+
+    def add(self, word: str, payload: object):
+        """添加一个模式串及其附带信息"""
+        node = 0
+        for char in word:
+            if char not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][char] = len(self._goto) - 1
+            node = self._goto[node][char]
+        self._output[node].append((word, payload))
+        self._built = False
+
+    def build(self):
+        """按广度优先计算失败指针"""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        self._built = True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, object]]:
+        """
+        扫描文本，依次产出 (起始位置, 结束位置, 匹配的模式串, 附带信息)
+        """
+        if not self._built:
+            self.build()
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for word, payload in self._output[node]:
+                yield i - len(word) + 1, i + 1, word, payload
+
+
+def _split_sections(world_setting: str) -> Dict[str, str]:
+    """按 "## N. 标题" 拆分世界设定，返回 标题 -> 内容"""
+    matches = list(_SECTION_RE.finditer(world_setting))
+    sections = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(world_setting)
+        sections[match.group(1).strip()] = world_setting[match.end():end]
+    return sections
+
+
+def _find_section(sections: Dict[str, str], keywords: List[str]) -> str:
+    for title, content in sections.items():
+        if any(keyword.lower() in title.lower() for keyword in keywords):
+            return content
+    return ""
+
+
+def _labeled_values(text: str, labels: List[str]) -> List[str]:
+    """提取 "标签：值" 形式的值（支持 **标签**、- 标签 等 Markdown 写法）"""
+    pattern = r"(?:%s)[^\n:：]{0,12}\**\s*[:：]\s*([^\n]+)" % "|".join(re.escape(label) for label in labels)
+    return [match.group(1).strip(" *") for match in re.finditer(pattern, text, re.IGNORECASE)]
+
+
+def _clean_terms(values: List[str]) -> List[str]:
+    terms = []
+    for value in values:
+        value = _PAREN_RE.sub("", value)
+        for term in _LIST_SPLIT_RE.split(value):
+            term = term.strip(" -*·.。:：\"'“”「」（）()")
+            if 1 < len(term) <= _MAX_TERM_LENGTH:
+                terms.append(term)
+    return terms
+
+
+class LoreDictionary:
+    """从世界设定中提取的实体词典：人物（含别名）、地点和禁止出现的元素"""
+
+    def __init__(self, world_setting: str):
+        sections = _split_sections(world_setting)
+        character_section = _find_section(sections, _CHARACTER_SECTION_KEYWORDS)
+        constraint_section = _find_section(sections, _CONSTRAINT_SECTION_KEYWORDS)
+        foundation_section = _find_section(sections, _FOUNDATION_SECTION_KEYWORDS)
+
+        # 人物：名称 -> 规范名称
+        self.characters: Dict[str, str] = {}
+        for block in re.split(r"\n(?=\s*(?:#{3,}|\d+[.．、]|-\s*\*\*(?:%s)))" % "|".join(_NAME_LABELS),
+                              character_section):
+            names = _clean_terms(_labeled_values(block, _NAME_LABELS)[:1])
+            if not names:
+                continue
+            canonical = names[0]
+            self.characters[canonical] = canonical
+            for alias in _clean_terms(_labeled_values(block, _ALIAS_LABELS)):
+                # 英文别名必须是大写开头的专有名词，否则会匹配到普通单词
+                if not alias.isascii() or alias[0].isupper():
+                    self.characters.setdefault(alias, canonical)
+            # 英文全名也按名和姓分别匹配
+            for part in canonical.split():
+                if len(part) > 2 and part[0].isupper():
+                    self.characters.setdefault(part, canonical)
+
+        self.locations: Set[str] = set(_clean_terms(_labeled_values(foundation_section, _LOCATION_LABELS)))
+        self.forbidden: Set[str] = set(_clean_terms(self._forbidden_values(constraint_section)))
+
+        self.automaton = AhoCorasick()
+        for name, canonical in self.characters.items():
+            self.automaton.add(name, ("character", canonical))
+        for location in self.locations:
+            self.automaton.add(location, ("location", location))
+        self.automaton.build()
+        # 禁止元素不区分大小写（扫描小写的文本）
+        self.forbidden_automaton = AhoCorasick()
+        for term in self.forbidden:
+            self.forbidden_automaton.add(term.lower(), ("forbidden", term))
+        self.forbidden_automaton.build()
+
+    @staticmethod
+    def _forbidden_values(constraint_section: str) -> List[str]:
+        """禁止元素：标签同一行的值，以及标签下方缩进的子条目"""
+        values = _labeled_values(constraint_section, _FORBIDDEN_LABELS)
+        lines = constraint_section.split("\n")
+        for i, line in enumerate(lines):
+            if not any(label.lower() in line.lower() for label in _FORBIDDEN_LABELS):
+                continue
+            indent = len(line) - len(line.lstrip())
+            for sub_line in lines[i + 1:]:
+                sub_indent = len(sub_line) - len(sub_line.lstrip())
+                if not sub_line.strip() or sub_indent <= indent:
+                    break
+                values.append(sub_line.strip(" -*"))
+        return values
+
+    def is_empty(self) -> bool:
+        return not (self.characters or self.forbidden)
+
+
+def _is_word_match(text: str, start: int, end: int, term: str) -> bool:
+    """英文术语需要落在单词边界上，避免 Ann 匹配到 Anna"""
+    if not term[0].isascii():
+        return True
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not (before.isalnum() or after.isalnum())
+
+
+def _is_sentence_initial(text: str, start: int) -> bool:
+    """单词是否位于文本开头、句首、行首、破折号或引号之后"""
+    prefix = text[max(0, start - 16):start].rstrip(" \t*_([")
+    return not prefix or prefix[-1] in _SENTENCE_BOUNDARY_CHARS
+
+
+class ConsistencyChecker:
+    """基于实体词典检查场景文字的一致性"""
+
+    def __init__(self, world_setting: str, language: str):
+        self.world_setting = world_setting
+        self.lore = LoreDictionary(world_setting)
+        self.language = language
+
+    def check(self, text: str, scene: Dict) -> List[ConsistencyIssue]:
+        """
+        检查单个场景的文字
+
+        Args:
+            text: 场景文字
+            scene: 场景字典（使用其中的人物字段）
+
+        Returns:
+            一致性问题列表，为空表示通过
+        """
+        issues = []
+
+        # 场景人物字段中的人物（规范名称），以及不在世界设定中的人物
+        scene_characters = set()
+        for name in split_names(scene.get("characters", "")):
+            canonical = self.lore.characters.get(name)
+            if canonical:
+                scene_characters.add(canonical)
+            elif self.lore.characters:
+                issues.append(ConsistencyIssue("unknown_character", name, "scene characters field"))
+
+        # 人物 -> 各次提及的 [起始位置, 结束位置, 匹配的名称]（全名与其中的名、姓重叠时合并为一次提及）
+        mentions: Dict[str, List[list]] = {}
+        for start, end, term, (kind, value) in self.lore.automaton.iter_matches(text):
+            if kind != "character" or not _is_word_match(text, start, end, term):
+                continue
+            # 英文的名或姓单独出现在句首时可能是普通单词（例如 Storm clouds）
+            if term != value and term.isascii() and _is_sentence_initial(text, start):
+                continue
+            spans = mentions.setdefault(value, [])
+            if spans and start < spans[-1][1]:
+                spans[-1][0] = min(spans[-1][0], start)
+                spans[-1][1] = end
+            else:
+                spans.append([start, end, term])
+        for value, spans in mentions.items():
+            if scene_characters and value not in scene_characters and len(spans) >= _UNEXPECTED_MIN_MENTIONS:
+                issues.append(ConsistencyIssue("unexpected_character", value,
+                                               f"matched '{spans[0][2]}' {len(spans)} times"))
+
+        lowered = text.lower()
+        seen = set()
+        for start, end, term, (kind, value) in self.lore.forbidden_automaton.iter_matches(lowered):
+            if value in seen or not _is_word_match(lowered, start, end, term):
+                continue
+            seen.add(value)
+            issues.append(ConsistencyIssue("constraint_violation", value, f"offset {start}"))
+
+        # 多语言模式中世界设定来自枢纽语言，英文正文中的人名（如拼音）无法与词典对照，不做检查
+        if self.language == "en" and any(name.isascii() for name in self.lore.characters):
+            issues.extend(self._unknown_english_names(text))
+
+        return issues
+
+    def _unknown_english_names(self, text: str) -> List[ConsistencyIssue]:
+        """英文中多次出现在句中（不在句首、行首、破折号或引号之后）、但不在词典中的大写词，视为可能的未知人名"""
+        counts: Dict[str, int] = {}
+        for match in _CAPITALIZED_RE.finditer(text):
+            word = match.group(1)
+            if word not in _COMMON_CAPITALIZED and not _is_sentence_initial(text, match.start()):
+                counts[word] = counts.get(word, 0) + 1
+        known = set(self.lore.characters) | {w for term in self.lore.locations for w in term.split()}
+        return [
+            ConsistencyIssue("unknown_name", word, f"{count} occurrences")
+            for word, count in counts.items()
+            if count >= 2 and word not in known
+        ]
@@ -0,0 +1,189 @@
+"""流式退化检测 - 在LLM输出流上在线检测重复、语言漂移和超长，每个字符的处理为O(1)"""
+from collections import deque
+from typing import Optional
+
+# 重复检测：字符n-gram长度和滑动窗口大小（字符数）
+NGRAM_SIZE = 20
+REPETITION_WINDOW = 1500
+# 语言漂移检测：滑动窗口中的字母/汉字数量
+LANGUAGE_WINDOW = 300
+# 窗口中的内容少于该比例时不做判断，避免开头的少量文字误判
+MIN_FILL_RATIO = 0.5
+
+_HASH_BASE = 1_000_003
+_HASH_MOD = (1 << 61) - 1
+
+# 截断时回退到的句末位置
+_SENTENCE_ENDS = set("。！？!?.\n")
+
+
+def _char_class(char: str) -> Optional[str]:
+    """字符类别：han（汉字）、kana（假名）、latin（拉丁字母），其他字符返回None"""
+    if "一" <= char <= "鿿":
+        return "han"
+    if "぀" <= char <= "ヿ":
+        return "kana"
+    if char.isascii() and char.isalpha():
+        return "latin"
+    return None
+
+
+class DegenerationDetector:
+    """
+    单次LLM输出的在线退化检测器
+
+    - 重复：滚动哈希计算最近 NGRAM_SIZE 个字符的 n-gram，统计滑动窗口内与窗口中已有 n-gram 重复的比例
+    - 语言漂移：滑动窗口内目标语言文字的占比（例如 ja 运行中大量出现英文，或只有汉字没有假名）
+    - 超长：按语言统计的长度（英文为单词数，中日文为非空白字符数）超过目标长度的倍数
+    """
+
+    def __init__(self, language: str, target_length: int = None, repetition_threshold: float = 0.5,
+                 language_threshold: float = 0.5, overshoot_ratio: float = 2.0):
+        self.language = language
+        self.max_length = int(target_length * overshoot_ratio) if target_length else None
+        self.repetition_threshold = repetition_threshold
+        self.language_threshold = language_threshold
+
+        self.text_parts = []
+        self.position = 0
+        self.length = 0  # 按语言统计的长度
+        self._in_word = False
+        self._last_space = True
+
+        # 重复检测状态
+        self._recent = deque()  # 最近 NGRAM_SIZE 个 (字符, 位置)
+        self._hash = 0
+        self._power = pow(_HASH_BASE, NGRAM_SIZE - 1, _HASH_MOD)
+        self._grams = deque()  # 窗口中的 (哈希, 起始位置, 是否重复)
+        self._gram_counts = {}
+        self._repeated = 0
+
+        # 语言漂移检测状态
+        self._letters = deque()  # 窗口中的 (位置, 类别)
+        self._class_counts = {"han": 0, "kana": 0, "latin": 0}
+
+        self.reason: Optional[str] = None
+        self.clean_length: Optional[int] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts)
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        输入一段流式输出
+
+        Returns:
+            检测到退化时返回原因（repetition / language_drift / overshoot），否则返回None
+        """
+        if self.reason or not chunk:
+            return self.reason
+        self.text_parts.append(chunk)
+        for char in chunk:
+            self._feed_char(char)
+            self.position += 1
+            if self.reason:
+                break
+        return self.reason
+
+    def _feed_char(self, char: str):
+        # 连续空白折叠为一个空格，避免排版差异影响重复判断
+        if char.isspace():
+            if self._last_space:
+                self._in_word = False
+                return
+            char = " "
+        self._last_space = char == " "
+
+        self._count_length(char)
+        self._update_repetition(char)
+        self._update_language(char)
+
+        if self.max_length and self.length > self.max_length:
+            self._abort("overshoot", self.position)
+        elif (len(self._grams) >= REPETITION_WINDOW * MIN_FILL_RATIO
+              and self._repeated / len(self._grams) > self.repetition_threshold):
+            # 从窗口中最早的重复 n-gram 处截断（它之前的内容尚未重复）
+            first_repeat = next(start for _, start, repeated in self._grams if repeated)
+            self._abort("repetition", first_repeat)
+        elif len(self._letters) >= LANGUAGE_WINDOW * MIN_FILL_RATIO and self._target_ratio() < self.language_threshold:
+            # 从窗口中第一个非目标语言的文字处截断（ja 输出成中文时没有外语文字，从窗口开头截断）
+            first_foreign = next((pos for pos, cls in self._letters if not self._is_target(cls)),
+                                 self._letters[0][0])
+            self._abort("language_drift", first_foreign)
+
+    def _count_length(self, char: str):
+        if self.language == "en":
+            is_letter = char.isalpha() or char == "'"
+            if is_letter and not self._in_word:
+                self.length += 1
+            self._in_word = is_letter
+        elif char != " ":
+            self.length += 1
+
+    def _update_repetition(self, char: str):
+        self._recent.append((char, self.position))
+        if len(self._recent) > NGRAM_SIZE:
+            removed, _ = self._recent.popleft()
+            self._hash = (self._hash - ord(removed) * self._power) % _HASH_MOD
+        self._hash = (self._hash * _HASH_BASE + ord(char)) % _HASH_MOD
+        if len(self._recent) < NGRAM_SIZE:
+            return
+
+        count = self._gram_counts.get(self._hash, 0)
+        self._gram_counts[self._hash] = count + 1
+        repeated = count > 0
+        self._repeated += repeated
+        self._grams.append((self._hash, self._recent[0][1], repeated))
+
+        if len(self._grams) > REPETITION_WINDOW:
+            old_hash, _, old_repeated = self._grams.popleft()
+            self._repeated -= old_repeated
+            self._gram_counts[old_hash] -= 1
+            if not self._gram_counts[old_hash]:
+                del self._gram_counts[old_hash]
+
+    def _update_language(self, char: str):
+        cls = _char_class(char)
+        if cls is None:
+            return
+        self._letters.append((self.position, cls))
+        self._class_counts[cls] += 1
+        if len(self._letters) > LANGUAGE_WINDOW:
+            _, old_cls = self._letters.popleft()
+            self._class_counts[old_cls] -= 1
+
+    def _is_target(self, cls: str) -> bool:
+        if self.language == "en":
+            return cls == "latin"
+        if self.language == "ja":
+            return cls in ("han", "kana")
+        if self.language == "zh":
+            return cls == "han"
+        return True
+
+    def _target_ratio(self) -> float:
+        counts = self._class_counts
+        letters = len(self._letters)
+        if self.language == "ja":
+            # 日文中假名几乎不出现时，多半是输出成了中文
+            if counts["han"] and counts["kana"] / (counts["han"] + counts["kana"]) < 0.05:
+                return 0.0
+            return (counts["han"] + counts["kana"]) / letters
+        if self.language in ("en", "zh"):
+            return counts["latin" if self.language == "en" else "han"] / letters
+        return 1.0
+
+    def _abort(self, reason: str, cut_position: int):
+        self.reason = reason
+        text = self.text
+        cut = min(cut_position, len(text))
+        # 回退到最近的句末，避免截断后留下半句话
+        sentence_end = next((i for i in range(cut - 1, max(cut - 200, -1), -1) if text[i] in _SENTENCE_ENDS),
+                            None)
+        self.clean_length = sentence_end + 1 if sentence_end is not None else cut
+
+    def clean_text(self) -> str:
+        """检测到退化时返回截断到退化开始之前的文本，否则返回全部文本"""
+        text = self.text
+        return text[:self.clean_length].rstrip() if self.reason else text
@@ -0,0 +1,155 @@
+"""LLM调用指标统计（token用量、耗时、成本）"""
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.utils.config import get_model_prices
+
+
+def extract_usage(response) -> Dict[str, int]:
+    """
+    从LLM响应中提取token用量
+
+    Args:
+        response: AIMessage 或 ChatGeneration.message
+
+    Returns:
+        包含 input_tokens、output_tokens 和 cached_tokens（命中前缀缓存的输入token）的字典
+    """
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return usage_from_openai(token_usage, getattr(response, "usage_metadata", None))
+
+
+def usage_from_openai(token_usage: Dict, usage_metadata: Dict = None) -> Dict[str, int]:
+    """
+    从OpenAI格式的原始用量（以及langchain的usage_metadata）中提取token用量
+
+    缓存命中数：OpenAI 为 prompt_tokens_details.cached_tokens，DeepSeek 为 prompt_cache_hit_tokens。
+    """
+    cached = ((token_usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+              or token_usage.get("prompt_cache_hit_tokens") or 0)
+    if usage_metadata:
+        cached = (usage_metadata.get("input_token_details") or {}).get("cache_read") or cached
+        return {
+            "input_tokens": usage_metadata.get("input_tokens", 0) or 0,
+            "output_tokens": usage_metadata.get("output_tokens", 0) or 0,
+            "cached_tokens": cached,
+        }
+
+    # 旧版本langchain只在response_metadata中提供原始用量
+    return {
+        "input_tokens": token_usage.get("prompt_tokens", 0) or 0,
+        "output_tokens": token_usage.get("completion_tokens", 0) or 0,
+        "cached_tokens": cached,
+    }
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """根据价格表估算调用成本（美元），缓存命中的输入按缓存价格计算，未知模型返回0"""
+    prices = get_model_prices().get(model)
+    if not prices:
+        return 0.0
+    input_price, output_price = prices[0], prices[1]
+    # 未配置缓存价格时按输入价格的一半估算
+    cached_price = prices[2] if len(prices) > 2 else input_price / 2
+    uncached_tokens = input_tokens - cached_tokens
+    return (uncached_tokens * input_price + cached_tokens * cached_price
+            + output_tokens * output_price) / 1_000_000
+
+
+class RunMetrics:
+    """记录一次生成流程中所有LLM调用的指标（线程安全）"""
+
+    def __init__(self):
+        self.calls: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, layer: str, model: str, usage: Dict[str, int], latency: float,
+               scene_number: Optional[int] = None, **extra) -> Dict:
+        """
+        记录一次LLM调用
+
+        Args:
+            layer: 所属层级（world_building, story_layer, scene_decomposition, textualization等）
+            model: 模型名称
+            usage: extract_usage 返回的token用量
+            latency: 调用耗时（秒）
+            scene_number: 场景编号（仅第四层）
+            **extra: 其他附加信息（如级联阶段）
+
+        Returns:
+            记录的调用字典
+        """
+        call = {
+            "layer": layer,
+            "model": model,
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "latency": round(latency, 3),
+            "cost": estimate_cost(model, usage.get("input_tokens", 0), usage.get("output_tokens", 0),
+                                  usage.get("cached_tokens", 0)),
+        }
+        if scene_number is not None:
+            call["scene_number"] = scene_number
+        call.update(extra)
+        with self._lock:
+            self.calls.append(call)
+        return call
+
+    def filter(self, **conditions) -> List[Dict]:
+        """按字段筛选调用记录"""
+        with self._lock:
+            calls = list(self.calls)
+        return [c for c in calls if all(c.get(k) == v for k, v in conditions.items())]
+
+    @staticmethod
+    def aggregate(calls: List[Dict]) -> Dict:
+        """汇总一组调用的次数、token、缓存命中率、耗时和成本"""
+        input_tokens = sum(c["input_tokens"] for c in calls)
+        cached_tokens = sum(c.get("cached_tokens", 0) for c in calls)
+        return {
+            "calls": len(calls),
+            "input_tokens": input_tokens,
+            "output_tokens": sum(c["output_tokens"] for c in calls),
+            "cached_tokens": cached_tokens,
+            "cache_hit_rate": round(cached_tokens / input_tokens, 4) if input_tokens else 0.0,
+            "latency": round(sum(c["latency"] for c in calls), 3),
+            "cost": round(sum(c["cost"] for c in calls), 6),
+        }
+
+    def summary(self) -> Dict:
+        """按层级汇总全部调用"""
+        with self._lock:
+            calls = list(self.calls)
+        layers: Dict[str, List[Dict]] = {}
+        for call in calls:
+            layers.setdefault(call["layer"], []).append(call)
+        return {
+            "total": self.aggregate(calls),
+            "layers": {layer: self.aggregate(items) for layer, items in layers.items()},
+        }
+
+
+def append_run_history(record: Dict, path: str):
+    """向运行历史文件追加一次运行的指标汇总（JSON Lines）"""
+    history_path = Path(path)
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_run_history(path: str) -> List[Dict]:
+    """读取运行历史，文件不存在时返回空列表，跳过无法解析的行"""
+    history_path = Path(path)
+    if not history_path.exists():
+        return []
+    records = []
+    with open(history_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
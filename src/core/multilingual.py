@@ -0,0 +1,149 @@
+"""多语言分发 - 前三层只在枢纽语言中运行一次，第四层按目标语言并发分发"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+from src.utils.config import get_fanout_concurrency, get_supported_languages
+from src.utils.file_utils import read_input_file
+from src.core.novel_generator import NovelGenerator, OUTPUT_FILENAMES
+
+# 分发模式
+# - textualize: 每种目标语言用自己的第四层提示词从共享的场景列表生成正文
+# - translate: 枢纽语言生成一次正文，再逐场景翻译为各目标语言
+FANOUT_MODES = ("textualize", "translate")
+
+
+def _split_heading(text: str, fallback: str):
+    """拆出译文开头的 ## 标题，返回 (标题, 正文)"""
+    lines = text.strip().split("\n", 1)
+    if lines[0].startswith("##"):
+        return lines[0].lstrip("#").strip() or fallback, (lines[1] if len(lines) > 1 else "").strip()
+    return fallback, text.strip()
+
+
+def validate_languages(languages: List[str], pivot_language: str, mode: str = "textualize"):
+    """
+    检查目标语言：必须是支持的语言，且各语言的输出文件名互不相同（各语言并发写入同一输出目录）
+
+    Raises:
+        ValueError: 不支持的语言，或多种语言的输出文件名相同
+    """
+    supported = get_supported_languages()
+    unknown = [language for language in dict.fromkeys(languages) if language not in supported]
+    if unknown:
+        raise ValueError(f"不支持的语言: {', '.join(unknown)}，可选: {', '.join(supported)}")
+
+    # 翻译模式下枢纽语言也会输出正文
+    outputs = list(dict.fromkeys(languages + ([pivot_language] if mode == "translate" else [])))
+    filenames: Dict[str, str] = {}
+    for language in outputs:
+        filename = OUTPUT_FILENAMES.get(language, "Novel.txt")
+        if filename in filenames:
+            raise ValueError(f"语言 {filenames[filename]} 和 {language} 的输出文件名相同（{filename}），无法同时分发")
+        filenames[filename] = language
+
+
+def _translate_scene_names(target: NovelGenerator):
+    """一次调用翻译全部场景名称，用于目标语言版本的场景标题"""
+    names = [scene.get("name", "") for scene in target.scenes]
+    translated = target.translate_text("\n".join(f"## {name}" for name in names))
+    headings = [line.lstrip("#").strip() for line in translated.splitlines() if line.startswith("##")]
+    # 行数对不上时保留原名，避免标题错位
+    if len(headings) == len(names):
+        for scene, heading in zip(target.scenes, headings):
+            scene["name"] = heading
+
+
+def _translate_scenes(pivot: NovelGenerator, target: NovelGenerator):
+    """并发翻译枢纽语言的每个场景（场景标题随正文一起翻译）"""
+    def translate(scene: Dict):
+        scene_num = scene.get("number", 0)
+        source = f"## {scene.get('name', '')}\n\n{pivot.novel_texts[scene_num]}"
+        name, text = _split_heading(target.translate_text(source, scene_number=scene_num), scene.get("name", ""))
+        return scene, name, text
+
+    scenes = [scene for scene in target.scenes if scene.get("number", 0) in pivot.novel_texts]
+    with ThreadPoolExecutor(max_workers=get_fanout_concurrency()) as executor:
+        for scene, name, text in executor.map(translate, scenes):
+            scene["name"] = name
+            target.novel_texts[scene.get("number", 0)] = text
+
+
+def fan_out(pivot: NovelGenerator, languages: List[str], mode: str = "textualize") -> Dict[str, str]:
+    """
+    将已完成前三层的枢纽生成器分发到多种目标语言
+
+    每种目标语言使用独立的生成器、中间目录（<枢纽中间目录>/<语言>/）和按语言区分的输出文件名，
+    各语言之间并发运行。
+
+    Args:
+        pivot: 已运行前三层的枢纽语言生成器
+        languages: 目标语言列表（可包含枢纽语言本身）
+        mode: 分发模式，textualize 或 translate
+
+    Returns:
+        语言代码 -> 完整小说文本（分片输出时为None）
+    """
+    if mode not in FANOUT_MODES:
+        raise ValueError(f"不支持的分发模式 '{mode}'，可选: {', '.join(FANOUT_MODES)}")
+    validate_languages(languages, pivot.language, mode)
+
+    # 翻译模式需要先在枢纽语言中生成一次正文
+    novels = {}
+    if mode == "translate":
+        pivot.run_textualization()
+        novels[pivot.language] = pivot.finalize()
+    elif pivot.language not in languages:
+        pivot.save_run_metrics()
+
+    def run_target(language: str) -> str:
+        if language == pivot.language:
+            pivot.run_textualization()
+            return pivot.finalize()
+
+        target = NovelGenerator(language=language, intermediate_dir=str(Path(pivot.intermediate_dir) / language))
+        target.use_shared_upstream(pivot.world_setting, pivot.story_outline, source=f"pivot:{pivot.language}")
+        target.scenes = [dict(scene) for scene in pivot.scenes]
+
+        if mode == "translate":
+            _translate_scenes(pivot, target)
+        else:
+            _translate_scene_names(target)
+            target.run_textualization()
+
+        target.save_intermediate(json.dumps(target.scenes, ensure_ascii=False, indent=2),
+                                 target.intermediate_filename("scene_list"))
+        return target.finalize()
+
+    targets = [language for language in dict.fromkeys(languages) if language not in novels]
+    if targets:
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            novels.update(zip(targets, executor.map(run_target, targets)))
+
+    return novels
+
+
+def run_multilingual(input_path: str, languages: List[str], pivot_language: str = None,
+                     mode: str = "textualize") -> Dict[str, str]:
+    """
+    多语言模式：枢纽语言运行一次前三层，然后分发到各目标语言
+
+    Args:
+        input_path: 输入文件路径
+        languages: 目标语言列表
+        pivot_language: 枢纽语言，默认使用配置的语言
+        mode: 分发模式，textualize 或 translate
+
+    Returns:
+        语言代码 -> 完整小说文本（分片输出时为None）
+    """
+    pivot = NovelGenerator(language=pivot_language)
+    # 在运行前三层之前检查，避免无效的目标语言浪费调用
+    if mode not in FANOUT_MODES:
+        raise ValueError(f"不支持的分发模式 '{mode}'，可选: {', '.join(FANOUT_MODES)}")
+    validate_languages(languages, pivot.language, mode)
+    user_input = read_input_file(input_path)
+    print(f"{pivot.run_messages()['read_input']}{user_input[:100]}...")
+    pivot.run_upstream(user_input)
+    return fan_out(pivot, languages, mode)
@@ -1,46 +1,579 @@
 """小说生成核心模块 - 四层架构"""
+import difflib
 import json
 import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
 from typing import List, Dict, Optional
+from langchain_core.messages import AIMessage
 from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
 
-from src.utils.config import get_api_key, get_api_base_url, get_model_name, get_language
-from src.utils.file_utils import read_input_file, save_output_file, save_intermediate_file
-from src.prompts.prompt_loader import load_prompts
+from src.utils.config import (
+    get_api_key, get_api_base_url, get_model_name, get_language,
+    get_scene_candidates, get_candidate_mode,
+    is_cascade_enabled, get_draft_model_name, get_cascade_judge, get_cascade_thresholds,
+    get_prompt_layout, is_consistency_check_enabled, get_consistency_max_retries,
+    is_profiling_enabled, is_beat_parallel_enabled, get_beat_settings, get_beat_smoothing,
+    is_degeneration_detection_enabled, get_degeneration_action, get_degeneration_max_retries,
+    get_degeneration_thresholds, is_token_budget_enabled, get_token_budget_headroom, is_scheduler_enabled,
+    get_max_output_tokens,
+    is_world_sections_enabled, is_world_reconcile_enabled, get_run_history_path,
+    is_sharded_output_enabled, get_shard_scenes, is_monolithic_output_enabled,
+)
+from src.utils.file_utils import (
+    read_input_file, save_output_file, save_intermediate_file, read_intermediate_file,
+)
+from src.prompts.prompt_loader import load_compiled_prompts
+from src.core.scene_scorer import (
+    score_scene_text, scene_complexity, TARGET_MIN_LENGTH, TARGET_MAX_LENGTH,
+)
+from src.core.metrics import RunMetrics, extract_usage, estimate_cost, append_run_history
+from src.core.consistency_checker import ConsistencyChecker, ConsistencyIssue
+from src.core.profiler import PipelineProfiler
+from src.core.degeneration import DegenerationDetector
+from src.core.token_budget import (
+    layer_budget, scene_budget, text_budget, output_ceiling, trim_truncated, estimate_tokens, estimate_output_tokens,
+)
+from src.core.scheduler import get_scheduler
+from src.core.sharded_output import ShardedNovel
+
+
+# 第一至三层：调度器中的优先级高于第四层（它们阻塞整部小说的后续流程）
+UPSTREAM_LAYERS = ("world_building", "story_layer", "scene_decomposition")
+
+# 世界设定各部分的标题行（## 开头，不含更深的标题）及其编号
+_SECTION_HEADING_RE = re.compile(r"^##\s*(\d+)?")
+
+# 中间文件名：类型 -> (语言 -> 文件名, 默认文件名)
+INTERMEDIATE_FILENAMES = {
+    "world_setting": ({
+        "zh": "01_世界设定.txt",
+        "en": "01_World_Setting.txt",
+        "ja": "01_世界設定.txt"
+    }, "01_World_Setting.txt"),
+    "world_premise": ({
+        "zh": "01_核心前提.txt",
+        "en": "01_Core_Premise.txt",
+        "ja": "01_核心前提.txt"
+    }, "01_Core_Premise.txt"),
+    "story_outline": ({
+        "zh": "02_故事大纲与人物弧光.txt",
+        "en": "02_Story_Outline_Character_Arc.txt",
+        "ja": "02_物語概要_キャラクターアーク.txt"
+    }, "02_Story_Outline.txt"),
+    "scene_decomposition": ({
+        "zh": "03_场景分解.txt",
+        "en": "03_Scene_Decomposition.txt",
+        "ja": "03_シーン分解.txt"
+    }, "03_Scene_Decomposition.txt"),
+    "scene_list": ({
+        "zh": "03_场景列表.json",
+    }, "03_Scene_List.json"),
+}
+
+# 运行过程的提示信息：语言 -> 信息键 -> 文本
+RUN_MESSAGES = {
+    "zh": {
+        "read_input": "已读取输入需求：",
+        "layer1": "🏗️ 第一层：正在生成世界设定...",
+        "layer1_saved": "世界设定已保存",
+        "layer1_shared": "使用共享世界设定 {source}，跳过第一层",
+        "layer2": "📖 第二层：正在生成故事大纲与人物弧光...",
+        "layer2_saved": "故事大纲已保存",
+        "layer2_shared": "使用共享故事大纲 {source}，跳过第二层",
+        "layer3": "🎬 第三层：正在分解场景...",
+        "layer3_saved": "场景分解完成，共 {count} 个场景",
+        "layer4": "✍️ 第四层：正在生成场景文字...",
+        "layer4_progress": "  场景 {num}/{total}：{name}",
+        "layer4_complete": "所有场景文字生成完成",
+        "assembling": "正在组装完整小说...",
+        "novel_saved": "小说已保存到 ",
+        "shards_saved": "正文分片已保存到 ",
+        "cascade_report": "级联模式：{refined}/{total} 个场景由强模型重写，成本节省 {cost_saving}，耗时节省 {latency_saving}",
+        "consistency_report": "一致性检查：{flagged}/{total} 个场景被标记，重新生成 {regenerated} 次，仍未通过 {unresolved} 个",
+        "metrics_saved": "调用指标已保存到 ",
+        "profile_saved": "性能分析：总耗时 {wall:.1f}s，等待LLM {llm_wait:.1f}s，本地处理 {local:.1f}s，报告已保存到 {path}",
+        "cache_hit_rate": "第四层前缀缓存命中率：{rate}（{cached}/{total} 输入token）",
+        "batch_upstream": "📦 批处理任务 {job}：正在准备前三层...",
+        "batch_resumed": "已从中间文件恢复前三层",
+        "batch_submitted": "已提交批处理任务 {batch_id}，共 {count} 个场景请求",
+        "batch_status": "批处理任务 {batch_id} 状态：{status}",
+        "batch_ingested": "已导入 {count} 个场景结果"
+    },
+    "en": {
+        "read_input": "Input requirements read: ",
+        "layer1": "🏗️ Layer 1: Generating world setting...",
+        "layer1_saved": "World setting saved",
+        "layer1_shared": "Using shared world setting {source}, skipping Layer 1",
+        "layer2": "📖 Layer 2: Generating story outline and character arcs...",
+        "layer2_saved": "Story outline saved",
+        "layer2_shared": "Using shared story outline {source}, skipping Layer 2",
+        "layer3": "🎬 Layer 3: Decomposing scenes...",
+        "layer3_saved": "Scene decomposition complete, {count} scenes total",
+        "layer4": "✍️ Layer 4: Generating scene texts...",
+        "layer4_progress": "  Scene {num}/{total}: {name}",
+        "layer4_complete": "All scene texts generated",
+        "assembling": "Assembling complete novel...",
+        "novel_saved": "Novel saved to ",
+        "shards_saved": "Novel shards saved to ",
+        "cascade_report": "Cascade mode: {refined}/{total} scenes rewritten by the strong model, cost saving {cost_saving}, latency saving {latency_saving}",
+        "consistency_report": "Consistency check: {flagged}/{total} scenes flagged, {regenerated} regenerations, {unresolved} still failing",
+        "metrics_saved": "Call metrics saved to ",
+        "profile_saved": "Profile: {wall:.1f}s total, {llm_wait:.1f}s waiting for the LLM, {local:.1f}s local work, report saved to {path}",
+        "cache_hit_rate": "Layer 4 prefix cache hit rate: {rate} ({cached}/{total} input tokens)",
+        "batch_upstream": "📦 Batch job {job}: preparing layers 1-3...",
+        "batch_resumed": "Layers 1-3 restored from intermediate files",
+        "batch_submitted": "Batch {batch_id} submitted with {count} scene requests",
+        "batch_status": "Batch {batch_id} status: {status}",
+        "batch_ingested": "{count} scene results ingested"
+    },
+    "ja": {
+        "read_input": "入力要件を読み取りました：",
+        "layer1": "🏗️ 第1層：世界設定を生成中...",
+        "layer1_saved": "世界設定が保存されました",
+        "layer1_shared": "共有世界設定 {source} を使用し、第1層をスキップします",
+        "layer2": "📖 第2層：物語概要とキャラクターアークを生成中...",
+        "layer2_saved": "物語概要が保存されました",
+        "layer2_shared": "共有物語概要 {source} を使用し、第2層をスキップします",
+        "layer3": "🎬 第3層：シーンを分解中...",
+        "layer3_saved": "シーン分解が完了しました、合計 {count} シーン",
+        "layer4": "✍️ 第4層：シーンテキストを生成中...",
+        "layer4_progress": "  シーン {num}/{total}：{name}",
+        "layer4_complete": "すべてのシーンテキストが生成されました",
+        "assembling": "完全な小説を組み立て中...",
+        "novel_saved": "小説が ",
+        "shards_saved": "本文の分割ファイルの保存先：",
+        "cascade_report": "カスケードモード：{refined}/{total} シーンを強力なモデルで書き直し、コスト削減 {cost_saving}、所要時間削減 {latency_saving}",
+        "consistency_report": "整合性チェック：{flagged}/{total} シーンが検出され、{regenerated} 回再生成、未解決 {unresolved} シーン",
+        "metrics_saved": "呼び出し指標が保存されました：",
+        "profile_saved": "プロファイル：合計 {wall:.1f}秒、LLM待ち {llm_wait:.1f}秒、ローカル処理 {local:.1f}秒、レポートの保存先 {path}",
+        "cache_hit_rate": "第4層プレフィックスキャッシュヒット率：{rate}（{cached}/{total} 入力トークン）",
+        "batch_upstream": "📦 バッチジョブ {job}：第1〜3層を準備中...",
+        "batch_resumed": "中間ファイルから第1〜3層を復元しました",
+        "batch_submitted": "バッチ {batch_id} を送信しました、シーンリクエスト {count} 件",
+        "batch_status": "バッチ {batch_id} の状態：{status}",
+        "batch_ingested": "{count} シーンの結果を取り込みました"
+    }
+}
+
+# 分段并行：首段和末段没有相邻段落时使用的衔接提示（场景开头, 场景结尾）
+BEAT_BOUNDARIES = {
+    "zh": ("场景开头", "场景结尾"),
+    "en": ("the start of the scene", "the end of the scene"),
+    "ja": ("シーンの冒頭", "シーンの終わり"),
+}
+
+# 拆分"关键对话/动作"字段中的各个元素：分号、箭头，以及条目开头的编号（不在句末标点处拆分）
+_BEAT_SEPARATOR_RE = re.compile(r"[；;]|->|→")
+# 条目编号（1. / 2、 / (3) 等），后面紧跟数字的是小数，不是编号
+_BEAT_NUMBER_RE = re.compile(r"\(?\d+[.、)）](?!\d)")
+# 引号内的分隔符属于对话内容，不拆分
+_QUOTE_PAIRS = {"“": "”", "「": "」", "『": "』", '"': '"'}
+
+# 本地润色时，拼接处前后两段的相似度超过该值则视为重复
+_SEAM_DUPLICATE_RATIO = 0.6
+
+
+def split_prompt_sections(template_text: str) -> List[str]:
+    """从提示词中提取各部分的要求（## 标题及其后的要点，遇到空行结束）"""
+    sections: List[List[str]] = []
+    current = None
+    for line in template_text.splitlines():
+        if line.startswith("## "):
+            current = [line]
+            sections.append(current)
+        elif current is not None and line.strip():
+            current.append(line)
+        else:
+            current = None
+    return ["\n".join(section) for section in sections]
+
+
+def _split_beat_items(text: str, track_quotes: bool = True) -> List[str]:
+    """按分隔符和条目编号拆分关键元素，引号内的内容不拆分"""
+    items = []
+    closing: List[str] = []  # 尚未闭合的引号
+    start = i = 0
+    while i < len(text):
+        char = text[i]
+        if track_quotes and closing and char == closing[-1]:
+            closing.pop()
+        elif track_quotes and char in _QUOTE_PAIRS:
+            closing.append(_QUOTE_PAIRS[char])
+        elif not closing:
+            match = _BEAT_SEPARATOR_RE.match(text, i)
+            # 编号只在文本开头、空白或分隔符之后出现时才视为新条目
+            if not match and (i == 0 or text[i - 1].isspace() or text[i - 1] in "；;→>"):
+                match = _BEAT_NUMBER_RE.match(text, i)
+            if match:
+                items.append(text[start:i])
+                start = i = match.end()
+                continue
+        i += 1
+    if closing:
+        # 引号不成对时无法判断对话的范围，按分隔符拆分
+        return _split_beat_items(text, track_quotes=False)
+    items.append(text[start:])
+    return items
+
+
+def split_scene_beats(scene: Dict, language: str, min_complexity: int, max_count: int) -> List[str]:
+    """
+    将复杂场景的关键对话/动作拆分为段落
+    
+    Returns:
+        段落列表；场景不够复杂或关键元素少于两个时返回空列表
+    """
+    if scene_complexity(scene) < min_complexity:
+        return []
+    items = [item.strip(" -*。.") for item in _split_beat_items(scene.get("key_beats", ""))]
+    items = [item for item in items if item]
+    if len(items) < 2:
+        return []
+    
+    # 关键元素多于最多段落数时，相邻元素合并为一段
+    size = -(-len(items) // max_count)
+    separator = "; " if language == "en" else "；"
+    return [separator.join(items[i:i + size]) for i in range(0, len(items), size)]
+
+
+# 输出文件名：语言 -> 文件名
+OUTPUT_FILENAMES = {
+    "zh": "小说正文.txt",
+    "en": "Novel.txt",
+    "ja": "小説本文.txt"
+}
 
 
 class NovelGenerator:
     """四层架构小说生成器"""
     
-    def __init__(self, language: str = None):
+    def __init__(self, language: str = None, intermediate_dir: str = "intermediate", profile: bool = None,
+                 tenant: str = None):
         """
         初始化小说生成器
         
         Args:
             language: 语言代码 (zh, en, ja等)，如果为None则使用配置的语言
+            intermediate_dir: 中间文件目录
+            profile: 是否按层记录性能数据，如果为None则使用配置（PROFILE）
+            tenant: 调度器中的租户名称，默认为中间文件目录（每个任务独立）
         """
-        api_key = get_api_key()
-        api_base = get_api_base_url()
-        model_name = get_model_name()
+        self.model_name = get_model_name()
+        self.llm = self._create_llm(self.model_name)
         
-        self.llm = ChatOpenAI(
-            openai_api_key=api_key,
-            base_url=api_base,
-            model=model_name,
-            temperature=0.8,  # 提高创造性
-        )
+        # 记录所有LLM调用的token、耗时和成本
+        self.metrics = RunMetrics()
         
         # 加载对应语言的提示词
         self.language = language if language else get_language()
-        self.prompts = load_prompts(self.language)
+        self.prompt_set = load_compiled_prompts(self.language)
+        self.prompt_layout = get_prompt_layout()
         print(f"已加载语言: {self.language}")
+        self.intermediate_dir = intermediate_dir
         
         # 存储各层生成的数据
         self.world_setting: Optional[str] = None
         self.story_outline: Optional[str] = None
         self.scenes: List[Dict] = []
         self.novel_texts: Dict[int, str] = {}  # 场景编号 -> 文字内容
+        
+        # 系列模式：共享的世界设定（和故事大纲）来源，为None时所有层都重新生成
+        self.shared_upstream: Optional[str] = None
+        self.shared_layers: List[str] = []
+        
+        # 多候选场景生成配置
+        self.num_candidates = get_scene_candidates()
+        self.candidate_mode = get_candidate_mode()
+        self.scene_candidates: Dict[int, List[Dict]] = {}  # 场景编号 -> 全部候选及评分
+        
+        # 级联模式：低成本模型起草，复杂或质量不足的场景再由强模型重写
+        self.cascade = is_cascade_enabled()
+        self.cascade_judge = get_cascade_judge()
+        self.cascade_decisions: Dict[int, Dict] = {}  # 场景编号 -> 是否精修及原因
+        
+        # 分段并行：复杂场景按关键对话/动作拆分为多个段落并发生成，再润色拼接处
+        self.beat_parallel = is_beat_parallel_enabled()
+        self.beat_min_complexity, self.beat_max_count = get_beat_settings()
+        self.beat_smoothing = get_beat_smoothing()
+        self.scene_beats: Dict[int, Dict] = {}  # 场景编号 -> 段落划分
+        
+        # 分部并行的世界构建：核心前提之后并发生成第一层的各个部分，再由低成本模型校对一致性
+        self.world_sections = is_world_sections_enabled()
+        self.world_reconcile = is_world_reconcile_enabled()
+        self.world_section_report: Optional[Dict] = None
+        
+        # 级联模式、分段拼接处的模型润色和世界设定的一致性校对使用低成本模型
+        if (self.cascade or (self.beat_parallel and self.beat_smoothing == "llm")
+                or (self.world_sections and self.world_reconcile)):
+            self.draft_model_name = get_draft_model_name()
+            self.draft_llm = self._create_llm(self.draft_model_name)
+        
+        # 本地一致性检查：根据世界设定的实体词典检查场景文字，未通过的场景自动重新生成
+        self.consistency_check = is_consistency_check_enabled()
+        self.consistency_max_retries = get_consistency_max_retries()
+        self.consistency_reports: Dict[int, Dict] = {}  # 场景编号 -> 检查结果
+        self._consistency_checker: Optional[ConsistencyChecker] = None
+        
+        # 退化检测：流式调用LLM，出现重复、语言漂移或超长时提前中止
+        self.degeneration_detection = is_degeneration_detection_enabled()
+        self.degeneration_action = get_degeneration_action()
+        self.degeneration_max_retries = get_degeneration_max_retries()
+        self.degeneration_thresholds = get_degeneration_thresholds()
+        
+        # 输出token预算：按层和场景复杂度设置 max_tokens，被截断的输出回退到完整的句子
+        self.token_budget = is_token_budget_enabled()
+        self.token_budget_headroom = get_token_budget_headroom()
+        self.max_output_tokens = get_max_output_tokens()
+        
+        # 性能分析：报告和CPU剖析文件保存在中间目录的 profile/ 子目录中
+        if profile is None:
+            profile = is_profiling_enabled()
+        self.profiler = PipelineProfiler(f"{intermediate_dir}/profile") if profile else None
+        
+        # 调度器：进程内所有生成器的LLM调用按优先级和租户加权公平排队
+        self.scheduler = get_scheduler() if is_scheduler_enabled() else None
+        self.tenant = tenant or intermediate_dir
+        self._interactive = 0  # 大于0时（交互式重新生成场景）调用使用最高优先级
+        
+        # 分片输出：正文按场景分片保存并建立字节偏移索引，完整正文由分片流式拼接
+        self.sharded_output = is_sharded_output_enabled()
+        self.shard_scenes = get_shard_scenes()
+        self.monolithic_output = is_monolithic_output_enabled()
+        self.output_path: Optional[str] = None
+    
+    def intermediate_filename(self, kind: str) -> str:
+        """获取当前语言下指定类型中间文件的文件名"""
+        filename_map, default = INTERMEDIATE_FILENAMES[kind]
+        return filename_map.get(self.language, default)
+    
+    def save_intermediate(self, content: str, filename: str) -> str:
+        """保存中间文件到本生成器的中间目录"""
+        return save_intermediate_file(content, filename, self.intermediate_dir)
+    
+    def default_output_path(self) -> str:
+        """根据语言获取默认输出文件路径"""
+        return f"output/{OUTPUT_FILENAMES.get(self.language, 'Novel.txt')}"
+    
+    def sharded_novel(self, output_path: str = None) -> ShardedNovel:
+        """输出文件对应的分片目录（例如 output/小说正文.shards/）"""
+        output_path = output_path or self.output_path or self.default_output_path()
+        return ShardedNovel(str(Path(output_path).with_suffix(".shards")), self.shard_scenes)
+    
+    def load_intermediate(self) -> bool:
+        """
+        从中间文件恢复前三层的结果（用于断点续跑）
+        
+        Returns:
+            是否成功恢复了世界设定、故事大纲和场景列表
+        """
+        world_setting = read_intermediate_file(self.intermediate_filename("world_setting"), self.intermediate_dir)
+        story_outline = read_intermediate_file(self.intermediate_filename("story_outline"), self.intermediate_dir)
+        scene_list = read_intermediate_file(self.intermediate_filename("scene_list"), self.intermediate_dir)
+        if world_setting is None or story_outline is None or scene_list is None:
+            return False
+        
+        self.world_setting = world_setting
+        self.story_outline = story_outline
+        self.scenes = json.loads(scene_list)
+        return True
+    
+    def use_shared_upstream(self, world_setting: str, story_outline: str = None, source: str = None):
+        """
+        使用共享的世界设定（和故事大纲），运行时跳过对应的层
+        
+        共享内容会复制一份到本生成器的中间目录，便于断点续跑，但不会写回共享来源。
+        
+        Args:
+            world_setting: 共享的世界设定
+            story_outline: 共享的故事大纲，为None时仍生成第二层
+            source: 共享来源的描述（如 系列名@版本），记录到运行指标中
+        """
+        self.world_setting = world_setting
+        self.save_intermediate(world_setting, self.intermediate_filename("world_setting"))
+        self.shared_layers = ["world_building"]
+        if story_outline is not None:
+            self.story_outline = story_outline
+            self.save_intermediate(story_outline, self.intermediate_filename("story_outline"))
+            self.shared_layers.append("story_layer")
+        self.shared_upstream = source or "shared"
+    
+    @staticmethod
+    def _create_llm(model_name: str) -> ChatOpenAI:
+        """按模型名称创建LLM客户端"""
+        return ChatOpenAI(
+            openai_api_key=get_api_key(),
+            base_url=get_api_base_url(),
+            model=model_name,
+            temperature=0.8,  # 提高创造性
+        )
+    
+    def _profile(self, section: str):
+        """性能分析模式下记录一个阶段，否则不做任何事"""
+        return self.profiler.section(section) if self.profiler else nullcontext()
+    
+    def _awaiting_llm(self):
+        """性能分析模式下把包裹的时间计为等待LLM"""
+        return self.profiler.llm_wait() if self.profiler else nullcontext()
+    
+    def _call_priority(self, layer: str) -> str:
+        """调度器中的优先级类别：交互式重新生成 > 第一至三层 > 第四层"""
+        if self._interactive:
+            return "interactive"
+        return "normal" if layer in UPSTREAM_LAYERS else "batch"
+    
+    def _llm_slot(self, layer: str, messages, call_kwargs: Dict, n: int = 1):
+        """
+        启用调度器时排队等待一个调用名额，否则不做任何事
+        
+        排队时按输入和 max_tokens 预估token数，决定该调用在租户份额中的占用。
+        """
+        if not self.scheduler:
+            return nullcontext()
+        cost = sum(estimate_tokens(str(message.content)) for message in messages) + call_kwargs.get("max_tokens", 0)
+        return self.scheduler.slot(self.tenant, self._call_priority(layer), cost * n)
+    
+    @staticmethod
+    def _charge(ticket, usage: Dict[str, int], extra: Dict) -> Dict:
+        """向调度器记录实际用量，并把排队等待时间加入指标"""
+        if ticket is None:
+            return extra
+        ticket.charge(usage)
+        return {**extra, "queue_wait": round(ticket.wait, 3)}
+    
+    def scene_budget(self, scene: Dict, parts: int = 1) -> Optional[int]:
+        """场景（或其中一个段落）的 max_tokens，未启用输出预算时返回None"""
+        if not self.token_budget:
+            return None
+        return scene_budget(scene, self.language, self.token_budget_headroom, parts)
+    
+    def layer_budget(self, layer: str, parts: int = 1) -> Optional[int]:
+        """某一层（或其中一个并行部分）的 max_tokens，未启用输出预算时返回None"""
+        if not self.token_budget:
+            return None
+        return layer_budget(layer, self.language, self.token_budget_headroom, parts)
+    
+    def text_budget(self, source_text: str) -> Optional[int]:
+        """改写类调用（翻译、润色）的 max_tokens，未启用输出预算时返回None"""
+        return text_budget(source_text, self.token_budget_headroom) if self.token_budget else None
+    
+    def clamp_budget(self, max_tokens: Optional[int], messages, model_name: str = None) -> Optional[int]:
+        """把 max_tokens 限制在模型的输出上限和剩余的上下文窗口之内"""
+        if not max_tokens:
+            return max_tokens
+        input_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        return min(max_tokens, output_ceiling(model_name or self.model_name, input_tokens, self.max_output_tokens))
+    
+    def _call_kwargs(self, layer: str, max_tokens: Optional[int], messages, model_name: str = None) -> Dict:
+        """LLM调用参数：未指定 max_tokens 时使用该层的默认预算，并限制在模型的上限之内"""
+        if not self.token_budget:
+            return {}
+        max_tokens = max_tokens or layer_budget(layer, self.language, self.token_budget_headroom)
+        max_tokens = self.clamp_budget(max_tokens, messages, model_name)
+        return {"max_tokens": max_tokens} if max_tokens else {}
+    
+    @staticmethod
+    def _finish_reason(message) -> Optional[str]:
+        return (getattr(message, "response_metadata", None) or {}).get("finish_reason")
+    
+    def _handle_truncation(self, response, layer: str, extra: Dict) -> Dict:
+        """输出因 max_tokens 被截断时回退到最后一个完整的句子，并在指标中标记"""
+        if self._finish_reason(response) != "length":
+            return extra
+        response.content = trim_truncated(response.content)
+        print(f"警告: {layer} 的输出达到 max_tokens 上限被截断，已回退到最后一个完整的句子")
+        return {**extra, "truncated": True}
+    
+    def _invoke(self, messages, layer: str, llm: ChatOpenAI = None, model_name: str = None,
+                scene_number: int = None, target_length: int = None, max_tokens: int = None, **extra):
+        """
+        调用LLM并记录token用量、耗时和成本
+        
+        Args:
+            messages: 提示词消息列表
+            layer: 所属层级名称
+            llm: 使用的LLM，默认为主模型
+            model_name: 模型名称（用于计费），默认为主模型名称
+            scene_number: 场景编号（仅第四层）
+            target_length: 提示词要求的最大长度（用于退化检测中的超长判断）
+            max_tokens: 输出token预算，默认使用该层的预算（未启用输出预算时忽略）
+            **extra: 记录到指标中的附加信息
+            
+        Returns:
+            LLM的响应消息
+        """
+        llm = llm or self.llm
+        model_name = model_name or self.model_name
+        call_kwargs = self._call_kwargs(layer, max_tokens, messages, model_name)
+        if self.degeneration_detection:
+            return self._invoke_streaming(messages, layer, llm, model_name, scene_number, target_length,
+                                          call_kwargs, **extra)
+        
+        with self._awaiting_llm(), self._llm_slot(layer, messages, call_kwargs) as ticket:
+            start = time.perf_counter()
+            response = llm.invoke(messages, **call_kwargs)
+            latency = time.perf_counter() - start
+            usage = extract_usage(response)
+            extra = self._charge(ticket, usage, extra)
+        
+        extra = self._handle_truncation(response, layer, extra)
+        self.metrics.record(layer, model_name, usage, latency, scene_number=scene_number, **extra)
+        return response
+    
+    def _invoke_streaming(self, messages, layer: str, llm: ChatOpenAI, model_name: str,
+                          scene_number: Optional[int], target_length: Optional[int], call_kwargs: Dict, **extra):
+        """
+        流式调用LLM，并在输出流上在线检测退化，检测到时立即中止（不再为后续token付费）
+        
+        retry 模式下重新生成；重试次数用尽或 continue 模式下，保留退化开始之前的内容。
+        """
+        attempts = self.degeneration_max_retries + 1 if self.degeneration_action == "retry" else 1
+        for attempt in range(attempts):
+            detector = DegenerationDetector(self.language, target_length, *self.degeneration_thresholds)
+            response = None
+            
+            with self._awaiting_llm(), self._llm_slot(layer, messages, call_kwargs) as ticket:
+                start = time.perf_counter()
+                stream = llm.stream(messages, stream_usage=True, **call_kwargs)
+                try:
+                    for chunk in stream:
+                        response = chunk if response is None else response + chunk
+                        if detector.feed(chunk.content):
+                            break
+                finally:
+                    # 关闭流会断开连接，服务端随之停止生成
+                    stream.close()
+                latency = time.perf_counter() - start
+                
+                usage = extract_usage(response) if response is not None else {}
+                call_extra = dict(extra)
+                # 提前中止的流没有返回用量，按已生成的内容估算
+                if detector.reason and not usage.get("output_tokens"):
+                    usage = {
+                        "input_tokens": sum(estimate_tokens(str(message.content)) for message in messages),
+                        "output_tokens": estimate_output_tokens(detector.text, self.language),
+                        "cached_tokens": 0,
+                    }
+                    call_extra["estimated_usage"] = True
+                call_extra = self._charge(ticket, usage, call_extra)
+            
+            if not detector.reason:
+                # 服务端没有返回任何内容时按空回复处理
+                if response is None:
+                    response = AIMessage(content="")
+                    print(f"警告: {layer} 的流式调用没有返回任何内容")
+                call_extra = self._handle_truncation(response, layer, call_extra)
+                self.metrics.record(layer, model_name, usage, latency, scene_number=scene_number, **call_extra)
+                return response
+            
+            call_extra.update(aborted=detector.reason, attempt=attempt + 1)
+            self.metrics.record(layer, model_name, usage, latency, scene_number=scene_number, **call_extra)
+            print(f"警告: {layer} 的输出出现退化（{detector.reason}），已在长度 {detector.length} 处提前中止")
+        
+        return AIMessage(content=detector.clean_text())
     
     def generate_world_building(self, user_input: str) -> str:
         """
@@ -52,24 +585,89 @@ class NovelGenerator:
         Returns:
             世界设定内容
         """
-        prompt = ChatPromptTemplate.from_template(self.prompts.world_building)
-        messages = prompt.format_messages(user_input=user_input)
-        
-        response = self.llm.invoke(messages)
-        world_content = response.content
+        sections = self._world_section_specs() if self.world_sections else []
+        if len(sections) > 1:
+            world_content = self._generate_world_sections(user_input, sections)
+        else:
+            prompt = self.prompt_set.template("world_building")
+            messages = prompt.format_messages(user_input=user_input)
+            
+            response = self._invoke(messages, "world_building")
+            world_content = response.content
         
         # 保存世界设定
-        filename_map = {
-            "zh": "01_世界设定.txt",
-            "en": "01_World_Setting.txt",
-            "ja": "01_世界設定.txt"
-        }
-        filename = filename_map.get(self.language, "01_World_Setting.txt")
-        save_intermediate_file(world_content, filename)
+        self.save_intermediate(world_content, self.intermediate_filename("world_setting"))
         self.world_setting = world_content
         
         return world_content
     
+    def _world_section_specs(self) -> List[str]:
+        """第一层提示词中各部分的要求"""
+        return split_prompt_sections(self.prompt_set.text("world_building"))
+    
+    @staticmethod
+    def _section_key(heading: str) -> str:
+        """部分的标识：标题中的编号，没有编号时为整行标题"""
+        match = _SECTION_HEADING_RE.match(heading)
+        return match.group(1) if match and match.group(1) else heading.strip()
+    
+    def _split_sections(self, text: str) -> Dict[str, str]:
+        """把文本按 ## 标题拆分为 部分标识 -> 内容（含标题行）"""
+        sections: Dict[str, List[str]] = {}
+        current = None
+        for line in text.splitlines():
+            if line.startswith("## "):
+                current = sections.setdefault(self._section_key(line), [])
+            if current is not None:
+                current.append(line)
+        return {key: "\n".join(lines).strip() for key, lines in sections.items()}
+    
+    def _generate_world_sections(self, user_input: str, sections: List[str]) -> str:
+        """
+        分部并行的世界构建：先生成简短的核心前提，再基于前提并发生成各部分，
+        按提示词中的顺序合并为与单次生成相同格式的世界设定，最后由低成本模型校对各部分之间的一致性
+        """
+        premise_messages = self.prompt_set.template("world_premise").format_messages(user_input=user_input)
+        premise = self._invoke(premise_messages, "world_building", max_tokens=self.layer_budget("world_premise"),
+                               stage="premise").content.strip()
+        self.save_intermediate(premise, self.intermediate_filename("world_premise"))
+        
+        section_prompt = self.prompt_set.template("world_section")
+        max_tokens = self.layer_budget("world_building", len(sections))
+        
+        def write_section(i: int) -> str:
+            messages = section_prompt.format_messages(user_input=user_input, world_premise=premise,
+                                                      section=sections[i])
+            text = self._invoke(messages, "world_building", max_tokens=max_tokens,
+                                stage="section", section=i + 1).content.strip()
+            # 只保留本部分：去掉标题之前的说明和误写的其他部分，缺少标题时补上
+            key = self._section_key(sections[i].splitlines()[0])
+            return self._split_sections(text).get(key) or f"{sections[i].splitlines()[0]}\n{text}"
+        
+        with ThreadPoolExecutor(max_workers=len(sections)) as executor:
+            texts = list(executor.map(write_section, range(len(sections))))
+        
+        revised = []
+        if self.world_reconcile:
+            texts, revised = self._reconcile_world_sections(texts)
+        self.world_section_report = {"sections": len(sections), "revised_sections": revised}
+        return "\n\n".join(texts)
+    
+    def _reconcile_world_sections(self, texts: List[str]):
+        """
+        由低成本模型检查各部分之间的矛盾，用其输出的修改版本替换对应的部分
+        
+        Returns:
+            (校对后的各部分, 被修改的部分标识列表)
+        """
+        messages = self.prompt_set.template("world_reconcile").format_messages(world_setting="\n\n".join(texts))
+        verdict = self._invoke(messages, "world_building", llm=self.draft_llm, model_name=self.draft_model_name,
+                               max_tokens=self.layer_budget("world_reconcile"), stage="reconcile").content
+        revisions = self._split_sections(verdict)
+        keys = [self._section_key(text.splitlines()[0]) for text in texts]
+        revised = [key for key in keys if revisions.get(key)]
+        return [revisions.get(key) or text for key, text in zip(keys, texts)], revised
+    
     def generate_story_layer(self, user_input: str, world_setting: str) -> str:
         """
         第二层：生成故事层（Plot & Character Arc）
@@ -81,23 +679,17 @@ class NovelGenerator:
         Returns:
             故事大纲和人物弧光内容
         """
-        prompt = ChatPromptTemplate.from_template(self.prompts.story_layer)
+        prompt = self.prompt_set.template("story_layer")
         messages = prompt.format_messages(
             world_setting=world_setting,
             user_input=user_input
         )
         
-        response = self.llm.invoke(messages)
+        response = self._invoke(messages, "story_layer")
         story_content = response.content
         
         # 保存故事大纲
-        filename_map = {
-            "zh": "02_故事大纲与人物弧光.txt",
-            "en": "02_Story_Outline_Character_Arc.txt",
-            "ja": "02_物語概要_キャラクターアーク.txt"
-        }
-        filename = filename_map.get(self.language, "02_Story_Outline.txt")
-        save_intermediate_file(story_content, filename)
+        self.save_intermediate(story_content, self.intermediate_filename("story_outline"))
         self.story_outline = story_content
         
         return story_content
@@ -113,31 +705,36 @@ class NovelGenerator:
         Returns:
             场景列表，每个场景是一个字典
         """
-        prompt = ChatPromptTemplate.from_template(self.prompts.scene_decomposition)
+        prompt = self.prompt_set.template("scene_decomposition")
         messages = prompt.format_messages(
             world_setting=world_setting,
             story_outline=story_outline
         )
         
-        response = self.llm.invoke(messages)
+        response = self._invoke(messages, "scene_decomposition")
+        if self._finish_reason(response) == "length":
+            # 场景列表被截断会静默丢失后面的场景：以模型允许的最大输出重试一次，仍被截断则报错
+            budget = self._call_kwargs("scene_decomposition", None, messages).get("max_tokens")
+            input_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+            ceiling = output_ceiling(self.model_name, input_tokens, self.max_output_tokens)
+            if budget and ceiling > budget:
+                print(f"警告: 场景分解达到 max_tokens 上限（{budget}），以 {ceiling} 重新生成")
+                response = self._invoke(messages, "scene_decomposition", max_tokens=ceiling, retry="truncated")
+            if self._finish_reason(response) == "length":
+                raise RuntimeError(f"场景分解的输出超过模型的输出上限（{ceiling} tokens）被截断，"
+                                   f"请调大 MAX_OUTPUT_TOKENS、减少场景数量或设置 TOKEN_BUDGET=false")
         scenes_content = response.content
         
         # 保存场景分解
-        filename_map = {
-            "zh": "03_场景分解.txt",
-            "en": "03_Scene_Decomposition.txt",
-            "ja": "03_シーン分解.txt"
-        }
-        filename = filename_map.get(self.language, "03_Scene_Decomposition.txt")
-        save_intermediate_file(scenes_content, filename)
+        self.save_intermediate(scenes_content, self.intermediate_filename("scene_decomposition"))
         
         # 解析场景列表（简单解析，可以根据需要改进）
         scenes = self._parse_scenes(scenes_content)
         self.scenes = scenes
         
         # 保存场景的JSON格式（便于后续修改）
-        scenes_json_filename = "03_场景列表.json" if self.language == "zh" else "03_Scene_List.json"
-        save_intermediate_file(json.dumps(scenes, ensure_ascii=False, indent=2), scenes_json_filename)
+        self.save_intermediate(json.dumps(scenes, ensure_ascii=False, indent=2),
+                                self.intermediate_filename("scene_list"))
         
         return scenes
     
@@ -154,8 +751,8 @@ class NovelGenerator:
         scenes = []
         
         # 使用正则表达式匹配场景
-        # 匹配 "### 场景 [编号]：[场景名称]" 或类似格式
-        scene_pattern = r'(?:###|##|#)\s*场景?\s*\[?(\d+)\]?:?\s*([^\n]+)'
+        # 匹配 "### 场景 [编号]：[场景名称]"、"### Scene [Number]: [Name]"、"### シーン [番号]：[名前]" 或类似格式
+        scene_pattern = r'(?:###|##|#)\s*(?:场景?|Scene|シーン)\s*\[?(\d+)\]?[:：]?\s*([^\n]+)'
         matches = list(re.finditer(scene_pattern, scenes_content, re.IGNORECASE))
         
         for i, match in enumerate(matches):
@@ -177,6 +774,11 @@ class NovelGenerator:
                 "goal": self._extract_field(scene_text, ["目标", "Goal", "目標"]),
                 "conflict": self._extract_field(scene_text, ["冲突", "Conflict", "対立"]),
                 "emotional_tone": self._extract_field(scene_text, ["情感基调", "Emotional Tone", "感情的基調"]),
+                "connection": self._extract_field(scene_text, ["与前后场景的连接", "与前后场景的衔接",
+                                                               "Connection to Previous/Next Scenes",
+                                                               "前後のシーンとの接続"]),
+                "key_beats": self._extract_field(scene_text, ["关键对话/动作", "Key Dialogue/Actions",
+                                                              "重要な会話/行動"]),
             }
             scenes.append(scene_dict)
         
@@ -191,6 +793,8 @@ class NovelGenerator:
                 "goal": "",
                 "conflict": "",
                 "emotional_tone": "",
+                "connection": "",
+                "key_beats": "",
             }]
         
         return scenes
@@ -199,7 +803,7 @@ class NovelGenerator:
         """从文本中提取指定字段的内容"""
         for field_name in field_names:
             # 匹配 "**字段名**：内容" 格式
-            pattern = rf'\*+\s*{re.escape(field_name)}\s*\*+:?\s*([^\n]+)'
+            pattern = rf'\*+\s*{re.escape(field_name)}\s*\*+[:：]?\s*([^\n]+)'
             match = re.search(pattern, text, re.IGNORECASE)
             if match:
                 return match.group(1).strip()
@@ -216,14 +820,205 @@ class NovelGenerator:
         Returns:
             场景的文字内容
         """
+        scene_num = scene.get('number', scene_index + 1)
+        scene_text = self._generate_scene_once(scene, scene_index)
+        if self.consistency_check:
+            scene_text = self.ensure_consistency(scene, scene_index, scene_text)
+        
+        # 保存场景文字
+        self.novel_texts[scene_num] = scene_text
+        
+        return scene_text
+    
+    def _generate_scene_once(self, scene: Dict, scene_index: int) -> str:
+        """按当前模式（分段并行、级联、多候选或单次调用）生成一次场景文字"""
+        beats = self._scene_beats(scene)
+        if beats:
+            return self._generate_beats(scene, scene_index, beats)
+        
+        messages, scene_description = self.build_scene_messages(scene, scene_index)
+        
+        scene_num = scene.get('number', scene_index + 1)
+        if self.cascade:
+            return self._generate_cascaded(scene, scene_num, messages, scene_description)
+        if self.num_candidates > 1:
+            return self._select_best_candidate(scene, scene_num, messages)
+        return self._invoke(messages, "textualization", scene_number=scene_num,
+                            target_length=TARGET_MAX_LENGTH, max_tokens=self.scene_budget(scene)).content
+    
+    def _scene_beats(self, scene: Dict) -> List[str]:
+        """
+        将复杂场景的关键对话/动作拆分为段落
+        
+        Returns:
+            段落列表；未启用分段并行、场景不够复杂或关键元素少于两个时返回空列表
+        """
+        if not self.beat_parallel:
+            return []
+        return split_scene_beats(scene, self.language, self.beat_min_complexity, self.beat_max_count)
+    
+    def _generate_beats(self, scene: Dict, scene_index: int, beats: List[str]) -> str:
+        """
+        并发生成场景的各个段落并拼接
+        
+        每个段落都能看到完整的段落划分，以及前后段落（首末段为场景的承接关系）作为衔接提示。
+        同一场景的各段落共享系统消息前缀。
+        """
+        scene_num = scene.get('number', scene_index + 1)
+        scene_start, scene_end = BEAT_BOUNDARIES.get(self.language, BEAT_BOUNDARIES["en"])
+        connection = scene.get("connection", "")
+        if connection:
+            scene_start, scene_end = f"{scene_start} ({connection})", f"{scene_end} ({connection})"
+        
+        prompt = self.prompt_set.beat_template
+        context = {
+            "world_setting": self.world_setting or "",
+            "story_outline": self.story_outline or "",
+            "scene_description": self._build_scene_description(scene),
+            "character_context": self._build_character_context(scene_index),
+            "beat_plan": "\n".join(f"{i}. {beat}" for i, beat in enumerate(beats, 1)),
+            "beat_length": f"{TARGET_MIN_LENGTH // len(beats)}-{TARGET_MAX_LENGTH // len(beats)}",
+        }
+        
+        def write_beat(i: int) -> str:
+            messages = prompt.format_messages(
+                beat_position=f"{i + 1}/{len(beats)}",
+                beat=beats[i],
+                opening_hint=beats[i - 1] if i > 0 else scene_start,
+                closing_hint=beats[i + 1] if i + 1 < len(beats) else scene_end,
+                **context
+            )
+            return self._invoke(messages, "textualization", scene_number=scene_num,
+                                target_length=TARGET_MAX_LENGTH // len(beats),
+                                max_tokens=self.scene_budget(scene, len(beats)), beat=i + 1).content
+        
+        with ThreadPoolExecutor(max_workers=len(beats)) as executor:
+            texts = list(executor.map(write_beat, range(len(beats))))
+        
+        self.scene_beats[scene_num] = {"beats": beats, "smoothing": self.beat_smoothing}
+        return self._join_beats(texts, scene_num)
+    
+    def _join_beats(self, texts: List[str], scene_num: int) -> str:
+        """拼接各段落：去掉模型添加的标题和拼接处重复的段落，llm 模式下再由低成本模型改写拼接处"""
+        beats = []
+        for text in texts:
+            paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text.strip()) if p.strip()]
+            beats.append([p for p in paragraphs if not p.startswith("#")] or paragraphs)
+        
+        for previous, current in zip(beats, beats[1:]):
+            if len(current) > 1 and difflib.SequenceMatcher(
+                    None, previous[-1], current[0]).ratio() >= _SEAM_DUPLICATE_RATIO:
+                current.pop(0)
+        
+        # 每个中间段落至少需要两个自然段，拼接处的改写才不会互相重叠
+        if self.beat_smoothing == "llm" and all(len(beat) > 1 for beat in beats[1:-1]):
+            seam_prompt = self.prompt_set.template("beat_seam")
+            
+            def smooth_seam(i: int) -> str:
+                messages = seam_prompt.format_messages(previous_text=beats[i][-1], next_text=beats[i + 1][0])
+                return self._invoke(messages, "beat_smoothing", llm=self.draft_llm,
+                                    model_name=self.draft_model_name, scene_number=scene_num,
+                                    max_tokens=self.text_budget(beats[i][-1] + beats[i + 1][0])).content.strip()
+            
+            with ThreadPoolExecutor(max_workers=len(beats) - 1) as executor:
+                seams = list(executor.map(smooth_seam, range(len(beats) - 1)))
+            
+            parts = []
+            for i, beat in enumerate(beats):
+                body = beat[1 if i > 0 else 0:len(beat) - 1 if i + 1 < len(beats) else len(beat)]
+                parts.extend(body)
+                if i < len(seams):
+                    parts.append(seams[i])
+            return "\n\n".join(parts)
+        
+        return "\n\n".join(p for beat in beats for p in beat)
+    
+    def consistency_checker(self) -> Optional[ConsistencyChecker]:
+        """获取基于当前世界设定的一致性检查器，世界设定变化时重新构建"""
+        if not self.world_setting:
+            return None
+        checker = self._consistency_checker
+        if checker is None or checker.world_setting is not self.world_setting:
+            checker = ConsistencyChecker(self.world_setting, self.language)
+            self._consistency_checker = checker
+        return checker
+    
+    def ensure_consistency(self, scene: Dict, scene_index: int, scene_text: str) -> str:
+        """
+        检查场景文字的一致性，未通过时重新生成（最多 CONSISTENCY_MAX_RETRIES 次）
+        
+        Args:
+            scene: 场景字典
+            scene_index: 场景索引
+            scene_text: 已生成的场景文字
+            
+        Returns:
+            问题最少的场景文字
+        """
+        checker = self.consistency_checker()
+        if checker is None or checker.lore.is_empty():
+            return scene_text
+        
+        def blocking(issues: List[ConsistencyIssue]) -> List[ConsistencyIssue]:
+            return [issue for issue in issues if issue.triggers_regeneration]
+        
+        scene_num = scene.get('number', scene_index + 1)
+        attempts = [(scene_text, checker.check(scene_text, scene))]
+        while blocking(attempts[-1][1]) and len(attempts) <= self.consistency_max_retries:
+            text = self._generate_scene_once(scene, scene_index)
+            attempts.append((text, checker.check(text, scene)))
+        
+        best_text, best_issues = min(attempts, key=lambda attempt: len(blocking(attempt[1])))
+        self.consistency_reports[scene_num] = {
+            "flagged": bool(blocking(attempts[0][1])),
+            "regenerated": len(attempts) - 1,
+            "passed": not blocking(best_issues),
+            "issues": [issue._asdict() for issue in best_issues],
+        }
+        return best_text
+    
+    def build_scene_messages(self, scene: Dict, scene_index: int):
+        """
+        构建第四层单个场景的提示词消息
+        
+        Returns:
+            (提示词消息列表, 场景描述)
+        """
         # 构建角色历史/状态上下文（从之前的场景中提取）
         character_context = self._build_character_context(scene_index)
         
+        # 构建场景描述
+        scene_description = self._build_scene_description(scene)
+        
+        if self.prompt_layout == "prefix_cache":
+            # 不变部分（指令、世界设定、故事大纲）组成所有场景逐字节相同的系统消息前缀，
+            # 逐场景变化的部分放在最后，以命中服务商的自动前缀缓存
+            prompt = self.prompt_set.prefix_cache_template
+            messages = prompt.format_messages(
+                world_setting=self.world_setting or "",
+                story_outline=self.story_outline or "",
+                scene_description=scene_description,
+                character_context=character_context
+            )
+            return messages, scene_description
+        
         # 构建故事背景（世界设定 + 故事大纲的摘要）
         story_context = f"{self.world_setting[:500]}...\n\n{self.story_outline[:500]}..."
         
-        # 构建场景描述
-        scene_description = f"""
+        prompt = self.prompt_set.template("textualization")
+        messages = prompt.format_messages(
+            world_setting=self.world_setting or "",
+            story_context=story_context,
+            scene_description=scene_description,
+            character_context=character_context
+        )
+        
+        return messages, scene_description
+    
+    @staticmethod
+    def _build_scene_description(scene: Dict) -> str:
+        """构建第四层提示词中的场景描述"""
+        return f"""
 场景名称：{scene.get('name', '')}
 地点：{scene.get('location', '')}
 人物：{scene.get('characters', '')}
@@ -234,22 +1029,170 @@ class NovelGenerator:
 详细描述：
 {scene.get('raw_text', '')}
 """
+    
+    def _generate_candidates(self, messages, count: int, scene_num: int, max_tokens: int = None,
+                             **extra) -> List[str]:
+        """
+        生成多个场景候选文本
         
-        prompt = ChatPromptTemplate.from_template(self.prompts.textualization)
-        messages = prompt.format_messages(
-            world_setting=self.world_setting or "",
-            story_context=story_context,
-            scene_description=scene_description,
-            character_context=character_context
+        n 模式下在一次请求中取回全部候选（不经过退化检测）；服务商返回的候选不足时，
+        剩余部分以并发请求补齐。被 max_tokens 截断的候选回退到最后一个完整的句子。
+        """
+        call_kwargs = self._call_kwargs("textualization", max_tokens, messages)
+        texts: List[str] = []
+        if self.candidate_mode == "n":
+            with self._awaiting_llm(), self._llm_slot("textualization", messages, call_kwargs, n=count) as ticket:
+                start = time.perf_counter()
+                result = self.llm.generate([messages], n=count, **call_kwargs)
+                latency = time.perf_counter() - start
+                generations = result.generations[0]
+                usage = extract_usage(generations[0].message)
+                call_extra = self._charge(ticket, usage, extra)
+            texts = [
+                trim_truncated(generation.text)
+                if (generation.generation_info or {}).get("finish_reason") == "length" else generation.text
+                for generation in generations
+            ]
+            self.metrics.record("textualization", self.model_name, usage,
+                                latency, scene_number=scene_num, candidates=len(texts), **call_extra)
+        
+        remaining = count - len(texts)
+        if remaining > 0:
+            def generate_candidate(_) -> str:
+                # 与单次调用相同：排队、截断回退、退化检测和指标记录
+                return self._invoke(messages, "textualization", scene_number=scene_num,
+                                    target_length=TARGET_MAX_LENGTH, max_tokens=max_tokens, **extra).content
+            
+            # 每个请求单独排队（启用调度器时），不经过调度器时等同于并发批量请求
+            with self._awaiting_llm(), ThreadPoolExecutor(max_workers=remaining) as executor:
+                texts.extend(executor.map(generate_candidate, range(remaining)))
+        
+        return texts[:count]
+    
+    def _select_best_candidate(self, scene: Dict, scene_num: int, messages, **extra) -> str:
+        """生成多个候选，用本地评分选出最佳文本，其余候选保存为中间文件"""
+        texts = self._generate_candidates(messages, self.num_candidates, scene_num,
+                                          max_tokens=self.scene_budget(scene), **extra)
+        candidates = [
+            {"text": text, **score_scene_text(text, scene, self.language)}
+            for text in texts
+        ]
+        best_index = max(range(len(candidates)), key=lambda i: candidates[i]["score"])
+        for i, candidate in enumerate(candidates):
+            candidate["selected"] = i == best_index
+        self.scene_candidates[scene_num] = candidates
+        
+        filename = (
+            f"04_场景候选_{scene_num}.json" if self.language == "zh"
+            else f"04_Scene_Candidates_{scene_num}.json"
         )
+        self.save_intermediate(json.dumps(candidates, ensure_ascii=False, indent=2), filename)
         
-        response = self.llm.invoke(messages)
-        scene_text = response.content
+        return candidates[best_index]["text"]
+    
+    def _generate_cascaded(self, scene: Dict, scene_num: int, messages, scene_description: str) -> str:
+        """级联模式：先用低成本模型起草，被标记的场景再由强模型重写"""
+        draft = self._invoke(messages, "textualization", llm=self.draft_llm,
+                             model_name=self.draft_model_name, scene_number=scene_num,
+                             target_length=TARGET_MAX_LENGTH, max_tokens=self.scene_budget(scene),
+                             stage="draft").content
         
-        # 保存场景文字
-        self.novel_texts[scene.get('number', scene_index + 1)] = scene_text
+        reasons = self._review_draft(scene, scene_num, draft, scene_description)
+        self.cascade_decisions[scene_num] = {"refined": bool(reasons), "reasons": reasons}
+        if not reasons:
+            return draft
         
-        return scene_text
+        if self.num_candidates > 1:
+            return self._select_best_candidate(scene, scene_num, messages, stage="refine")
+        return self._invoke(messages, "textualization", scene_number=scene_num,
+                            target_length=TARGET_MAX_LENGTH, max_tokens=self.scene_budget(scene),
+                            stage="refine").content
+    
+    def _review_draft(self, scene: Dict, scene_num: int, draft: str, scene_description: str) -> List[str]:
+        """
+        判断草稿是否需要由强模型重写
+        
+        Returns:
+            需要重写的原因列表，为空表示保留草稿
+        """
+        complexity_threshold, min_score = get_cascade_thresholds()
+        reasons = []
+        
+        complexity = scene_complexity(scene)
+        if complexity >= complexity_threshold:
+            reasons.append(f"complexity={complexity}")
+        
+        score = score_scene_text(draft, scene, self.language)["score"]
+        if score < min_score:
+            reasons.append(f"draft_score={score}")
+        
+        # 启发式未标记时，才额外花一次低成本评审调用
+        if not reasons and self.cascade_judge == "llm":
+            prompt = self.prompt_set.template("scene_review")
+            review_messages = prompt.format_messages(scene_description=scene_description, draft_text=draft)
+            verdict = self._invoke(review_messages, "cascade_review", llm=self.draft_llm,
+                                   model_name=self.draft_model_name, scene_number=scene_num).content
+            if "REWRITE" in verdict.upper():
+                reasons.append("judge=REWRITE")
+        
+        return reasons
+    
+    def _cascade_report(self) -> Dict:
+        """
+        汇总级联模式的成本与耗时节省
+        
+        基线为"所有场景都由强模型生成"：精修场景使用强模型的实际成本与耗时，
+        保留草稿的场景按草稿的token数以强模型价格估算成本，并按精修调用实测的
+        每输出token耗时估算耗时（没有精修场景时无法估算基线耗时）。
+        """
+        drafts = self.metrics.filter(layer="textualization", stage="draft")
+        refines = self.metrics.filter(layer="textualization", stage="refine")
+        reviews = self.metrics.filter(layer="cascade_review")
+        total_scenes = len(self.cascade_decisions)
+        refined_numbers = {num for num, d in self.cascade_decisions.items() if d["refined"]}
+        refined_scenes = len(refined_numbers)
+        
+        actual = RunMetrics.aggregate(drafts + refines + reviews)
+        refine_totals = RunMetrics.aggregate(refines)
+        kept_drafts = RunMetrics.aggregate([c for c in drafts if c.get("scene_number") not in refined_numbers])
+        kept_cost = estimate_cost(self.model_name, kept_drafts["input_tokens"],
+                                  kept_drafts["output_tokens"], kept_drafts["cached_tokens"])
+        baseline_cost = refine_totals["cost"] + kept_cost
+        if refine_totals["output_tokens"]:
+            seconds_per_token = refine_totals["latency"] / refine_totals["output_tokens"]
+            baseline_latency = refine_totals["latency"] + kept_drafts["output_tokens"] * seconds_per_token
+        else:
+            baseline_latency = None
+        
+        return {
+            "draft_model": self.draft_model_name,
+            "refine_model": self.model_name,
+            "scenes": total_scenes,
+            "refined_scenes": refined_scenes,
+            "decisions": self.cascade_decisions,
+            "actual": actual,
+            "baseline_cost": round(baseline_cost, 6),
+            "baseline_latency": round(baseline_latency, 3) if baseline_latency is not None else None,
+            "cost_saving": round(1 - actual["cost"] / baseline_cost, 4) if baseline_cost else None,
+            "latency_saving": (round(1 - actual["latency"] / baseline_latency, 4)
+                               if baseline_latency else None),
+        }
+    
+    def translate_text(self, source_text: str, scene_number: int = None) -> str:
+        """
+        将文本翻译为本生成器的语言（多语言分发的翻译模式）
+        
+        Args:
+            source_text: 原文
+            scene_number: 场景编号（用于指标记录）
+            
+        Returns:
+            译文
+        """
+        prompt = self.prompt_set.template("scene_translation")
+        messages = prompt.format_messages(source_text=source_text)
+        return self._invoke(messages, "translation", scene_number=scene_number,
+                            max_tokens=self.text_budget(source_text)).content.strip()
     
     def _build_character_context(self, current_scene_index: int) -> str:
         """构建角色上下文，包括之前场景中角色的状态"""
@@ -286,8 +1229,33 @@ class NovelGenerator:
         if not scene:
             raise ValueError(f"未找到场景编号 {scene_number}")
         
+        # 分片输出：在调用LLM之前确认分片索引中有该场景
+        shards = self.sharded_novel() if self.sharded_output else None
+        if shards is not None and shards.exists():
+            if all(entry.scene_number != scene_number for entry in shards.entries()):
+                raise ValueError(f"分片索引中没有场景 {scene_number}: {shards.directory}")
+        else:
+            shards = None
+        
         scene_index = self.scenes.index(scene)
-        return self.generate_scene_text(scene, scene_index)
+        # 交互式重新生成：启用调度器时优先于所有批量生成的调用
+        self._interactive += 1
+        try:
+            scene_text = self.generate_scene_text(scene, scene_index)
+        finally:
+            self._interactive -= 1
+        
+        # 只重写该场景所在的分片，再按配置流式拼接完整正文
+        if shards is not None:
+            shards.patch(scene_number, self._scene_segment(scene))
+            if self.monolithic_output:
+                shards.write_monolithic(self.output_path or self.default_output_path())
+            shards.close()
+        return scene_text
+    
+    def run_messages(self) -> Dict[str, str]:
+        """获取当前语言的运行提示信息"""
+        return RUN_MESSAGES.get(self.language, RUN_MESSAGES["en"])
     
     def run(self, input_path: str = "input/input.txt", output_path: str = None):
         """
@@ -297,108 +1265,218 @@ class NovelGenerator:
             input_path: 输入文件路径
             output_path: 输出文件路径，如果为None则根据语言自动生成
         """
-        # 根据语言设置默认输出文件名
-        if output_path is None:
-            output_filename_map = {
-                "zh": "小说正文.txt",
-                "en": "Novel.txt",
-                "ja": "小説本文.txt"
-            }
-            output_filename = output_filename_map.get(self.language, "Novel.txt")
-            output_path = f"output/{output_filename}"
-        
-        # 根据语言设置提示信息
-        messages_map = {
-            "zh": {
-                "read_input": "已读取输入需求：",
-                "layer1": "🏗️ 第一层：正在生成世界设定...",
-                "layer1_saved": "世界设定已保存",
-                "layer2": "📖 第二层：正在生成故事大纲与人物弧光...",
-                "layer2_saved": "故事大纲已保存",
-                "layer3": "🎬 第三层：正在分解场景...",
-                "layer3_saved": "场景分解完成，共 {count} 个场景",
-                "layer4": "✍️ 第四层：正在生成场景文字...",
-                "layer4_progress": "  场景 {num}/{total}：{name}",
-                "layer4_complete": "所有场景文字生成完成",
-                "assembling": "正在组装完整小说...",
-                "novel_saved": "小说已保存到 "
-            },
-            "en": {
-                "read_input": "Input requirements read: ",
-                "layer1": "🏗️ Layer 1: Generating world setting...",
-                "layer1_saved": "World setting saved",
-                "layer2": "📖 Layer 2: Generating story outline and character arcs...",
-                "layer2_saved": "Story outline saved",
-                "layer3": "🎬 Layer 3: Decomposing scenes...",
-                "layer3_saved": "Scene decomposition complete, {count} scenes total",
-                "layer4": "✍️ Layer 4: Generating scene texts...",
-                "layer4_progress": "  Scene {num}/{total}: {name}",
-                "layer4_complete": "All scene texts generated",
-                "assembling": "Assembling complete novel...",
-                "novel_saved": "Novel saved to "
-            },
-            "ja": {
-                "read_input": "入力要件を読み取りました：",
-                "layer1": "🏗️ 第1層：世界設定を生成中...",
-                "layer1_saved": "世界設定が保存されました",
-                "layer2": "📖 第2層：物語概要とキャラクターアークを生成中...",
-                "layer2_saved": "物語概要が保存されました",
-                "layer3": "🎬 第3層：シーンを分解中...",
-                "layer3_saved": "シーン分解が完了しました、合計 {count} シーン",
-                "layer4": "✍️ 第4層：シーンテキストを生成中...",
-                "layer4_progress": "  シーン {num}/{total}：{name}",
-                "layer4_complete": "すべてのシーンテキストが生成されました",
-                "assembling": "完全な小説を組み立て中...",
-                "novel_saved": "小説が "
-            }
-        }
-        messages = messages_map.get(self.language, messages_map["en"])
+        messages = self.run_messages()
         
         # 读取输入
         user_input = read_input_file(input_path)
         print(f"{messages['read_input']}{user_input[:100]}...")
         
+        # 第一至三层
+        self.run_upstream(user_input)
+        
+        # 第四层：为每个场景生成文字
+        self.run_textualization()
+        
+        return self.finalize(output_path)
+    
+    def run_textualization(self):
+        """运行第四层：依次为每个场景生成文字"""
+        messages = self.run_messages()
+        scenes = self.scenes
+        
+        print(messages["layer4"])
+        with self._profile("textualization"):
+            for i, scene in enumerate(scenes):
+                scene_num = scene.get('number', i + 1)
+                scene_name = scene.get('name', f'Scene {scene_num}')
+                print(messages["layer4_progress"].format(
+                    num=i + 1,
+                    total=len(scenes),
+                    name=scene_name
+                ))
+                self.generate_scene_text(scene, i)
+        print(f"✓ {messages['layer4_complete']}")
+    
+    def run_upstream(self, user_input: str) -> List[Dict]:
+        """
+        运行前三层（世界设定、故事大纲、场景分解）
+        
+        Args:
+            user_input: 用户输入的需求
+            
+        Returns:
+            场景列表
+        """
+        messages = self.run_messages()
+        
         # 第一层：世界设定
-        print(messages["layer1"])
-        world_setting = self.generate_world_building(user_input)
-        print(f"✓ {messages['layer1_saved']}")
+        if "world_building" in self.shared_layers:
+            world_setting = self.world_setting
+            print(f"✓ {messages['layer1_shared'].format(source=self.shared_upstream)}")
+        else:
+            print(messages["layer1"])
+            with self._profile("world_building"):
+                world_setting = self.generate_world_building(user_input)
+            print(f"✓ {messages['layer1_saved']}")
         
         # 第二层：故事大纲
-        print(messages["layer2"])
-        story_outline = self.generate_story_layer(user_input, world_setting)
-        print(f"✓ {messages['layer2_saved']}")
+        if "story_layer" in self.shared_layers:
+            story_outline = self.story_outline
+            print(f"✓ {messages['layer2_shared'].format(source=self.shared_upstream)}")
+        else:
+            print(messages["layer2"])
+            with self._profile("story_layer"):
+                story_outline = self.generate_story_layer(user_input, world_setting)
+            print(f"✓ {messages['layer2_saved']}")
         
         # 第三层：场景分解
         print(messages["layer3"])
-        scenes = self.generate_scene_decomposition(world_setting, story_outline)
+        with self._profile("scene_decomposition"):
+            scenes = self.generate_scene_decomposition(world_setting, story_outline)
         print(f"✓ {messages['layer3_saved'].format(count=len(scenes))}")
         
-        # 第四层：为每个场景生成文字
-        print(messages["layer4"])
-        for i, scene in enumerate(scenes):
-            scene_num = scene.get('number', i + 1)
-            scene_name = scene.get('name', f'Scene {scene_num}')
-            print(messages["layer4_progress"].format(
-                num=i + 1,
-                total=len(scenes),
-                name=scene_name
-            ))
-            self.generate_scene_text(scene, i)
-        print(f"✓ {messages['layer4_complete']}")
+        return scenes
+    
+    def finalize(self, output_path: str = None) -> Optional[str]:
+        """
+        组装完整小说并保存输出和本次运行的调用指标
+        
+        分片输出时直接由各场景的片段写入分片，完整正文由分片流式拼接，不在内存中组装。
         
-        # 组装完整小说
+        Args:
+            output_path: 输出文件路径，如果为None则根据语言自动生成
+            
+        Returns:
+            完整小说文本（分片输出时为None）
+        """
+        if output_path is None:
+            output_path = self.default_output_path()
+        messages = self.run_messages()
+        
+        # 组装完整小说并保存输出
         print(messages["assembling"])
-        complete_novel = self._assemble_novel()
+        self.output_path = output_path
+        complete_novel = None
+        with self._profile("assembly"):
+            if self.sharded_output:
+                shards = self.sharded_novel(output_path)
+                shards.write(self._novel_segments())
+                if self.monolithic_output:
+                    shards.write_monolithic(output_path)
+                shards.close()
+                print(f"✓ {messages['shards_saved']}{shards.directory}")
+            else:
+                complete_novel = self._assemble_novel()
+                save_output_file(complete_novel, output_path)
+        if not self.sharded_output or self.monolithic_output:
+            print(f"✓ {messages['novel_saved']}{output_path}")
         
-        # 保存输出
-        save_output_file(complete_novel, output_path)
-        print(f"✓ {messages['novel_saved']}{output_path}")
+        self.save_run_metrics()
         
         return complete_novel
     
+    def save_run_metrics(self) -> str:
+        """保存本次运行的调用指标，返回文件路径"""
+        messages = self.run_messages()
+        summary = self.metrics.summary()
+        run_metrics = {
+            "summary": summary,
+            "prompts": {"version": self.prompt_set.version, "templates": self.prompt_set.hashes()},
+            "shared_upstream": self.shared_upstream,
+            "calls": self.metrics.calls,
+        }
+        textualization = summary["layers"].get("textualization")
+        # 命中率只对前缀缓存友好的提示词布局有意义
+        if textualization and self.prompt_layout == "prefix_cache":
+            print(messages["cache_hit_rate"].format(
+                rate=self._format_ratio(textualization["cache_hit_rate"]),
+                cached=textualization["cached_tokens"],
+                total=textualization["input_tokens"]
+            ))
+        if self.cascade and self.cascade_decisions:
+            report = self._cascade_report()
+            run_metrics["cascade"] = report
+            print(messages["cascade_report"].format(
+                refined=report["refined_scenes"],
+                total=report["scenes"],
+                cost_saving=self._format_ratio(report["cost_saving"]),
+                latency_saving=self._format_ratio(report["latency_saving"])
+            ))
+        if self.scene_beats:
+            run_metrics["beats"] = self.scene_beats
+        aborted = Counter(call["aborted"] for call in self.metrics.calls if "aborted" in call)
+        if aborted:
+            run_metrics["degeneration"] = {"aborted_calls": sum(aborted.values()), "reasons": dict(aborted)}
+        if self.consistency_reports:
+            report = self._consistency_report()
+            run_metrics["consistency"] = report
+            print(messages["consistency_report"].format(
+                flagged=report["flagged_scenes"],
+                total=report["scenes"],
+                regenerated=report["regenerations"],
+                unresolved=report["unresolved_scenes"]
+            ))
+        if self.world_section_report:
+            run_metrics["world_sections"] = self.world_section_report
+        if self.scheduler:
+            run_metrics["scheduler"] = self.scheduler.stats(self.tenant)
+        metrics_path = self.save_intermediate(
+            json.dumps(run_metrics, ensure_ascii=False, indent=2), "run_metrics.json"
+        )
+        print(f"✓ {messages['metrics_saved']}{metrics_path}")
+        append_run_history(self._history_record(summary), get_run_history_path())
+        
+        if self.profiler:
+            profile_path = self.profiler.save()
+            print(f"✓ {messages['profile_saved'].format(path=profile_path, **self.profiler.report()['total'])}")
+        
+        return metrics_path
+    
+    def _history_record(self, summary: Dict) -> Dict:
+        """运行历史中的一行：各层和各模型的汇总，供运行前的估算（--plan）校准"""
+        calls_by_model: Dict[str, List[Dict]] = {}
+        for call in list(self.metrics.calls):
+            calls_by_model.setdefault(call["model"], []).append(call)
+        record = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "language": self.language,
+            "model": self.model_name,
+            "prompt_layout": self.prompt_layout,
+            "scenes": len(self.scenes),
+            "shared_layers": self.shared_layers,
+            "candidates": self.num_candidates,
+            "cascade": self.cascade,
+            "layers": summary["layers"],
+            "models": {model: RunMetrics.aggregate(calls) for model, calls in calls_by_model.items()},
+        }
+        if self.cascade_decisions:
+            refined = sum(1 for d in self.cascade_decisions.values() if d["refined"])
+            record["cascade_refine_rate"] = round(refined / len(self.cascade_decisions), 4)
+        return record
+    
+    def _consistency_report(self) -> Dict:
+        """汇总一致性检查结果"""
+        reports = self.consistency_reports
+        return {
+            "scenes": len(reports),
+            "flagged_scenes": sum(1 for r in reports.values() if r["flagged"]),
+            "regenerations": sum(r["regenerated"] for r in reports.values()),
+            "unresolved_scenes": sum(1 for r in reports.values() if not r["passed"]),
+            "decisions": reports,
+        }
+    
+    @staticmethod
+    def _format_ratio(ratio: Optional[float]) -> str:
+        """将比例格式化为百分比，无法计算时显示 N/A"""
+        return f"{ratio:.1%}" if ratio is not None else "N/A"
+    
     def _assemble_novel(self) -> str:
         """组装完整小说"""
-        parts = []
+        return "".join(segment for _, segment in self._novel_segments()).strip()
+    
+    def _novel_segments(self) -> List[tuple]:
+        """按场景编号排序的 (场景编号, 片段)，片段依次拼接后即为完整小说"""
+        segments = []
         
         # 按场景编号排序
         sorted_scenes = sorted(self.scenes, key=lambda x: x.get('number', 0))
@@ -406,17 +1484,23 @@ class NovelGenerator:
         for scene in sorted_scenes:
             scene_num = scene.get('number', 0)
             if scene_num in self.novel_texts:
-                # 添加场景标题（可选）
-                scene_name = scene.get('name', '')
-                if scene_name:
-                    title_map = {
-                        "zh": f"\n\n## {scene_name}\n\n",
-                        "en": f"\n\n## {scene_name}\n\n",
-                        "ja": f"\n\n## {scene_name}\n\n"
-                    }
-                    parts.append(title_map.get(self.language, f"\n\n## {scene_name}\n\n"))
-                
-                parts.append(self.novel_texts[scene_num])
-                parts.append("\n\n")
+                segments.append((scene_num, self._scene_segment(scene)))
+        
+        return segments
+    
+    def _scene_segment(self, scene: Dict) -> str:
+        """单个场景在完整小说中的片段（标题 + 正文）"""
+        parts = []
+        # 添加场景标题（可选）
+        scene_name = scene.get('name', '')
+        if scene_name:
+            title_map = {
+                "zh": f"\n\n## {scene_name}\n\n",
+                "en": f"\n\n## {scene_name}\n\n",
+                "ja": f"\n\n## {scene_name}\n\n"
+            }
+            parts.append(title_map.get(self.language, f"\n\n## {scene_name}\n\n"))
         
-        return "".join(parts).strip()
+        parts.append(self.novel_texts[scene.get('number', 0)])
+        parts.append("\n\n")
+        return "".join(parts)
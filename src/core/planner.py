@@ -0,0 +1,429 @@
+"""运行前估算 - 不调用LLM，估算一次运行的调用次数、token、成本和耗时，并用历史运行的指标校准"""
+import json
+import math
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.utils.config import (
+    get_model_name, get_draft_model_name, get_scene_candidates, get_candidate_mode,
+    is_cascade_enabled, get_cascade_judge, get_prompt_layout, is_beat_parallel_enabled, get_beat_settings,
+    get_beat_smoothing, is_world_sections_enabled, is_world_reconcile_enabled, is_scheduler_enabled,
+    get_scheduler_concurrency, get_rate_limits, get_run_history_path,
+)
+from src.utils.file_utils import read_intermediate_file
+from src.prompts.prompt_loader import load_compiled_prompts
+from src.core.metrics import estimate_cost, load_run_history
+from src.core.scene_scorer import TARGET_MIN_LENGTH, TARGET_MAX_LENGTH
+from src.core.token_budget import (
+    LAYER_TARGET_LENGTHS, FIXED_LAYER_BUDGETS, estimate_tokens, tokens_per_unit, scene_target_length,
+)
+from src.core.novel_generator import (
+    NovelGenerator, INTERMEDIATE_FILENAMES, split_prompt_sections, split_scene_beats,
+)
+
+# 没有场景列表和历史运行时假设的场景数
+DEFAULT_SCENE_COUNT = 12
+# 没有历史运行时假设的输出速度（token/秒，含首token延迟）
+DEFAULT_OUTPUT_TOKENS_PER_SECOND = 40.0
+# 没有历史运行时假设的级联精修比例
+DEFAULT_REFINE_RATE = 0.5
+# 历史校准系数的范围，避免个别异常的运行使估算失真
+CALIBRATION_RANGE = (0.25, 4.0)
+# 第四层 classic 布局的故事背景为世界设定和故事大纲各前500个字符，角色上下文为最近3个场景各200个字符
+STORY_CONTEXT_CHARS = 1000
+CHARACTER_CONTEXT_CHARS = 600
+# 英文平均每个单词的字符数（含空格）
+CHARS_PER_WORD = 5.5
+# Batch API 的价格相对同步调用的比例
+BATCH_PRICE_RATIO = 0.5
+
+_VARIABLE_RE = re.compile(r"\{\w+\}")
+
+PLAN_MESSAGES = {
+    "zh": {
+        "header": "📋 运行前估算（{novels} 部小说，每部 {scenes} 个场景，场景数来源：{scene_source}）",
+        "columns": "层级 / 模型 / 调用次数 / 输入token / 输出token / 成本(美元) / 关键路径耗时(秒)",
+        "total": "合计：{calls} 次调用，{input_tokens} 输入token，{output_tokens} 输出token，成本约 ${cost}，"
+                 "预计耗时约 {wall} 秒（瓶颈：{bottleneck}）",
+        "calibrated": "已使用 {runs} 次历史运行校准：{items}",
+        "uncalibrated": "没有同语言的历史运行，使用默认假设",
+        "batch": "第四层使用Batch API：成本按 {ratio} 倍计算，耗时不计入（最长24小时）",
+        "saved": "估算结果已保存到 ",
+    },
+    "en": {
+        "header": "📋 Dry-run plan ({novels} novel(s), {scenes} scenes each, scene count from: {scene_source})",
+        "columns": "layer / model / calls / input tokens / output tokens / cost (USD) / critical path (s)",
+        "total": "Total: {calls} calls, {input_tokens} input tokens, {output_tokens} output tokens, about ${cost}, "
+                 "about {wall} s wall time (bottleneck: {bottleneck})",
+        "calibrated": "Calibrated with {runs} past run(s): {items}",
+        "uncalibrated": "No past runs in this language, using default assumptions",
+        "batch": "Layer 4 uses the Batch API: cost at {ratio}x, time not included (up to 24 hours)",
+        "saved": "Plan saved to ",
+    },
+    "ja": {
+        "header": "📋 実行前の見積もり（小説 {novels} 本、各 {scenes} シーン、シーン数の出所：{scene_source}）",
+        "columns": "層 / モデル / 呼び出し回数 / 入力トークン / 出力トークン / コスト(USD) / クリティカルパス(秒)",
+        "total": "合計：{calls} 回の呼び出し、入力 {input_tokens} トークン、出力 {output_tokens} トークン、"
+                 "コスト約 ${cost}、所要時間約 {wall} 秒（ボトルネック：{bottleneck}）",
+        "calibrated": "過去の {runs} 回の実行で校正済み：{items}",
+        "uncalibrated": "同じ言語の過去の実行がないため、既定の仮定を使用",
+        "batch": "第4層は Batch API を使用：コストは {ratio} 倍で計算、時間は含まない（最長24時間）",
+        "saved": "見積もりを保存しました：",
+    },
+}
+
+
+def _clamp(value: float) -> float:
+    return min(max(value, CALIBRATION_RANGE[0]), CALIBRATION_RANGE[1])
+
+
+class RunPlanner:
+    """
+    运行前估算器
+
+    - 第一至三层：按提示词模板、输入需求和各层的目标长度估算每次调用的输入/输出token
+    - 第四层：有场景列表时逐场景估算（场景复杂度决定目标长度），否则按指定或历史平均的场景数估算
+    - 按配置的多候选、级联、分段并行、分部世界构建和前缀缓存布局展开调用
+    - 耗时取关键路径（各层依次执行、场景依次生成、并发部分取最长）、调度器并发额度和速率限制中的最大值
+    - 历史运行（RUN_HISTORY_FILE）用于校准各层的输出长度、模型的输出速度、缓存命中率和级联精修比例
+    """
+
+    def __init__(self, language: str, history: List[Dict] = None):
+        self.language = language
+        self.prompt_set = load_compiled_prompts(language)
+        self.model_name = get_model_name()
+        self.draft_model_name = get_draft_model_name()
+        self.tokens_per_unit = tokens_per_unit(language)
+        if history is None:
+            history = load_run_history(get_run_history_path())
+        self.history = [record for record in history if record.get("language") == language]
+        self.calibration: Dict[str, float] = {}
+
+    # ---- 历史校准 ----
+
+    def _layer_runs(self, layer: str) -> List[Dict]:
+        """运行过该层（没有使用共享结果）的历史记录中该层的汇总"""
+        return [record["layers"][layer] for record in self.history
+                if layer in record.get("layers", {}) and layer not in record.get("shared_layers", [])]
+
+    def layer_output(self, layer: str) -> float:
+        """第一至三层每次运行的输出token数"""
+        runs = self._layer_runs(layer)
+        if runs:
+            output = sum(run["output_tokens"] for run in runs) / len(runs)
+            self.calibration[f"{layer}_output"] = round(output)
+            return output
+        return LAYER_TARGET_LENGTHS[layer] * self.tokens_per_unit
+
+    def scene_output_factor(self) -> float:
+        """第四层实际输出相对按场景目标长度估算的比例（只使用单候选、非级联的运行）"""
+        runs = [record for record in self.history
+                if record.get("scenes") and record.get("candidates", 1) == 1 and not record.get("cascade")
+                and "textualization" in record.get("layers", {})]
+        if not runs:
+            return 1.0
+        actual = sum(record["layers"]["textualization"]["output_tokens"] for record in runs)
+        expected = sum(record["scenes"] for record in runs) * (TARGET_MIN_LENGTH + TARGET_MAX_LENGTH) / 2
+        factor = _clamp(actual / (expected * self.tokens_per_unit))
+        self.calibration["scene_output_factor"] = round(factor, 3)
+        return factor
+
+    def throughput(self, model: str) -> float:
+        """模型的输出速度（token/秒），按历史调用的总输出token和总耗时计算"""
+        totals = [record["models"][model] for record in self.history if model in record.get("models", {})]
+        output = sum(total["output_tokens"] for total in totals)
+        latency = sum(total["latency"] for total in totals)
+        if output and latency:
+            speed = output / latency
+            self.calibration[f"{model}_tokens_per_second"] = round(speed, 1)
+            return speed
+        return DEFAULT_OUTPUT_TOKENS_PER_SECOND
+
+    def cache_hit_rate(self, layout: str) -> float:
+        """第四层的前缀缓存命中率（只使用相同提示词布局的运行）"""
+        rates = [record["layers"]["textualization"]["cache_hit_rate"] for record in self.history
+                 if record.get("prompt_layout") == layout and "textualization" in record.get("layers", {})]
+        if not rates:
+            return 0.0
+        rate = sum(rates) / len(rates)
+        self.calibration["cache_hit_rate"] = round(rate, 4)
+        return rate
+
+    def refine_rate(self) -> float:
+        """级联模式中被精修的场景比例"""
+        rates = [record["cascade_refine_rate"] for record in self.history if "cascade_refine_rate" in record]
+        if not rates:
+            return DEFAULT_REFINE_RATE
+        rate = sum(rates) / len(rates)
+        self.calibration["cascade_refine_rate"] = round(rate, 4)
+        return rate
+
+    def history_scene_count(self) -> Optional[int]:
+        counts = [record["scenes"] for record in self.history if record.get("scenes")]
+        return round(sum(counts) / len(counts)) if counts else None
+
+    # ---- token估算 ----
+
+    def _chars_to_tokens(self, chars: int) -> float:
+        units = chars / CHARS_PER_WORD if self.language == "en" else chars
+        return units * self.tokens_per_unit
+
+    def prompt_tokens(self, *names: str, **variables: float) -> float:
+        """模板（去掉变量）的token数加上各变量的token数"""
+        text = "\n".join(self.prompt_set.text(name) for name in names)
+        return estimate_tokens(_VARIABLE_RE.sub("", text)) + sum(variables.values())
+
+    def load_scenes(self, intermediate_dir: str = "intermediate") -> Optional[List[Dict]]:
+        """读取已有的场景列表（第三层的结果），不存在时返回None"""
+        filename_map, default = INTERMEDIATE_FILENAMES["scene_list"]
+        scene_list = read_intermediate_file(filename_map.get(self.language, default), intermediate_dir)
+        return json.loads(scene_list) if scene_list else None
+
+    # ---- 估算 ----
+
+    def plan(self, user_inputs: List[str], scenes: List[Dict] = None, scene_count: int = None,
+             batch: bool = False) -> Dict:
+        """
+        估算一次运行
+
+        Args:
+            user_inputs: 每部小说的输入需求（多部小说在同一进程中并发生成）
+            scenes: 已有的场景列表，为None时按场景数估算
+            scene_count: 目标场景数，为None时使用历史平均值或默认值
+            batch: 第四层是否使用Batch API
+
+        Returns:
+            包含各层估算和合计的字典
+        """
+        self.calibration = {}
+        if scenes:
+            scene_source = "scene_list"
+        elif scene_count:
+            scene_source = "argument"
+        else:
+            scene_count = self.history_scene_count()
+            scene_source = "history" if scene_count else "default"
+            scene_count = scene_count or DEFAULT_SCENE_COUNT
+        scenes = scenes or [None] * scene_count
+
+        rows: Dict[tuple, Dict] = {}
+        critical_paths = []
+        for user_input in user_inputs:
+            critical = self._plan_upstream(rows, estimate_tokens(user_input))
+            layer4 = self._plan_textualization(rows, scenes, batch)
+            critical_paths.append(critical + (0.0 if batch else layer4))
+
+        totals = self._totals(list(rows.values()), max(critical_paths), batch)
+        return {
+            "language": self.language,
+            "novels": len(user_inputs),
+            "scenes": len(scenes),
+            "scene_source": scene_source,
+            "batch": batch,
+            "layers": [self._round(row) for row in rows.values()],
+            "total": totals,
+            "calibration": dict(self.calibration),
+            "history_runs": len(self.history),
+        }
+
+    def _add(self, rows: Dict[tuple, Dict], layer: str, model: str, calls: int, input_tokens: float,
+             output_tokens: float, critical: float, cached_tokens: float = 0.0, batch: bool = False):
+        """累加一组调用（同一层级和模型的调用合并为一行）"""
+        row = rows.setdefault((layer, model), {
+            "layer": layer, "model": model, "calls": 0, "input_tokens": 0.0, "output_tokens": 0.0,
+            "cached_tokens": 0.0, "cost": 0.0, "work": 0.0, "critical": 0.0,
+        })
+        cost = estimate_cost(model, input_tokens, output_tokens, cached_tokens)
+        row["calls"] += calls
+        row["input_tokens"] += input_tokens
+        row["output_tokens"] += output_tokens
+        row["cached_tokens"] += cached_tokens
+        row["cost"] += cost * BATCH_PRICE_RATIO if batch else cost
+        # Batch API 的调用不占用同步调用的并发额度和速率限制
+        if not batch:
+            row["work"] += output_tokens / self.throughput(model)
+            row["critical"] += critical
+
+    def _latency(self, model: str, output_tokens: float) -> float:
+        return output_tokens / self.throughput(model)
+
+    def _plan_upstream(self, rows: Dict[tuple, Dict], input_tokens: float) -> float:
+        """估算第一至三层，返回关键路径耗时"""
+        world = self.layer_output("world_building")
+        story = self.layer_output("story_layer")
+        decomposition = self.layer_output("scene_decomposition")
+        critical = 0.0
+
+        sections = split_prompt_sections(self.prompt_set.text("world_building"))
+        if is_world_sections_enabled() and len(sections) > 1:
+            premise = LAYER_TARGET_LENGTHS["world_premise"] * self.tokens_per_unit
+            self._add(rows, "world_building", self.model_name, 1,
+                      self.prompt_tokens("world_premise", user_input=input_tokens), premise,
+                      self._latency(self.model_name, premise))
+            section_inputs = sum(self.prompt_tokens("world_section", user_input=input_tokens, world_premise=premise,
+                                                    section=estimate_tokens(section)) for section in sections)
+            self._add(rows, "world_building", self.model_name, len(sections), section_inputs, world,
+                      self._latency(self.model_name, world / len(sections)))
+            critical += self._latency(self.model_name, premise) + self._latency(self.model_name, world / len(sections))
+            if is_world_reconcile_enabled():
+                # 多数情况下只重写一个部分（或只输出 CONSISTENT）
+                revision = world / len(sections)
+                self._add(rows, "world_building", self.draft_model_name, 1,
+                          self.prompt_tokens("world_reconcile", world_setting=world), revision,
+                          self._latency(self.draft_model_name, revision))
+                critical += self._latency(self.draft_model_name, revision)
+        else:
+            self._add(rows, "world_building", self.model_name, 1,
+                      self.prompt_tokens("world_building", user_input=input_tokens), world,
+                      self._latency(self.model_name, world))
+            critical += self._latency(self.model_name, world)
+
+        self._add(rows, "story_layer", self.model_name, 1,
+                  self.prompt_tokens("story_layer", world_setting=world, user_input=input_tokens), story,
+                  self._latency(self.model_name, story))
+        self._add(rows, "scene_decomposition", self.model_name, 1,
+                  self.prompt_tokens("scene_decomposition", world_setting=world, story_outline=story), decomposition,
+                  self._latency(self.model_name, decomposition))
+        return (critical + self._latency(self.model_name, story)
+                + self._latency(self.model_name, decomposition))
+
+    def _plan_textualization(self, rows: Dict[tuple, Dict], scenes: List[Optional[Dict]], batch: bool) -> float:
+        """估算第四层（场景依次生成），返回关键路径耗时"""
+        world = self.layer_output("world_building")
+        story = self.layer_output("story_layer")
+        decomposition = self.layer_output("scene_decomposition")
+        factor = self.scene_output_factor()
+        layout = get_prompt_layout()
+        hit_rate = self.cache_hit_rate(layout) if layout == "prefix_cache" else 0.0
+        candidates, candidate_mode = get_scene_candidates(), get_candidate_mode()
+        cascade = is_cascade_enabled() and not batch
+        refine_rate = self.refine_rate() if cascade else 0.0
+        beat_min_complexity, beat_max_count = get_beat_settings()
+        beat_parallel = is_beat_parallel_enabled() and not batch
+        main, draft = self.model_name, self.draft_model_name
+
+        critical = 0.0
+        for scene in scenes:
+            if scene is None:
+                description = decomposition / len(scenes)
+                output = (TARGET_MIN_LENGTH + TARGET_MAX_LENGTH) / 2 * self.tokens_per_unit * factor
+            else:
+                description = estimate_tokens(NovelGenerator._build_scene_description(scene))
+                output = scene_target_length(scene) * self.tokens_per_unit * factor
+            context = self._chars_to_tokens(CHARACTER_CONTEXT_CHARS)
+            if layout == "prefix_cache":
+                prompt = self.prompt_tokens("textualization_system", "textualization_scene", world_setting=world,
+                                            story_outline=story, scene_description=description,
+                                            character_context=context)
+            else:
+                prompt = self.prompt_tokens("textualization", world_setting=world,
+                                            story_context=min(world + story,
+                                                              self._chars_to_tokens(STORY_CONTEXT_CHARS)),
+                                            scene_description=description, character_context=context)
+            cached = prompt * hit_rate
+
+            beats = split_scene_beats(scene, self.language, beat_min_complexity, beat_max_count) \
+                if beat_parallel and scene else []
+            if batch:
+                self._add(rows, "textualization", main, 1, prompt, output, 0.0, batch=True)
+            elif beats:
+                self._add(rows, "textualization", main, len(beats), prompt * len(beats), output,
+                          self._latency(main, output / len(beats)), cached * len(beats))
+                critical += self._latency(main, output / len(beats))
+                if get_beat_smoothing() == "llm":
+                    seam = 2 * output / len(beats) / 4  # 改写拼接处前后各一个段落
+                    self._add(rows, "beat_smoothing", draft, len(beats) - 1, seam * (len(beats) - 1),
+                              seam * (len(beats) - 1), self._latency(draft, seam))
+                    critical += self._latency(draft, seam)
+            else:
+                if cascade:
+                    self._add(rows, "textualization", draft, 1, prompt, output, self._latency(draft, output), cached)
+                    critical += self._latency(draft, output)
+                    if get_cascade_judge() == "llm":
+                        # 只有启发式未标记的场景才额外评审
+                        unflagged = 1 - refine_rate
+                        review = FIXED_LAYER_BUDGETS["cascade_review"]
+                        review_input = self.prompt_tokens("scene_review", scene_description=description,
+                                                          draft_text=output)
+                        self._add(rows, "cascade_review", draft, unflagged, review_input * unflagged,
+                                  review * unflagged, self._latency(draft, review) * unflagged)
+                        critical += self._latency(draft, review) * unflagged
+                weight = refine_rate if cascade else 1.0
+                requests = 1 if candidate_mode == "n" else candidates
+                self._add(rows, "textualization", main, weight * requests, prompt * requests * weight,
+                          output * candidates * weight, self._latency(main, output) * weight,
+                          cached * requests * weight)
+                critical += self._latency(main, output) * weight
+        return critical
+
+    def _totals(self, rows: List[Dict], critical: float, batch: bool) -> Dict:
+        """合计，并按关键路径、并发额度和速率限制估算耗时"""
+        calls = sum(row["calls"] for row in rows)
+        input_tokens = sum(row["input_tokens"] for row in rows)
+        output_tokens = sum(row["output_tokens"] for row in rows)
+        work = sum(row["work"] for row in rows)
+        # 同步调用（Batch API 的调用除外）才受并发额度和速率限制约束
+        sync_rows = [row for row in rows if not (batch and row["layer"] == "textualization")]
+        sync_calls = sum(row["calls"] for row in sync_rows)
+        sync_tokens = sum(row["input_tokens"] + row["output_tokens"] for row in sync_rows)
+
+        bounds = {"critical_path": critical}
+        if is_scheduler_enabled():
+            bounds["concurrency"] = work / get_scheduler_concurrency()
+        rpm, tpm = get_rate_limits()
+        if rpm:
+            bounds["requests_per_minute"] = sync_calls / rpm * 60
+        if tpm:
+            bounds["tokens_per_minute"] = sync_tokens / tpm * 60
+        bottleneck = max(bounds, key=bounds.get)
+        return {
+            "calls": math.ceil(calls),
+            "input_tokens": round(input_tokens),
+            "output_tokens": round(output_tokens),
+            "cost": round(sum(row["cost"] for row in rows), 4),
+            "wall": round(bounds[bottleneck], 1),
+            "bottleneck": bottleneck,
+            "bounds": {name: round(value, 1) for name, value in bounds.items()},
+        }
+
+    @staticmethod
+    def _round(row: Dict) -> Dict:
+        return {
+            **row,
+            "calls": math.ceil(row["calls"]),
+            "input_tokens": round(row["input_tokens"]),
+            "output_tokens": round(row["output_tokens"]),
+            "cached_tokens": round(row["cached_tokens"]),
+            "cost": round(row["cost"], 4),
+            "work": round(row["work"], 1),
+            "critical": round(row["critical"], 1),
+        }
+
+    def print_plan(self, plan: Dict):
+        """输出估算结果"""
+        messages = PLAN_MESSAGES.get(self.language, PLAN_MESSAGES["en"])
+        print(messages["header"].format(novels=plan["novels"], scenes=plan["scenes"],
+                                        scene_source=plan["scene_source"]))
+        print(messages["columns"])
+        for row in plan["layers"]:
+            print(f"  {row['layer']} / {row['model']} / {row['calls']} / {row['input_tokens']} / "
+                  f"{row['output_tokens']} / {row['cost']} / {row['critical']}")
+        print(messages["total"].format(**plan["total"]))
+        if plan["calibration"]:
+            items = ", ".join(f"{name}={value}" for name, value in plan["calibration"].items())
+            print(messages["calibrated"].format(runs=plan["history_runs"], items=items))
+        else:
+            print(messages["uncalibrated"])
+        if plan["batch"]:
+            print(messages["batch"].format(ratio=BATCH_PRICE_RATIO))
+
+    def save(self, plan: Dict, path: str = "intermediate/plan.json") -> str:
+        """保存估算结果，返回文件路径"""
+        plan_path = Path(path)
+        plan_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(plan_path, "w", encoding="utf-8") as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+        messages = PLAN_MESSAGES.get(self.language, PLAN_MESSAGES["en"])
+        print(f"✓ {messages['saved']}{plan_path}")
+        return str(plan_path)
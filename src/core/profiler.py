@@ -0,0 +1,211 @@
+"""流水线性能分析 - 按层记录CPU剖析、内存峰值和等待LLM的时间"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 报告中保留的热点函数和内存分配位置数量
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 10
+
+# 排除 tracemalloc 自身（拍摄快照）产生的分配
+_SNAPSHOT_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+# cProfile 同一时间只能有一个实例处于启用状态（多个生成器并发运行时按先到先得）
+_cpu_profiler_lock = threading.Lock()
+
+# 正在记录的阶段数和累计开始次数（用于判断阶段是否与其他生成器的阶段重叠）
+_sections_lock = threading.Lock()
+_active_sections = 0
+_section_serial = 0
+
+# 报告中说明的统计口径
+REPORT_NOTES = [
+    "cpu_profile / top_functions 包含记录期间新建的工作线程（线程池中的分段、分部、候选和退化检测等），"
+    "不包含记录开始之前已存在的线程；多个生成器并发时，工作线程可能来自其他任务",
+    "cpu 为进程级CPU时间，多个生成器并发时包含其他任务",
+    "memory_peak / top_allocations 为进程级统计，与其他生成器的阶段重叠时不记录（memory_shared 为 true）",
+]
+
+
+def _worker_profile_hook(profiles: List[cProfile.Profile]):
+    """
+    threading.setprofile 的钩子：新线程收到第一个事件时启用自己的 cProfile
+    （cProfile 只剖析启用它的线程），之后的事件由该线程的 cProfile 记录
+    """
+    def hook(frame, event, arg):
+        profile = cProfile.Profile()
+        profiles.append(profile)
+        profile.enable()
+    return hook
+
+
+class PipelineProfiler:
+    """
+    记录一次生成流程中各层的性能数据
+
+    每层记录：
+    - 墙钟时间，以及其中等待LLM响应的时间（并发调用按重叠后的时间计算）和本地处理时间
+    - cProfile CPU剖析（保存为 .prof 文件，可用 snakeviz 等工具查看）及热点函数
+    - tracemalloc 内存峰值和新增分配最多的代码位置
+
+    统计口径的限制：
+    - cProfile 只剖析启用它的线程，记录期间新建的工作线程通过 threading.setprofile 各自剖析后合并，
+      记录开始前已存在的线程不在剖析范围内；多个生成器并发时合并的工作线程可能属于其他任务
+    - CPU时间和 tracemalloc 都是进程级的：阶段与其他生成器的阶段重叠时不记录内存数据，
+      CPU时间包含其他任务
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = Path(output_dir)
+        self.sections: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._wait_started = 0.0
+        self._llm_wait = 0.0
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def llm_wait(self):
+        """包裹一次LLM请求；多个请求重叠时只计算一次等待时间"""
+        with self._lock:
+            if self._in_flight == 0:
+                self._wait_started = time.perf_counter()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                if self._in_flight == 0:
+                    self._llm_wait += time.perf_counter() - self._wait_started
+
+    def _llm_wait_total(self) -> float:
+        with self._lock:
+            pending = time.perf_counter() - self._wait_started if self._in_flight else 0.0
+            return self._llm_wait + pending
+
+    @contextmanager
+    def section(self, name: str):
+        """
+        记录一层（或一个阶段）的性能数据
+
+        Args:
+            name: 层级名称，同名阶段多次运行时累加
+        """
+        global _active_sections, _section_serial
+        with _sections_lock:
+            _active_sections += 1
+            _section_serial += 1
+            serial = _section_serial
+            overlapped = _active_sections > 1
+        cpu_profiler = cProfile.Profile() if _cpu_profiler_lock.acquire(blocking=False) else None
+        worker_profiles: List[cProfile.Profile] = []
+        tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        wait_before = self._llm_wait_total()
+        cpu_before = time.process_time()
+        start = time.perf_counter()
+        if cpu_profiler:
+            threading.setprofile(_worker_profile_hook(worker_profiles))
+            cpu_profiler.enable()
+        try:
+            yield
+        finally:
+            if cpu_profiler:
+                cpu_profiler.disable()
+                threading.setprofile(None)
+                _cpu_profiler_lock.release()
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_before
+            llm_wait = min(self._llm_wait_total() - wait_before, wall)
+            with _sections_lock:
+                overlapped = overlapped or _section_serial != serial
+                _active_sections -= 1
+            if overlapped:
+                # 进程级的内存统计包含其他生成器的分配，不记录
+                peak, allocations = None, []
+            else:
+                peak = tracemalloc.get_traced_memory()[1]
+                snapshot_after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+                allocations = [stat for stat in snapshot_after.compare_to(snapshot_before, "lineno")
+                               if stat.size_diff > 0]
+            stats = None
+            if cpu_profiler:
+                stats = pstats.Stats(cpu_profiler, stream=io.StringIO())
+                for profile in worker_profiles:
+                    stats.add(profile)
+            self._record(name, wall, cpu, llm_wait, peak, allocations, stats)
+
+    def _record(self, name: str, wall: float, cpu: float, llm_wait: float, peak: Optional[int],
+                allocations: List[tracemalloc.StatisticDiff], stats: Optional[pstats.Stats]):
+        section = self.sections.setdefault(name, {
+            "runs": 0, "wall": 0.0, "llm_wait": 0.0, "local": 0.0, "cpu": 0.0,
+            "memory_peak": 0, "memory_shared": False, "top_allocations": [], "top_functions": [],
+            "cpu_profile": None,
+        })
+        section["runs"] += 1
+        section["wall"] = round(section["wall"] + wall, 3)
+        section["llm_wait"] = round(section["llm_wait"] + llm_wait, 3)
+        section["local"] = round(section["wall"] - section["llm_wait"], 3)
+        section["cpu"] = round(section["cpu"] + cpu, 3)
+        if peak is None:
+            section["memory_shared"] = True
+        elif peak >= section["memory_peak"]:
+            section["memory_peak"] = peak
+            section["top_allocations"] = [
+                {"location": str(stat.traceback[0]), "size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in allocations[:TOP_ALLOCATIONS]
+            ]
+        if stats is None:
+            return
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        profile_path = self.output_dir / f"profile_{name}_{section['runs']}.prof"
+        stats.dump_stats(str(profile_path))
+        section["cpu_profile"] = str(profile_path)
+        section["top_functions"] = self._top_functions(stats)
+
+    @staticmethod
+    def _top_functions(stats: pstats.Stats) -> List[Dict]:
+        """按自身耗时排序的热点函数"""
+        rows = []
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{line}({function})",
+                "calls": calls,
+                "tottime": round(tottime, 4),
+                "cumtime": round(cumtime, 4),
+            })
+        rows.sort(key=lambda row: row["tottime"], reverse=True)
+        return rows[:TOP_FUNCTIONS]
+
+    def report(self) -> Dict:
+        """汇总全部阶段"""
+        wall = sum(s["wall"] for s in self.sections.values())
+        llm_wait = sum(s["llm_wait"] for s in self.sections.values())
+        return {
+            "total": {
+                "wall": round(wall, 3),
+                "llm_wait": round(llm_wait, 3),
+                "local": round(wall - llm_wait, 3),
+                "llm_wait_ratio": round(llm_wait / wall, 4) if wall else 0.0,
+            },
+            "sections": self.sections,
+            "notes": REPORT_NOTES,
+        }
+
+    def save(self) -> str:
+        """保存性能报告，返回文件路径"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        report_path = self.output_dir / "profile_report.json"
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        return str(report_path)
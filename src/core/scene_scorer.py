@@ -0,0 +1,163 @@
+"""场景候选文本的本地评分工具（不调用LLM）"""
+import re
+from typing import Dict, List
+
+# 第四层提示词要求的字数范围
+TARGET_MIN_LENGTH = 800
+TARGET_MAX_LENGTH = 1500
+
+# 各项指标在总分中的权重
+SCORE_WEIGHTS = {
+    "length": 0.3,
+    "characters": 0.25,
+    "location": 0.1,
+    "repetition": 0.2,
+    "language": 0.15,
+}
+
+_HAN_RE = re.compile(r"[一-鿿]")
+_KANA_RE = re.compile(r"[぀-ヿ]")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+_WORD_RE = re.compile(r"[A-Za-z']+")
+_NAME_SPLIT_RE = re.compile(r"\s*(?:[、,，;；/&]|\band\b|和|与|及|と)\s*")
+_PAREN_RE = re.compile(r"[（(][^）)]*[）)]")
+
+
+def count_length(text: str, language: str) -> int:
+    """按语言统计文本长度：英文按单词，中日文按非空白字符"""
+    if language == "en":
+        return len(_WORD_RE.findall(text))
+    return len(re.sub(r"\s", "", text))
+
+
+def split_names(field: str) -> List[str]:
+    """将场景的人物/地点字段拆分为名称列表，去掉括号内的说明"""
+    field = _PAREN_RE.sub("", field or "")
+    return [name.strip(" -*：:。.") for name in _NAME_SPLIT_RE.split(field) if name.strip(" -*：:。.")]
+
+
+def _length_score(length: int) -> float:
+    if length <= 0:
+        return 0.0
+    if length < TARGET_MIN_LENGTH:
+        return length / TARGET_MIN_LENGTH
+    if length > TARGET_MAX_LENGTH:
+        return TARGET_MAX_LENGTH / length
+    return 1.0
+
+
+def _name_in_text(name: str, text: str) -> bool:
+    if name in text:
+        return True
+    # 英文全名可能只以名或姓出现
+    parts = [p for p in name.split() if len(p) > 1]
+    return any(part in text for part in parts)
+
+
+def _repetition_ratio(text: str, n: int = 10) -> float:
+    """字符n-gram重复率，0表示无重复"""
+    normalized = re.sub(r"\s+", " ", text)
+    total = len(normalized) - n + 1
+    if total <= 0:
+        return 0.0
+    grams = {normalized[i:i + n] for i in range(total)}
+    return 1 - len(grams) / total
+
+
+def _language_ratio(text: str, language: str) -> float:
+    """目标语言文字在所有字母/汉字中的占比"""
+    han = len(_HAN_RE.findall(text))
+    kana = len(_KANA_RE.findall(text))
+    latin = len(_LATIN_RE.findall(text))
+    letters = han + kana + latin
+    if letters == 0:
+        return 0.0
+    if language == "en":
+        return latin / letters
+    if language == "ja":
+        ratio = (han + kana) / letters
+        # 日文正文中假名占比过低时，多半是输出成了中文
+        if han + kana and kana / (han + kana) < 0.15:
+            ratio *= 0.5
+        return ratio
+    return han / letters
+
+
+def score_scene_text(text: str, scene: Dict, language: str) -> Dict:
+    """
+    对单个场景候选文本进行本地评分
+
+    Args:
+        text: 候选场景文字
+        scene: 场景字典（使用其中的人物和地点字段）
+        language: 语言代码
+
+    Returns:
+        包含各项指标和总分（score，0~1）的字典
+    """
+    length = count_length(text, language)
+
+    names = split_names(scene.get("characters", ""))
+    if names:
+        character_coverage = sum(1 for name in names if _name_in_text(name, text)) / len(names)
+    else:
+        character_coverage = 1.0
+
+    locations = split_names(scene.get("location", ""))
+    location_hit = 1.0 if not locations or any(_name_in_text(loc, text) for loc in locations) else 0.0
+
+    repetition = _repetition_ratio(text)
+    language_ratio = _language_ratio(text, language)
+
+    metrics = {
+        "length": _length_score(length),
+        "characters": character_coverage,
+        "location": location_hit,
+        # 正常文本的n-gram重复率很低，放大后作为惩罚项
+        "repetition": max(0.0, 1 - repetition * 5),
+        "language": language_ratio,
+    }
+    score = sum(SCORE_WEIGHTS[key] * value for key, value in metrics.items())
+
+    return {
+        "score": round(score, 4),
+        "length": length,
+        "character_coverage": round(character_coverage, 4),
+        "location_hit": location_hit,
+        "repetition": round(repetition, 4),
+        "language_ratio": round(language_ratio, 4),
+    }
+
+
+# 表示高强度情感的基调关键词（用于判断场景复杂度）
+INTENSE_TONE_KEYWORDS = [
+    "高潮", "紧张", "激烈", "悲", "绝望", "愤怒", "震撼", "压抑", "决战", "生死",
+    "緊張", "激しい", "絶望", "怒り", "悲し", "決戦",
+    "climax", "tense", "intense", "desperate", "tragic", "furious", "grief", "dramatic",
+]
+
+# 表示"无冲突"的字段值
+_EMPTY_FIELD_VALUES = {"", "无", "無", "なし", "none", "n/a", "-"}
+
+
+def scene_complexity(scene: Dict) -> int:
+    """
+    根据场景分解中解析出的字段估算场景复杂度（0~4）
+
+    依据：是否存在冲突、冲突描述是否较长、情感基调是否激烈、出场人物是否较多。
+    """
+    complexity = 0
+    conflict = (scene.get("conflict") or "").strip()
+    if conflict.lower().strip("。.") not in _EMPTY_FIELD_VALUES:
+        complexity += 1
+        if len(conflict) > 40:
+            complexity += 1
+
+    tone = (scene.get("emotional_tone") or "").lower()
+    if any(keyword in tone for keyword in INTENSE_TONE_KEYWORDS):
+        complexity += 1
+
+    if len(split_names(scene.get("characters", ""))) >= 3:
+        complexity += 1
+
+    return complexity
@@ -0,0 +1,208 @@
+"""LLM调用调度器 - 多个生成器共享服务商的并发额度，按优先级和租户加权公平排队"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from src.utils.config import (
+    get_scheduler_concurrency, get_tenant_weights, get_tenant_token_quotas, get_default_tenant_quota,
+)
+
+# 优先级类别（数值越小越先调度）：交互式重新生成 > 第一至三层 > 第四层批量生成
+PRIORITY_CLASSES = {
+    "interactive": 0,
+    "normal": 1,
+    "batch": 2,
+}
+
+
+class TokenQuotaExceeded(RuntimeError):
+    """租户的token配额已用完"""
+
+
+class Ticket:
+    """一次排队中的LLM调用"""
+
+    def __init__(self, tenant: str, priority: str, cost: int, finish_tag: float):
+        self.tenant = tenant
+        self.priority = priority
+        self.cost = cost  # 排队时预估的token数（输入 + max_tokens）
+        self.finish_tag = finish_tag
+        self.enqueued = time.perf_counter()
+        self.wait = 0.0
+        self.used_tokens: Optional[int] = None
+
+    def charge(self, usage: Dict[str, int]):
+        """记录实际用量，完成后替换排队时预留的token数"""
+        self.used_tokens = usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+def _wait_stats(waits: List[float]) -> Dict:
+    if not waits:
+        return {"requests": 0, "wait_mean": 0.0, "wait_p50": 0.0, "wait_p95": 0.0, "wait_max": 0.0}
+    ordered = sorted(waits)
+    return {
+        "requests": len(ordered),
+        "wait_mean": round(sum(ordered) / len(ordered), 3),
+        "wait_p50": round(ordered[len(ordered) // 2], 3),
+        "wait_p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "wait_max": round(ordered[-1], 3),
+    }
+
+
+class LLMScheduler:
+    """
+    加权公平排队（WFQ）的LLM调用调度器
+
+    - 同时进行的调用不超过 max_concurrency（服务商的并发/速率额度）
+    - 先按优先级类别调度，同一类别内按租户的虚拟完成时间调度：
+      每次调用的虚拟完成时间 = max(全局虚拟时间, 该租户上一次的完成时间) + 预估token数 / 租户权重，
+      因此大任务排满队列时，新加入的小任务的调用仍会排在前面
+    - 租户的累计token用量（含进行中调用的预留）达到配额后，新的调用抛出 TokenQuotaExceeded
+    """
+
+    def __init__(self, max_concurrency: int, weights: Dict[str, float] = None,
+                 quotas: Dict[str, int] = None, default_quota: int = 0):
+        self.max_concurrency = max_concurrency
+        self.weights = weights or {}
+        self.quotas = quotas or {}
+        self.default_quota = default_quota
+
+        self._cond = threading.Condition()
+        self._queue: List = []  # (优先级, 虚拟完成时间, 序号, Ticket)
+        self._sequence = itertools.count()
+        self._running = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._used_tokens: Dict[str, int] = {}
+
+        # 指标
+        self._waits: Dict[str, Dict[str, List[float]]] = {"tenants": {}, "priorities": {}}
+        self._depth_samples: List[int] = []
+        self._max_depth = 0
+
+    def quota(self, tenant: str) -> int:
+        """租户的token配额，0表示不限"""
+        return self.quotas.get(tenant, self.default_quota)
+
+    @contextmanager
+    def slot(self, tenant: str, priority: str = "normal", cost: int = 1):
+        """
+        排队等待一个调用名额
+
+        Args:
+            tenant: 租户（任务）名称
+            priority: 优先级类别（interactive / normal / batch）
+            cost: 预估的token数，决定该调用在租户份额中的占用
+
+        Yields:
+            Ticket，调用完成后可通过 charge 记录实际用量
+        """
+        ticket = self._acquire(tenant, priority, max(1, cost))
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def _acquire(self, tenant: str, priority: str, cost: int) -> Ticket:
+        with self._cond:
+            quota = self.quota(tenant)
+            used = self._used_tokens.get(tenant, 0)
+            if quota and used >= quota:
+                raise TokenQuotaExceeded(f"租户 {tenant} 的token配额已用完（{used}/{quota}）")
+            self._used_tokens[tenant] = used + cost
+
+            start_tag = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+            ticket = Ticket(tenant, priority, cost, start_tag + cost / self.weights.get(tenant, 1.0))
+            self._last_finish[tenant] = ticket.finish_tag
+            heapq.heappush(self._queue, (PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES["normal"]),
+                                         ticket.finish_tag, next(self._sequence), ticket))
+            self._depth_samples.append(len(self._queue))
+            self._max_depth = max(self._max_depth, len(self._queue))
+
+            try:
+                while self._running >= self.max_concurrency or self._queue[0][3] is not ticket:
+                    self._cond.wait()
+            except BaseException:
+                # 等待被中断（例如 KeyboardInterrupt）：移出队列并退还预留，避免阻塞其余排队的调用
+                self._queue = [item for item in self._queue if item[3] is not ticket]
+                heapq.heapify(self._queue)
+                self._used_tokens[tenant] -= cost
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._queue)
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, start_tag)
+            ticket.wait = time.perf_counter() - ticket.enqueued
+            self._waits["tenants"].setdefault(tenant, []).append(ticket.wait)
+            self._waits["priorities"].setdefault(priority, []).append(ticket.wait)
+            # 仍有空闲名额时让下一个排队的调用继续
+            self._cond.notify_all()
+            return ticket
+
+    def _release(self, ticket: Ticket):
+        with self._cond:
+            self._running -= 1
+            # 用实际用量替换预留；调用失败（没有记录用量）时退还全部预留
+            used = ticket.used_tokens if ticket.used_tokens is not None else 0
+            self._used_tokens[ticket.tenant] += used - ticket.cost
+            self._cond.notify_all()
+
+    def queue_depth(self) -> Dict[str, int]:
+        """当前各优先级类别的排队数量"""
+        with self._cond:
+            depth = {name: 0 for name in PRIORITY_CLASSES}
+            for _, _, _, ticket in self._queue:
+                depth[ticket.priority] = depth.get(ticket.priority, 0) + 1
+            return depth
+
+    def stats(self, tenant: str = None) -> Dict:
+        """
+        调度指标：排队深度、等待时间（全部租户或指定租户）和token用量
+
+        Args:
+            tenant: 只返回该租户的指标，为None时返回全部租户
+        """
+        with self._cond:
+            tenants = [tenant] if tenant else sorted(self._used_tokens)
+            samples = list(self._depth_samples)
+            report = {
+                "max_concurrency": self.max_concurrency,
+                "running": self._running,
+                "queue_depth": {
+                    "max": self._max_depth,
+                    "mean_on_arrival": round(sum(samples) / len(samples), 2) if samples else 0.0,
+                },
+                "priorities": {name: _wait_stats(waits) for name, waits in self._waits["priorities"].items()},
+                "tenants": {
+                    name: {
+                        **_wait_stats(self._waits["tenants"].get(name, [])),
+                        "weight": self.weights.get(name, 1.0),
+                        "used_tokens": self._used_tokens.get(name, 0),
+                        "quota": self.quota(name),
+                    }
+                    for name in tenants
+                },
+            }
+        report["queue_depth"]["current"] = self.queue_depth()
+        return report
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """进程内所有生成器共享的调度器（首次使用时按配置创建）"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                get_scheduler_concurrency(),
+                weights=get_tenant_weights(),
+                quotas=get_tenant_token_quotas(),
+                default_quota=get_default_tenant_quota(),
+            )
+        return _scheduler
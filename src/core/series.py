@@ -0,0 +1,232 @@
+"""系列模式 - 同一世界观下的多部小说共享固定版本的世界设定（和故事大纲）"""
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from src.utils.config import get_series_dir
+from src.prompts.prompt_registry import template_hash
+from src.core.novel_generator import NovelGenerator
+
+MANIFEST_FILENAME = "manifest.json"
+LOCK_FILENAME = ".manifest.lock"
+# 持有清单锁超过该时间（秒）视为持有者已退出，强制释放
+_LOCK_STALE_SECONDS = 30
+
+# 世界设定中"角色元数据"一节的标题（## 2. ...），不共享角色时从共享设定中去掉该节
+_ROSTER_SECTION_RE = re.compile(r"^##\s*2[.．、].*?(?=^##\s*\d|\Z)", re.M | re.S)
+
+
+class SeriesSnapshot(NamedTuple):
+    """系列中某个版本的只读快照"""
+    name: str
+    version: int
+    language: str
+    world_setting: str
+    story_outline: Optional[str]
+    world_hash: str
+
+
+def _atomic_write_json(path: Path, data: Dict):
+    """先写临时文件再替换，避免并发读取到写了一半的清单"""
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Series:
+    """
+    系列（项目）
+
+    目录结构：
+        <SERIES_DIR>/<name>/manifest.json   当前固定（pinned）的版本，以及版本列表的缓存
+        <SERIES_DIR>/<name>/v001/           各版本的世界设定（和故事大纲）及 version.json，创建后只读
+
+    版本列表以各版本目录中的 version.json 为准；清单的读改写在锁文件保护下进行，
+    并发创建版本或固定版本时不会互相覆盖。
+
+    每部小说作为一个任务运行，只执行第二至四层（固定了故事大纲时只执行第三、四层），
+    并使用各自独立的中间目录，多个任务并发运行也不会互相覆盖中间文件。
+    """
+
+    def __init__(self, name: str, root: str = None):
+        self.name = name
+        self.directory = Path(root or get_series_dir()) / name
+        self.manifest_path = self.directory / MANIFEST_FILENAME
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    def load_manifest(self) -> Dict:
+        if not self.exists():
+            raise FileNotFoundError(f"系列不存在: {self.directory}，请先创建世界设定版本")
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _version_dir(self, version: int) -> Path:
+        return self.directory / f"v{version:03d}"
+
+    def _reserve_version_dir(self) -> tuple:
+        """独占创建下一个版本目录（并发创建时各自得到不同的版本号）"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        version = 1
+        while True:
+            version_dir = self._version_dir(version)
+            try:
+                version_dir.mkdir()
+                return version, version_dir
+            except FileExistsError:
+                version += 1
+
+    def create_version(self, user_input: str, language: str = None, include_roster: bool = True,
+                       outline_input: str = None, pin: bool = True) -> int:
+        """
+        生成并保存新版本的世界设定
+
+        Args:
+            user_input: 世界观需求
+            language: 语言代码，默认使用配置的语言
+            include_roster: 是否共享角色名册（世界设定中的角色元数据一节）
+            outline_input: 提供时同时生成并固定故事大纲，各任务只需运行第三、四层
+            pin: 是否将新版本设为当前固定版本
+
+        Returns:
+            新版本号
+        """
+        version, version_dir = self._reserve_version_dir()
+        generator = NovelGenerator(language=language, intermediate_dir=str(version_dir / "build"))
+
+        world_setting = generator.generate_world_building(user_input)
+        if not include_roster:
+            world_setting = _ROSTER_SECTION_RE.sub("", world_setting).strip() + "\n"
+        world_filename = generator.intermediate_filename("world_setting")
+        (version_dir / world_filename).write_text(world_setting, encoding="utf-8")
+
+        outline_filename = None
+        if outline_input:
+            story_outline = generator.generate_story_layer(outline_input, world_setting)
+            outline_filename = generator.intermediate_filename("story_outline")
+            (version_dir / outline_filename).write_text(story_outline, encoding="utf-8")
+
+        entry = {
+            "version": version,
+            "language": generator.language,
+            "world_setting": world_filename,
+            "story_outline": outline_filename,
+            "include_roster": include_roster,
+            "world_hash": template_hash(world_setting),
+            "prompt_version": generator.prompt_set.version,
+            "created_at": time.time(),
+        }
+        with open(version_dir / "version.json", "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, indent=2)
+        # 版本创建后只读，所有任务共享同一份内容
+        for path in version_dir.glob("*.txt"):
+            path.chmod(0o444)
+
+        self._update_manifest(entry, pin)
+        return version
+
+    @contextmanager
+    def _manifest_lock(self):
+        """以独占创建锁文件的方式串行化清单的读改写"""
+        lock_path = self.directory / LOCK_FILENAME
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - lock_path.stat().st_mtime > _LOCK_STALE_SECONDS:
+                        lock_path.unlink()
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            lock_path.unlink()
+
+    def _version_entries(self) -> List[Dict]:
+        """各版本目录中已完成的版本（写入了 version.json），按版本号排列"""
+        versions = []
+        for version_file in self.directory.glob("v*/version.json"):
+            with open(version_file, "r", encoding="utf-8") as f:
+                versions.append(json.load(f))
+        return sorted(versions, key=lambda v: v["version"])
+
+    def _update_manifest(self, entry: Dict, pin: bool):
+        with self._manifest_lock():
+            manifest = self.load_manifest() if self.exists() else {"name": self.name, "pinned": None}
+            manifest["versions"] = self._version_entries()
+            if pin or manifest.get("pinned") is None:
+                manifest["pinned"] = entry["version"]
+            _atomic_write_json(self.manifest_path, manifest)
+
+    def pin(self, version: int):
+        """将指定版本设为当前固定版本"""
+        self.load_manifest()
+        with self._manifest_lock():
+            versions = self._version_entries()
+            if version not in [v["version"] for v in versions]:
+                raise ValueError(f"系列 {self.name} 中不存在版本 {version}")
+            manifest = self.load_manifest()
+            manifest["versions"] = versions
+            manifest["pinned"] = version
+            _atomic_write_json(self.manifest_path, manifest)
+
+    def load(self, version: int = None) -> SeriesSnapshot:
+        """读取指定版本（默认为固定版本）的快照"""
+        manifest = self.load_manifest()
+        version = version or manifest["pinned"]
+        entry = next((v for v in self._version_entries() if v["version"] == version), None)
+        if entry is None:
+            raise ValueError(f"系列 {self.name} 中不存在版本 {version}")
+
+        version_dir = self._version_dir(version)
+        world_setting = (version_dir / entry["world_setting"]).read_text(encoding="utf-8")
+        story_outline = None
+        if entry.get("story_outline"):
+            story_outline = (version_dir / entry["story_outline"]).read_text(encoding="utf-8")
+
+        return SeriesSnapshot(self.name, version, entry["language"], world_setting,
+                              story_outline, entry["world_hash"])
+
+    def versions(self) -> List[Dict]:
+        self.load_manifest()
+        return self._version_entries()
+
+    def run_job(self, input_path: str, output_path: str = None, version: int = None,
+                job_id: str = None) -> str:
+        """
+        以固定版本的世界设定运行一部小说
+
+        Args:
+            input_path: 本书的需求文件
+            output_path: 输出路径，默认为 output/<系列>/<任务>/<按语言的文件名>
+            version: 使用的版本，默认为固定版本
+            job_id: 任务ID，决定独立的中间目录，默认为输入文件名加随机后缀
+
+        Returns:
+            完整小说文本（分片输出时为None）
+        """
+        snapshot = self.load(version)
+        job_id = job_id or f"{Path(input_path).stem}-{uuid.uuid4().hex[:8]}"
+
+        generator = NovelGenerator(
+            language=snapshot.language,
+            intermediate_dir=str(Path("intermediate") / self.name / job_id),
+        )
+        generator.use_shared_upstream(snapshot.world_setting, snapshot.story_outline,
+                                      source=f"{self.name}@v{snapshot.version}")
+        if output_path is None:
+            output_path = str(Path("output") / self.name / job_id / Path(generator.default_output_path()).name)
+
+        return generator.run(input_path=input_path, output_path=output_path)
@@ -0,0 +1,203 @@
+"""分片输出 - 正文按场景（或若干场景一组）分片保存，配合紧凑的字节偏移索引实现随机读取和单场景修补"""
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# 索引文件：文件头（魔数、版本、条目数）+ 按场景顺序排列的定长条目
+INDEX_FILENAME = "index.bin"
+INDEX_MAGIC = b"NVIX"
+INDEX_VERSION = 1
+_HEADER = struct.Struct("<4sHI")
+# 条目：场景编号、分片编号、分片内的字节偏移、字节长度
+_ENTRY = struct.Struct("<IIQI")
+
+
+class IndexEntry(NamedTuple):
+    """索引条目"""
+    scene_number: int
+    shard: int
+    offset: int  # 分片内的字节偏移
+    length: int  # 字节长度
+
+
+def shard_filename(shard: int) -> str:
+    return f"shard_{shard:05d}.txt"
+
+
+def _atomic_write(path: Path, data: bytes):
+    """先写临时文件再替换，读者不会看到写了一半的文件"""
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class ShardedNovel:
+    """
+    分片保存的小说正文
+
+    目录结构：
+    - shard_00000.txt 等：每个分片依次存放 scenes_per_shard 个场景的片段（UTF-8，与完整正文中的片段逐字节相同）
+    - index.bin：每个场景一个 20 字节的条目（场景编号、分片编号、字节偏移、字节长度）
+
+    读取时只对用到的分片做 mmap，修补单个场景时只重写该场景所在的分片和索引。
+    """
+
+    def __init__(self, directory: str, scenes_per_shard: int = 1):
+        self.directory = Path(directory)
+        self.scenes_per_shard = max(1, scenes_per_shard)
+        self._entries: Optional[List[IndexEntry]] = None
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._files = {}
+
+    # ---- 写入 ----
+
+    def write(self, segments: Iterable[Tuple[int, str]]):
+        """
+        写入全部场景（覆盖已有的分片）
+
+        Args:
+            segments: 按顺序排列的 (场景编号, 片段文本)
+        """
+        self.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries: List[IndexEntry] = []
+        shard_parts: Dict[int, List[bytes]] = {}
+        for position, (scene_number, segment) in enumerate(segments):
+            shard = position // self.scenes_per_shard
+            parts = shard_parts.setdefault(shard, [])
+            data = segment.encode("utf-8")
+            entries.append(IndexEntry(scene_number, shard, sum(len(part) for part in parts), len(data)))
+            parts.append(data)
+
+        for shard, parts in shard_parts.items():
+            _atomic_write(self.directory / shard_filename(shard), b"".join(parts))
+        # 删除场景数减少后多余的旧分片
+        for path in self.directory.glob("shard_*.txt"):
+            if int(path.stem.split("_")[1]) not in shard_parts:
+                path.unlink()
+        self._write_index(entries)
+
+    def patch(self, scene_number: int, segment: str):
+        """
+        替换单个场景的片段，只重写该场景所在的分片和索引
+
+        Raises:
+            KeyError: 索引中没有该场景
+        """
+        entries = self.entries()
+        target = next((entry for entry in entries if entry.scene_number == scene_number), None)
+        if target is None:
+            raise KeyError(f"分片索引中没有场景 {scene_number}")
+
+        shard_entries = [entry for entry in entries if entry.shard == target.shard]
+        parts = [segment.encode("utf-8") if entry is target else self._read_bytes(entry) for entry in shard_entries]
+        self.close()
+
+        offset = 0
+        updated: Dict[int, IndexEntry] = {}
+        for entry, data in zip(shard_entries, parts):
+            updated[entry.scene_number] = IndexEntry(entry.scene_number, entry.shard, offset, len(data))
+            offset += len(data)
+        _atomic_write(self.directory / shard_filename(target.shard), b"".join(parts))
+        self._write_index([updated.get(entry.scene_number, entry) if entry.shard == target.shard else entry
+                           for entry in entries])
+
+    def _write_index(self, entries: List[IndexEntry]):
+        data = bytearray(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(entries)))
+        for entry in entries:
+            data += _ENTRY.pack(*entry)
+        _atomic_write(self.directory / INDEX_FILENAME, bytes(data))
+        self._entries = entries
+
+    # ---- 读取 ----
+
+    def exists(self) -> bool:
+        return (self.directory / INDEX_FILENAME).exists()
+
+    def entries(self) -> List[IndexEntry]:
+        """按顺序排列的索引条目"""
+        if self._entries is None:
+            data = (self.directory / INDEX_FILENAME).read_bytes()
+            magic, version, count = _HEADER.unpack_from(data)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                raise ValueError(f"无法识别的分片索引: {self.directory / INDEX_FILENAME}")
+            self._entries = [IndexEntry(*values) for values in
+                             _ENTRY.iter_unpack(data[_HEADER.size:_HEADER.size + count * _ENTRY.size])]
+        return self._entries
+
+    def _shard_map(self, shard: int) -> Optional[mmap.mmap]:
+        """分片的只读内存映射（首次使用时打开，空分片返回None）"""
+        if shard not in self._maps:
+            f = open(self.directory / shard_filename(shard), "rb")
+            if os.fstat(f.fileno()).st_size == 0:
+                f.close()
+                return None
+            self._files[shard] = f
+            self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[shard]
+
+    def _read_bytes(self, entry: IndexEntry) -> bytes:
+        if not entry.length:
+            return b""
+        return self._shard_map(entry.shard)[entry.offset:entry.offset + entry.length]
+
+    def segment(self, scene_number: int) -> str:
+        """读取单个场景的片段（只映射所在的分片）"""
+        for entry in self.entries():
+            if entry.scene_number == scene_number:
+                return self._read_bytes(entry).decode("utf-8")
+        raise KeyError(f"分片索引中没有场景 {scene_number}")
+
+    def scene(self, scene_number: int) -> str:
+        """读取单个场景（含标题）"""
+        return self.segment(scene_number).strip()
+
+    def scene_range(self, start: int, end: int) -> str:
+        """读取场景编号在 [start, end] 范围内的连续正文"""
+        return "".join(self.iter_segments(start, end)).strip()
+
+    def iter_segments(self, start: int = None, end: int = None) -> Iterator[str]:
+        """按顺序逐个读取片段，可限定场景编号范围"""
+        for entry in self.entries():
+            if (start is None or entry.scene_number >= start) and (end is None or entry.scene_number <= end):
+                yield self._read_bytes(entry).decode("utf-8")
+
+    def iter_novel(self) -> Iterator[str]:
+        """流式输出完整正文，结果与一次性拼接后 strip() 相同（去掉开头和结尾的空白）"""
+        started = False
+        pending = ""  # 暂存片段末尾的空白，确认后面还有内容时才输出
+        for segment in self.iter_segments():
+            if not started:
+                segment = segment.lstrip()
+                if not segment:
+                    continue
+                started = True
+            body = segment.rstrip()
+            if not body:
+                pending += segment
+                continue
+            yield pending + body
+            pending = segment[len(body):]
+
+    def write_monolithic(self, output_path: str) -> str:
+        """以流式拼接生成完整的正文文件（不在内存中组装整部小说），返回文件路径"""
+        path = Path(output_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for chunk in self.iter_novel():
+                f.write(chunk)
+        os.replace(temp_path, path)
+        return str(path)
+
+    def close(self):
+        """关闭全部内存映射（写入分片前调用，Windows上被映射的文件无法替换）"""
+        for mapped in self._maps.values():
+            mapped.close()
+        for f in self._files.values():
+            f.close()
+        self._maps.clear()
+        self._files.clear()
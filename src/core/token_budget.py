@@ -0,0 +1,138 @@
+"""输出token预算 - 根据各层的目标长度和语言估算 max_tokens（不调用LLM）"""
+import math
+import re
+from typing import Dict, Optional, Tuple
+
+from src.core.scene_scorer import TARGET_MIN_LENGTH, TARGET_MAX_LENGTH, count_length, scene_complexity
+
+# 每个长度单位对应的token数：英文按单词，中日文按字符（主流BPE分词器的经验值，偏保守）
+TOKENS_PER_UNIT = {
+    "en": 1.4,
+    "zh": 1.2,
+    "ja": 1.3,
+}
+DEFAULT_TOKENS_PER_UNIT = 1.4
+# 不区分语言估算时使用：汉字/假名按字符，其余文本按单词
+_CJK_TOKENS_PER_CHAR = 1.25
+_LATIN_TOKENS_PER_WORD = 1.4
+
+# 第一至三层的目标长度（与第四层相同的单位），提示词中没有明确字数要求，按常见输出长度设定
+LAYER_TARGET_LENGTHS = {
+    "world_building": 2500,
+    "story_layer": 2500,
+    "scene_decomposition": 5000,
+    # 分部并行的世界构建：核心前提很短，一致性校对最多重写全部部分
+    "world_premise": 400,
+    "world_reconcile": 2500,
+}
+
+# 输出很短的调用使用固定预算（不受下面的下限约束）
+FIXED_LAYER_BUDGETS = {
+    "cascade_review": 16,
+}
+
+# 按目标长度估算的预算下限
+MIN_BUDGET = 64
+
+# 已知模型的（上下文窗口，单次输出上限），按模型名前缀匹配（取最长的前缀），上下文为None表示不检查
+MODEL_OUTPUT_LIMITS = {
+    "gpt-4": (8192, 8192),
+    "gpt-4-32k": (32768, 8192),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4-1106": (128000, 4096),
+    "gpt-4-0125": (128000, 4096),
+    "gpt-4o": (128000, 16384),
+    "gpt-4.1": (1047576, 32768),
+    "gpt-3.5-turbo": (16385, 4096),
+    "deepseek-chat": (65536, 8192),
+    "deepseek-reasoner": (65536, 32768),
+}
+# 未知模型的单次输出上限（几乎所有服务商都接受的取值）
+DEFAULT_OUTPUT_LIMIT = 4096
+# 检查上下文窗口时为输入token数的估算误差预留的余量
+_INPUT_ESTIMATE_FACTOR = 1.2
+_CONTEXT_MARGIN = 256
+
+# 截断后回退到的句末或段末位置
+_SENTENCE_END_RE = re.compile(r"[。！？!?.…」』”\"]\s*|\n\s*\n")
+_CJK_RE = re.compile(r"[一-鿿぀-ヿ]")
+_WORD_RE = re.compile(r"[A-Za-z0-9']+")
+
+
+def tokens_per_unit(language: str) -> float:
+    return TOKENS_PER_UNIT.get(language, DEFAULT_TOKENS_PER_UNIT)
+
+
+def estimate_tokens(text: str) -> int:
+    """不区分语言估算文本的token数（汉字/假名按字符，其余按单词）"""
+    cjk = len(_CJK_RE.findall(text))
+    words = len(_WORD_RE.findall(text))
+    return math.ceil(cjk * _CJK_TOKENS_PER_CHAR + words * _LATIN_TOKENS_PER_WORD)
+
+
+def estimate_output_tokens(text: str, language: str) -> int:
+    """按语言估算一段输出的token数（用于提前中止等没有返回用量的调用）"""
+    return math.ceil(count_length(text, language) * tokens_per_unit(language))
+
+
+def scene_target_length(scene: Dict) -> int:
+    """场景的预期长度：在提示词要求的字数范围内按场景复杂度（0~4）线性增长"""
+    return TARGET_MIN_LENGTH + (TARGET_MAX_LENGTH - TARGET_MIN_LENGTH) * scene_complexity(scene) // 4
+
+
+def length_budget(length: int, language: str, headroom: float) -> int:
+    """把目标长度换算为 max_tokens，并留出余量"""
+    return max(MIN_BUDGET, math.ceil(length * tokens_per_unit(language) * headroom))
+
+
+def layer_budget(layer: str, language: str, headroom: float, parts: int = 1) -> int:
+    """第一至三层及固定预算调用的 max_tokens（parts 为该层并行拆分的部分数），未知层级返回None"""
+    if layer in FIXED_LAYER_BUDGETS:
+        return FIXED_LAYER_BUDGETS[layer]
+    if layer in LAYER_TARGET_LENGTHS:
+        return length_budget(LAYER_TARGET_LENGTHS[layer] // parts, language, headroom)
+    return None
+
+
+def scene_budget(scene: Dict, language: str, headroom: float, parts: int = 1) -> int:
+    """场景（或分段并行中的一个段落）的 max_tokens"""
+    return length_budget(scene_target_length(scene) // parts, language, headroom)
+
+
+def text_budget(source_text: str, headroom: float) -> int:
+    """改写类调用（翻译、拼接处润色）的 max_tokens：按原文的token数留出余量"""
+    return max(MIN_BUDGET, math.ceil(estimate_tokens(source_text) * headroom))
+
+
+def model_output_limits(model_name: str) -> Tuple[Optional[int], int]:
+    """模型的（上下文窗口，单次输出上限），未知模型不检查上下文窗口"""
+    matches = [prefix for prefix in MODEL_OUTPUT_LIMITS if (model_name or "").startswith(prefix)]
+    if not matches:
+        return None, DEFAULT_OUTPUT_LIMIT
+    return MODEL_OUTPUT_LIMITS[max(matches, key=len)]
+
+
+def output_ceiling(model_name: str, input_tokens: int = 0, max_output_tokens: int = 0) -> int:
+    """
+    单次调用可用的 max_tokens 上限：不超过模型的输出上限，且输入加输出不超过上下文窗口
+    
+    Args:
+        model_name: 模型名称
+        input_tokens: 输入的估算token数
+        max_output_tokens: 配置的输出上限，大于0时替代模型的默认值
+    """
+    context_window, limit = model_output_limits(model_name)
+    if max_output_tokens > 0:
+        limit = max_output_tokens
+    if context_window:
+        limit = min(limit, context_window - math.ceil(input_tokens * _INPUT_ESTIMATE_FACTOR) - _CONTEXT_MARGIN)
+    return max(MIN_BUDGET, limit)
+
+
+def trim_truncated(text: str) -> str:
+    """因 max_tokens 截断的输出回退到最后一个完整的句子或段落"""
+    ends = [match.end() for match in _SENTENCE_END_RE.finditer(text)]
+    # 找不到句末或回退过多（超过一半）时保留原文
+    if not ends or ends[-1] < len(text) // 2:
+        return text
+    return text[:ends[-1]].rstrip()
@@ -1,4 +1,5 @@
 """主程序入口"""
+import argparse
 import sys
 import os
 from pathlib import Path
@@ -7,15 +8,192 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from src.core.novel_generator import NovelGenerator
-from src.utils.config import get_language
+from src.core.novel_generator import NovelGenerator, OUTPUT_FILENAMES
+from src.core.sharded_output import ShardedNovel
+from src.utils.config import get_language, get_supported_languages
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="AI Novelist")
+    parser.add_argument("--input", nargs="+", default=["input/input.txt"],
+                        help="输入文件路径，可指定多个（普通模式下在同一进程中并发生成）")
+    parser.add_argument("--batch", action="store_true",
+                        help="第四层使用离线Batch API（可断点续跑）")
+    parser.add_argument("--batch-endpoint", choices=["openai", "local"], default="openai",
+                        help="批处理端点，local 为本地文件替身（用于测试）")
+    parser.add_argument("--poll-interval", type=float, default=60,
+                        help="批处理轮询间隔（秒）")
+    parser.add_argument("--series", help="系列名称：多部小说共享固定版本的世界设定")
+    parser.add_argument("--series-init", action="store_true",
+                        help="以 --input 的第一个文件为世界观需求，为系列生成新版本的世界设定")
+    parser.add_argument("--series-outline",
+                        help="与 --series-init 一起使用：同时生成并共享故事大纲的需求文件")
+    parser.add_argument("--no-roster", action="store_true",
+                        help="与 --series-init 一起使用：不共享角色名册")
+    parser.add_argument("--series-version", type=int, help="使用的系列版本，默认为固定版本")
+    parser.add_argument("--series-pin", type=int, help="将系列的指定版本设为固定版本")
+    parser.add_argument("--job-id", help="系列任务ID（决定独立的中间目录），多个 --input 时每部小说使用 <任务ID>-<文件名>")
+    parser.add_argument("--languages", nargs="+",
+                        help="多语言模式：目标语言列表，前三层只在枢纽语言中运行一次")
+    parser.add_argument("--pivot", help="多语言模式的枢纽语言，默认使用配置的语言")
+    parser.add_argument("--profile", action="store_true",
+                        help="按层记录CPU剖析、内存峰值和等待LLM的时间，报告保存在中间目录的 profile/ 中")
+    parser.add_argument("--plan", action="store_true",
+                        help="只估算调用次数、token、成本和耗时（不调用API），可与 --input、--batch 一起使用")
+    parser.add_argument("--scenes", type=int,
+                        help="与 --plan 一起使用：目标场景数，默认使用已有的场景列表或历史运行的平均值")
+    parser.add_argument("--assemble", action="store_true",
+                        help="由分片输出（OUTPUT_SHARDED）流式拼接出完整的正文文件（不调用API）")
+    parser.add_argument("--read-scenes", type=int, nargs="+", metavar="N",
+                        help="从分片输出中读取指定场景（一个编号）或场景范围（起止两个编号），不加载其余正文")
+    parser.add_argument("--output", help="与 --assemble、--read-scenes 一起使用：正文文件路径，默认根据语言自动生成")
+    parser.add_argument("--fanout-mode", choices=["textualize", "translate"], default="textualize",
+                        help="多语言分发方式：各语言分别生成第四层，或翻译枢纽语言的正文")
+    args = parser.parse_args()
+    if args.languages and len(args.input) > 1:
+        parser.error("--languages 只支持一个 --input 文件")
+    if args.languages:
+        unknown = [code for code in args.languages if code not in get_supported_languages()]
+        if unknown:
+            parser.error(f"不支持的语言: {', '.join(unknown)}，可选: {', '.join(get_supported_languages())}")
+    return args
+
+
+def job_names(input_paths) -> list:
+    """
+    每个输入文件的任务名（决定中间目录、输出目录和批处理请求ID）
+
+    默认为文件名（不含扩展名），不同目录中的同名文件加上序号后缀，避免结果互相覆盖。
+    """
+    stems = [Path(input_path).stem for input_path in input_paths]
+    names = []
+    for i, stem in enumerate(stems):
+        name = f"{stem}-{i + 1}" if stems.count(stem) > 1 else stem
+        while name in names or (name != stem and name in stems):
+            name += "_"
+        names.append(name)
+    return names
+
+
+def run_batch(args, language: str):
+    """批处理模式：多部小说的第四层请求合并为一个批处理任务"""
+    from src.core.batch_runner import BatchRunner, BatchJob, OpenAIBatchEndpoint, LocalBatchEndpoint
+    
+    jobs = []
+    for input_path, name in zip(args.input, job_names(args.input)):
+        if len(args.input) == 1:
+            generator = NovelGenerator(language=language)
+            output_path = None
+        else:
+            # 多部小说各自使用独立的中间目录和输出目录
+            generator = NovelGenerator(language=language, intermediate_dir=f"intermediate/{name}")
+            output_path = str(Path("output") / name / Path(generator.default_output_path()).name)
+        jobs.append(BatchJob(name, generator, input_path, output_path))
+    
+    endpoint = LocalBatchEndpoint() if args.batch_endpoint == "local" else OpenAIBatchEndpoint()
+    BatchRunner(endpoint, poll_interval=args.poll_interval).run(jobs)
+
+
+def run_plan(args, language: str):
+    """运行前估算：不调用API，按模板、配置和历史运行估算本次运行"""
+    from src.core.planner import RunPlanner
+    from src.utils.file_utils import read_input_file
+    
+    planner = RunPlanner(language)
+    scenes = planner.load_scenes() if args.scenes is None else None
+    plan = planner.plan([read_input_file(path) for path in args.input], scenes=scenes,
+                        scene_count=args.scenes, batch=args.batch)
+    planner.print_plan(plan)
+    planner.save(plan)
+
+
+def run_shards(args, language: str):
+    """分片输出：按需拼接完整正文，或随机读取部分场景"""
+    output_path = args.output or f"output/{OUTPUT_FILENAMES.get(language, 'Novel.txt')}"
+    shards = ShardedNovel(str(Path(output_path).with_suffix(".shards")))
+    if not shards.exists():
+        raise FileNotFoundError(f"分片索引不存在: {shards.directory}（需启用 OUTPUT_SHARDED 生成）")
+    try:
+        if args.read_scenes:
+            start = args.read_scenes[0]
+            end = args.read_scenes[1] if len(args.read_scenes) > 1 else start
+            print(shards.scene_range(start, end))
+        if args.assemble:
+            print(f"✓ {shards.write_monolithic(output_path)}")
+    finally:
+        shards.close()
+
+
+def run_concurrent(args, language: str):
+    """多部小说在同一进程中并发生成，各自使用独立的中间目录、输出目录和调度器租户"""
+    from concurrent.futures import ThreadPoolExecutor
+    from src.core.scheduler import TokenQuotaExceeded
+    
+    def run_one(input_path: str, name: str):
+        generator = NovelGenerator(language=language, intermediate_dir=f"intermediate/{name}", tenant=name)
+        output_path = str(Path("output") / name / Path(generator.default_output_path()).name)
+        try:
+            generator.run(input_path=input_path, output_path=output_path)
+        except TokenQuotaExceeded as e:
+            print(f"警告: {e}，{name} 已停止生成")
+    
+    with ThreadPoolExecutor(max_workers=len(args.input)) as executor:
+        list(executor.map(run_one, args.input, job_names(args.input)))
+
+
+def run_series(args, language: str):
+    """系列模式：创建/固定世界设定版本，或以固定版本运行每部小说"""
+    from src.core.series import Series
+    from src.utils.file_utils import read_input_file
+    
+    series = Series(args.series)
+    if args.series_pin:
+        series.pin(args.series_pin)
+        print(f"✓ {args.series} -> v{args.series_pin}")
+        return
+    
+    if args.series_init:
+        outline_input = read_input_file(args.series_outline) if args.series_outline else None
+        version = series.create_version(
+            read_input_file(args.input[0]),
+            language=language,
+            include_roster=not args.no_roster,
+            outline_input=outline_input,
+        )
+        print(f"✓ {args.series} v{version}")
+        return
+    
+    # 多部小说时每部使用独立的任务ID，避免共享中间目录和输出目录
+    for input_path, name in zip(args.input, job_names(args.input)):
+        job_id = f"{args.job_id}-{name}" if args.job_id and len(args.input) > 1 else args.job_id
+        series.run_job(input_path, version=args.series_version, job_id=job_id)
 
 
 def main():
     """主函数"""
+    args = parse_args()
+    if args.profile:
+        # 通过配置传递，批处理、系列和多语言模式中创建的每个生成器都会启用性能分析
+        os.environ["PROFILE"] = "true"
+    
     # 获取语言设置（可以从环境变量读取，也可以作为命令行参数）
     language = get_language()
     
+    if args.plan:
+        # 只估算，不开始生成
+        run_plan(args, language)
+        return
+    
+    if args.assemble or args.read_scenes:
+        # 只读取已有的分片，不开始生成
+        try:
+            run_shards(args, language)
+        except (FileNotFoundError, KeyError, ValueError) as e:
+            print(f"文件错误: {e}")
+            sys.exit(1)
+        return
+    
     print("=" * 50)
     title_map = {
         "zh": "AI小说家 - 开始生成小说",
@@ -26,8 +204,19 @@ def main():
     print("=" * 50)
     
     try:
-        generator = NovelGenerator(language=language)
-        generator.run()
+        if args.languages:
+            from src.core.multilingual import run_multilingual
+            run_multilingual(args.input[0], args.languages, pivot_language=args.pivot or language,
+                             mode=args.fanout_mode)
+        elif args.series:
+            run_series(args, language)
+        elif args.batch:
+            run_batch(args, language)
+        elif len(args.input) > 1:
+            run_concurrent(args, language)
+        else:
+            generator = NovelGenerator(language=language)
+            generator.run(input_path=args.input[0])
         
         print("=" * 50)
         success_msg_map = {
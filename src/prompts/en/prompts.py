@@ -138,3 +138,158 @@ Please render the above scene as novel text, requirements:
 
 Please directly output the complete text content of the scene without any additional explanations or comments.
 """
+
+# Layer 4: Textualization Layer - Prefix-Cache Layout
+# Invariant parts shared by all scenes (instructions, world setting, story outline) go into the system message; per-scene parts come last
+TEXTUALIZATION_SYSTEM_PROMPT = """You are an accomplished novelist with exquisite prose. Based on all preceding layer information, render the scene into beautiful literary text.
+
+Please render the scene given by the user as novel text, requirements:
+
+1. **Prose Requirements**
+   - Smooth and elegant language, matching the emotional tone of the scene
+   - Natural and vivid dialogue, matching character personality
+   - Detailed environmental description, creating atmosphere
+
+2. **Consistency Check**
+   - Strictly follow the rules of world setting
+   - Character behavior matches their current stage character arc
+   - Maintain coherence with previous scenes
+
+3. **Detail Requirements**
+   - Pay attention to subtle character expressions and actions
+   - Show character psychology through details
+   - Use five-sense descriptions to enhance immersion
+
+4. **Structure Requirements**
+   - Scene opening should have clear scene sense
+   - Scene ending should have appropriate transition or suspense
+   - Word count approximately 800-1500 words (adjust based on scene complexity)
+
+Please directly output the complete text content of the scene without any additional explanations or comments.
+
+World Setting:
+{world_setting}
+
+Story Outline:
+{story_outline}
+"""
+
+TEXTUALIZATION_SCENE_PROMPT = """Current Scene Description:
+{scene_description}
+
+Character History/Status:
+{character_context}
+"""
+
+
+# Cascade Mode: Draft Review
+SCENE_REVIEW_PROMPT = """You are a strict fiction editor. Review whether the following scene draft needs to be rewritten by a stronger author.
+
+Scene Description:
+{scene_description}
+
+Scene Draft:
+{draft_text}
+
+Judge the draft as needing a rewrite if it has any of the following problems:
+- It does not achieve the scene goal or does not show the scene conflict
+- The emotional tone does not match the scene description
+- Characters or location are inconsistent with the scene description
+- The prose is rough, repetitive, or clearly incomplete
+
+Output a single word only: REWRITE if it needs a rewrite, otherwise KEEP.
+"""
+
+
+# Multi-language Fan-out: Scene Translation
+SCENE_TRANSLATION_PROMPT = """You are a seasoned literary translator. Translate the following novel text into English.
+
+Requirements:
+- Faithfully convey the plot, dialogue and emotional tone of the original
+- The translation should read fluently and naturally as English fiction
+- Keep character and place names consistent throughout the book
+- Preserve the paragraph structure and Markdown markup of the original (e.g. headings starting with ##)
+
+Original text:
+{source_text}
+
+Please directly output the translation without any explanations.
+"""
+
+
+# Long-scene Beat Parallelism: a single beat (combined with TEXTUALIZATION_SYSTEM_PROMPT as system message + beat message)
+SCENE_BEAT_PROMPT = """Current Scene Description:
+{scene_description}
+
+Character History/Status:
+{character_context}
+
+This scene is split into the following beats, written by several authors at the same time and then joined into the complete scene:
+{beat_plan}
+
+You are writing beat {beat_position}: {beat}
+
+Boundary requirements:
+- Begin right after this (do not repeat it): {opening_hint}
+- End right before this (do not write it yet): {closing_hint}
+
+Write approximately {beat_length} words for this beat (this length applies to this beat only and replaces the whole-scene word count in the system message). Please directly output the text of this beat without headings, beat numbers or any explanations.
+"""
+
+# Long-scene Beat Parallelism: seam smoothing
+BEAT_SEAM_PROMPT = """Below is the seam between two adjacent beats of the same scene, written by different authors.
+
+End of the previous beat:
+{previous_text}
+
+Start of the next beat:
+{next_text}
+
+Rewrite these two parts so the transition reads naturally: remove repeated content, unify tone and tense, and keep the plot, dialogue and character actions unchanged, at about the same length as the original.
+Please directly output the rewritten text without any explanations.
+"""
+
+
+# Sectioned World Building: core premise (shared by all sections)
+WORLD_PREMISE_PROMPT = """You are a professional world-building architect. Based on user requirements, first settle a short core premise; several authors will then expand the sections of the world setting from this premise at the same time.
+
+User requirements:
+{user_input}
+
+In no more than 200 words, output:
+- Genre and tone
+- The core concept of the world (magic or technology level, era)
+- Names of the main characters with a one-line role each
+- Names of the main locations
+- The central conflict of the story
+
+Every name settled here must be reused by all sections. Please directly output the core premise without any explanations.
+"""
+
+# Sectioned World Building: a single section
+WORLD_SECTION_PROMPT = """You are a professional world-building architect. The world setting is split into several sections, expanded at the same time by several authors from the same core premise.
+
+User requirements:
+{user_input}
+
+Core premise:
+{world_premise}
+
+You are responsible for this section only:
+{section}
+
+Requirements:
+- Strictly reuse the names and settings of the core premise and do not introduce anything that contradicts it
+- Begin with the heading of this section (the line starting with ##) exactly as given, and do not output any other section
+- Output in a structured and clear format
+"""
+
+# Sectioned World Building: cross-section reconciliation (run by the low-cost model)
+WORLD_RECONCILE_PROMPT = """You are a meticulous continuity editor. The sections of the world setting below were written at the same time by different authors. Check whether the sections contradict each other (e.g. character names, ages or abilities that do not fit the race/class system, inconsistent locations or rules, violations of the long-term constraints).
+
+World setting:
+{world_setting}
+
+If there are no contradictions, output a single word only: CONSISTENT.
+If there are contradictions, output only the sections that need changes: begin each with its original heading (the line starting with ##) followed by its complete revised content. Do not output sections that need no changes and do not add any explanations.
+"""
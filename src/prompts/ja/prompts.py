@@ -138,3 +138,158 @@ TEXTUALIZATION_PROMPT = """あなたは優れた文体を持つ専門的な小
 
 追加の説明やコメントなしで、シーンの完全なテキストコンテンツを直接出力してください。
 """
+
+# 第4層：文字層 - プレフィックスキャッシュ配置 (Textualization, Prefix-Cache Layout)
+# 全シーン共通の不変部分（指示、世界設定、物語概要）はシステムメッセージに、シーンごとに変わる部分は最後に配置
+TEXTUALIZATION_SYSTEM_PROMPT = """あなたは優れた文体を持つ専門的な小説家です。すべての前段階層の情報に基づいて、シーンを美しい文学的テキストにレンダリングしてください。
+
+ユーザーが提示するシーンを小説テキストとしてレンダリングしてください。要件：
+
+1. **文体要件**
+   - 流暢で優雅な言語、シーンの感情的基調に一致
+   - 自然で生き生きとした会話、キャラクターの性格に一致
+   - 詳細な環境描写、雰囲気を作り出す
+
+2. **一貫性チェック**
+   - 世界設定の規則を厳密に遵守
+   - キャラクターの行動が現在の段階のキャラクターアークと一致
+   - 以前のシーンとの連続性を維持
+
+3. **詳細要件**
+   - キャラクターの微妙な表情、行動に注意
+   - 詳細を通じてキャラクターの心理を示す
+   - 五感の描写を活用して没入感を高める
+
+4. **構造要件**
+   - シーンの開始には明確なシーン感が必要
+   - シーンの終了には適切な転換やサスペンスが必要
+   - 文字数は約800-1500文字（シーンの複雑さに応じて調整）
+
+追加の説明やコメントなしで、シーンの完全なテキストコンテンツを直接出力してください。
+
+世界設定：
+{world_setting}
+
+物語概要：
+{story_outline}
+"""
+
+TEXTUALIZATION_SCENE_PROMPT = """現在のシーン記述：
+{scene_description}
+
+キャラクターの履歴/状態：
+{character_context}
+"""
+
+
+# カスケードモード：下書きレビュー (Cascade Review)
+SCENE_REVIEW_PROMPT = """あなたは厳格な小説編集者です。以下のシーンの下書きを、より優れた作家が書き直す必要があるかどうかを審査してください。
+
+シーンの説明：
+{scene_description}
+
+シーンの下書き：
+{draft_text}
+
+下書きに以下のいずれかの問題がある場合は、書き直しが必要と判断してください：
+- シーンの目標を達成していない、またはシーンの対立が表現されていない
+- 感情的基調がシーンの説明と一致しない
+- 登場人物や場所がシーンの説明と一致しない
+- 文章が粗い、繰り返しが多い、または明らかに不完全である
+
+1単語のみ出力してください：書き直しが必要な場合は REWRITE、そうでない場合は KEEP。
+"""
+
+
+# 多言語展開：シーン翻訳 (Scene Translation)
+SCENE_TRANSLATION_PROMPT = """あなたは経験豊富な文芸翻訳家です。以下の小説テキストを日本語に翻訳してください。
+
+要件：
+- 原文の筋書き、会話、感情的基調を忠実に伝える
+- 日本語の小説として流暢で自然な訳文にする
+- 人名・地名は作品全体で統一した訳し方にする
+- 原文の段落構成と Markdown 記法（## で始まる見出しなど）を保持する
+
+原文：
+{source_text}
+
+説明を加えずに、訳文のみを直接出力してください。
+"""
+
+
+# 長いシーンの段落並列生成：単一の段落（TEXTUALIZATION_SYSTEM_PROMPT と組み合わせてシステムメッセージ + 段落メッセージ）
+SCENE_BEAT_PROMPT = """現在のシーン記述：
+{scene_description}
+
+キャラクターの履歴/状態：
+{character_context}
+
+このシーンは以下の段落に分割され、複数の作家が同時に執筆した後、完全なシーンとして結合されます：
+{beat_plan}
+
+あなたの担当は第 {beat_position} 段落です：{beat}
+
+つなぎの要件：
+- この段落はこの直後から始めてください（この部分は繰り返さない）：{opening_hint}
+- この段落はこの直前で終えてください（この部分はまだ書かない）：{closing_hint}
+
+この段落の文字数は約{beat_length}文字です（システムメッセージにあるシーン全体の文字数の指定に代わるものです）。見出し、段落番号、説明を付けずに、この段落の本文のみを直接出力してください。
+"""
+
+# 長いシーンの段落並列生成：つなぎ目の調整
+BEAT_SEAM_PROMPT = """以下は、同じシーンの隣接する2つの段落のつなぎ目で、それぞれ別の作家が書いたものです。
+
+前の段落の終わり：
+{previous_text}
+
+次の段落の始まり：
+{next_text}
+
+この2つの部分を書き直し、自然で滑らかにつながるようにしてください：重複する内容を削除し、語調と時制を統一し、筋書き・会話・人物の行動は変えず、分量は原文と同程度にしてください。
+説明を加えずに、書き直した文章のみを直接出力してください。
+"""
+
+
+# セクション並列の世界構築：核心前提（全セクションで共有）
+WORLD_PREMISE_PROMPT = """あなたは専門的な世界観構築者です。ユーザーの要件に基づいて、まず短い核心前提を決めてください。その後、世界設定の各セクションは複数の作家がこの前提に基づいて同時に展開します。
+
+ユーザーの要件：
+{user_input}
+
+400文字以内で以下を出力してください：
+- ジャンルと基調
+- 世界の核心概念（魔法や科学技術のレベル、時代背景）
+- 主要キャラクターの名前と一言での役割
+- 主要な場所の名前
+- 物語の核心的な対立
+
+ここで決めた名前は、後続のすべてのセクションで必ずそのまま使われます。説明を加えずに、核心前提のみを直接出力してください。
+"""
+
+# セクション並列の世界構築：単一のセクション
+WORLD_SECTION_PROMPT = """あなたは専門的な世界観構築者です。世界設定は複数のセクションに分割され、複数の作家が同じ核心前提に基づいて同時に展開します。
+
+ユーザーの要件：
+{user_input}
+
+核心前提：
+{world_premise}
+
+あなたの担当は以下のセクションのみです：
+{section}
+
+要件：
+- 核心前提の名前と設定を厳密に引き継ぎ、それと矛盾する内容を加えない
+- このセクションの見出し（## で始まる行）をそのまま先頭に置き、他のセクションは出力しない
+- 構造化され、明確な形式で出力する
+"""
+
+# セクション並列の世界構築：セクション間の整合性校正（低コストモデルが実行）
+WORLD_RECONCILE_PROMPT = """あなたは厳密な設定校正者です。以下の世界設定の各セクションは、異なる作家が同時に執筆したものです。セクション間に矛盾がないか確認してください（例：キャラクターの名前・年齢・能力が種族/職業システムと合わない、場所や規則が一致しない、長期的な制約に反している）。
+
+世界設定：
+{world_setting}
+
+矛盾がない場合は、1単語のみ出力してください：CONSISTENT。
+矛盾がある場合は、修正が必要なセクションのみを出力してください：各セクションは元の見出し（## で始まる行）から始め、修正後の完全な内容を記載してください。修正不要なセクションや説明は出力しないでください。
+"""
@@ -1,8 +1,7 @@
 """提示词加载器"""
-import importlib
-from pathlib import Path
 from typing import NamedTuple
-from src.utils.config import get_language, SUPPORTED_LANGUAGES, DEFAULT_LANGUAGE
+from src.utils.config import get_language, get_supported_languages, DEFAULT_LANGUAGE
+from src.prompts.prompt_registry import get_prompt_registry, CompiledPromptSet
 
 
 class Prompts(NamedTuple):
@@ -11,6 +10,38 @@ class Prompts(NamedTuple):
     story_layer: str
     scene_decomposition: str
     textualization: str
+    textualization_system: str
+    textualization_scene: str
+    scene_review: str
+    scene_translation: str
+    scene_beat: str
+    beat_seam: str
+    world_premise: str
+    world_section: str
+    world_reconcile: str
+
+
+def load_compiled_prompts(language: str = None) -> CompiledPromptSet:
+    """
+    根据语言加载编译后的提示词模板（每种语言在进程内只编译一次）
+    
+    Args:
+        language: 语言代码 (zh, en, ja等)，如果为None则使用配置的语言
+    
+    Returns:
+        CompiledPromptSet: 编译后的模板集合，包含每个模板的内容哈希
+    
+    Raises:
+        ValueError: 如果找不到提示词或模板变量校验失败
+    """
+    if language is None:
+        language = get_language()
+    
+    if language not in get_supported_languages():
+        print(f"警告: 不支持的语言 '{language}'，使用默认语言 '{DEFAULT_LANGUAGE}'")
+        language = DEFAULT_LANGUAGE
+    
+    return get_prompt_registry().get(language)
 
 
 def load_prompts(language: str = None) -> Prompts:
@@ -26,34 +57,14 @@ def load_prompts(language: str = None) -> Prompts:
         - story_layer: 故事层提示词
         - scene_decomposition: 场景层提示词
         - textualization: 文字层提示词
+        - textualization_system / textualization_scene: 文字层前缀缓存布局的系统消息与场景消息
+        - scene_review: 级联模式的草稿评审提示词
+        - scene_translation: 多语言分发的场景翻译提示词
+        - scene_beat / beat_seam: 长场景分段并行的段落提示词与拼接处润色提示词
+        - world_premise / world_section / world_reconcile: 分部并行世界构建的核心前提、单个部分与一致性校对提示词
     
     Raises:
         ValueError: 如果语言不支持或找不到提示词模块
     """
-    if language is None:
-        language = get_language()
-    
-    if language not in SUPPORTED_LANGUAGES:
-        print(f"警告: 不支持的语言 '{language}'，使用默认语言 '{DEFAULT_LANGUAGE}'")
-        language = DEFAULT_LANGUAGE
-    
-    # 动态导入对应语言的提示词模块
-    try:
-        prompt_module = importlib.import_module(f"src.prompts.{language}.prompts")
-        
-        return Prompts(
-            world_building=prompt_module.WORLD_BUILDING_PROMPT,
-            story_layer=prompt_module.STORY_LAYER_PROMPT,
-            scene_decomposition=prompt_module.SCENE_DECOMPOSITION_PROMPT,
-            textualization=prompt_module.TEXTUALIZATION_PROMPT
-        )
-    except ImportError as e:
-        raise ValueError(
-            f"无法加载语言 '{language}' 的提示词: {e}. "
-            f"请确保 src/prompts/{language}/prompts.py 文件存在。"
-        )
-    except AttributeError as e:
-        raise ValueError(
-            f"提示词模块缺少必需的提示词模板: {e}. "
-            f"请确保 src/prompts/{language}/prompts.py 包含所有四层提示词。"
-        )
\ No newline at end of file
+    compiled = load_compiled_prompts(language)
+    return Prompts(**{name: compiled.text(name) for name in Prompts._fields})
@@ -0,0 +1,194 @@
+"""编译后的提示词注册表 - 每种语言的模板在进程内只编译一次"""
+import hashlib
+import importlib
+import threading
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from src.utils.config import get_prompts_dir
+
+# 模板名称 -> (提示词模块中的变量名, 必需的模板变量)
+TEMPLATE_SPECS = {
+    "world_building": ("WORLD_BUILDING_PROMPT", {"user_input"}),
+    "story_layer": ("STORY_LAYER_PROMPT", {"world_setting", "user_input"}),
+    "scene_decomposition": ("SCENE_DECOMPOSITION_PROMPT", {"world_setting", "story_outline"}),
+    "textualization": ("TEXTUALIZATION_PROMPT",
+                       {"world_setting", "story_context", "scene_description", "character_context"}),
+    "textualization_system": ("TEXTUALIZATION_SYSTEM_PROMPT", {"world_setting", "story_outline"}),
+    "textualization_scene": ("TEXTUALIZATION_SCENE_PROMPT", {"scene_description", "character_context"}),
+    "scene_review": ("SCENE_REVIEW_PROMPT", {"scene_description", "draft_text"}),
+    "scene_translation": ("SCENE_TRANSLATION_PROMPT", {"source_text"}),
+    "scene_beat": ("SCENE_BEAT_PROMPT", {"scene_description", "character_context", "beat_plan", "beat_position",
+                                         "beat", "opening_hint", "closing_hint", "beat_length"}),
+    "beat_seam": ("BEAT_SEAM_PROMPT", {"previous_text", "next_text"}),
+    "world_premise": ("WORLD_PREMISE_PROMPT", {"user_input"}),
+    "world_section": ("WORLD_SECTION_PROMPT", {"user_input", "world_premise", "section"}),
+    "world_reconcile": ("WORLD_RECONCILE_PROMPT", {"world_setting"}),
+}
+
+# 目录中的新语言缺少某个模板时，回退到该语言的内置模板
+FALLBACK_LANGUAGE = "en"
+
+
+def template_hash(text: str) -> str:
+    """模板内容的稳定哈希（sha256前16位），模板修改后哈希随之变化"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class CompiledPrompt(NamedTuple):
+    """编译后的单个提示词模板"""
+    name: str
+    text: str
+    template: ChatPromptTemplate
+    hash: str
+    source: str  # 模板来源：内置模块或覆盖文件路径
+
+
+class CompiledPromptSet:
+    """一种语言的全部编译后模板"""
+
+    def __init__(self, language: str, prompts: Dict[str, CompiledPrompt]):
+        self.language = language
+        self._prompts = prompts
+        # 前缀缓存布局的系统消息 + 场景消息
+        self._prefix_cache_template = ChatPromptTemplate.from_messages([
+            ("system", prompts["textualization_system"].text),
+            ("human", prompts["textualization_scene"].text),
+        ])
+        # 分段并行的系统消息 + 段落消息（同一场景的各段落共享系统消息前缀）
+        self._beat_template = ChatPromptTemplate.from_messages([
+            ("system", prompts["textualization_system"].text),
+            ("human", prompts["scene_beat"].text),
+        ])
+
+    def __getitem__(self, name: str) -> CompiledPrompt:
+        return self._prompts[name]
+
+    def template(self, name: str) -> ChatPromptTemplate:
+        """获取编译后的模板"""
+        return self._prompts[name].template
+
+    def text(self, name: str) -> str:
+        """获取模板原文"""
+        return self._prompts[name].text
+
+    @property
+    def prefix_cache_template(self) -> ChatPromptTemplate:
+        """第四层前缀缓存布局的消息模板"""
+        return self._prefix_cache_template
+
+    @property
+    def beat_template(self) -> ChatPromptTemplate:
+        """第四层分段并行的段落消息模板"""
+        return self._beat_template
+
+    def hashes(self) -> Dict[str, str]:
+        """各模板的内容哈希，用于缓存键和运行清单"""
+        return {name: prompt.hash for name, prompt in self._prompts.items()}
+
+    @property
+    def version(self) -> str:
+        """整套模板的版本哈希"""
+        return template_hash("\n".join(f"{name}:{h}" for name, h in sorted(self.hashes().items())))
+
+
+class PromptRegistry:
+    """
+    提示词注册表
+
+    首次请求某种语言时导入 src/prompts/<language>/prompts.py，应用覆盖目录中的模板，
+    校验每个模板的变量并编译为 ChatPromptTemplate，之后在进程内复用。
+
+    覆盖目录（PROMPTS_DIR）的结构为 <dir>/<language>/<模板名称>.txt，例如
+    prompts_custom/en/textualization.txt；目录中新增的语言无需修改代码即可使用。
+    """
+
+    def __init__(self, prompts_dir: Optional[str] = None):
+        self.prompts_dir = Path(prompts_dir) if prompts_dir else None
+        self._compiled: Dict[str, CompiledPromptSet] = {}
+        self._lock = threading.Lock()
+
+    def get(self, language: str) -> CompiledPromptSet:
+        """获取指定语言的编译后模板（线程安全，每种语言只编译一次）"""
+        with self._lock:
+            if language not in self._compiled:
+                self._compiled[language] = self._compile(language)
+            return self._compiled[language]
+
+    def _load_builtin(self, language: str) -> Dict[str, tuple]:
+        """读取内置提示词模块，返回 模板名称 -> (原文, 来源)"""
+        try:
+            prompt_module = importlib.import_module(f"src.prompts.{language}.prompts")
+        except ImportError:
+            return {}
+
+        texts = {}
+        for name, (attribute, _) in TEMPLATE_SPECS.items():
+            if hasattr(prompt_module, attribute):
+                texts[name] = (getattr(prompt_module, attribute), f"src.prompts.{language}.prompts.{attribute}")
+        return texts
+
+    def _load_overrides(self, language: str) -> Dict[str, tuple]:
+        """读取覆盖目录中的模板文件"""
+        if not self.prompts_dir:
+            return {}
+        language_dir = self.prompts_dir / language
+        texts = {}
+        for name in TEMPLATE_SPECS:
+            path = language_dir / f"{name}.txt"
+            if path.exists():
+                texts[name] = (path.read_text(encoding="utf-8"), str(path))
+        return texts
+
+    def _compile(self, language: str) -> CompiledPromptSet:
+        texts = self._load_builtin(language)
+        texts.update(self._load_overrides(language))
+        if not texts:
+            raise ValueError(
+                f"无法加载语言 '{language}' 的提示词. "
+                f"请确保 src/prompts/{language}/prompts.py 文件存在，或在提示词覆盖目录中提供 {language}/ 子目录。"
+            )
+
+        missing = [name for name in TEMPLATE_SPECS if name not in texts]
+        if missing and language != FALLBACK_LANGUAGE:
+            print(f"警告: 语言 '{language}' 缺少提示词模板 {missing}，使用 '{FALLBACK_LANGUAGE}' 的模板")
+            fallback = self._get_while_locked(FALLBACK_LANGUAGE)
+            for name in missing:
+                texts[name] = (fallback[name].text, fallback[name].source)
+        elif missing:
+            raise ValueError(f"提示词模块缺少必需的提示词模板: {missing}")
+
+        prompts = {}
+        for name, (_, required) in TEMPLATE_SPECS.items():
+            text, source = texts[name]
+            template = ChatPromptTemplate.from_template(text)
+            variables = set(template.input_variables)
+            if variables != required:
+                raise ValueError(
+                    f"提示词模板 {source} 的变量不正确: 缺少 {sorted(required - variables)}，"
+                    f"多余 {sorted(variables - required)}"
+                )
+            prompts[name] = CompiledPrompt(name, text, template, template_hash(text), source)
+
+        return CompiledPromptSet(language, prompts)
+
+    def _get_while_locked(self, language: str) -> CompiledPromptSet:
+        """在已持有锁的编译过程中获取另一种语言的模板（用于回退）"""
+        if language not in self._compiled:
+            self._compiled[language] = self._compile(language)
+        return self._compiled[language]
+
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """获取进程内共享的提示词注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry(get_prompts_dir())
+        return _registry
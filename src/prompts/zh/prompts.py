@@ -138,3 +138,158 @@ TEXTUALIZATION_PROMPT = """你是一位文笔精湛的小说家。基于所有
 
 请直接输出场景的完整文字内容，不要添加额外的说明或注释。
 """
+
+# 第四层：文字层 - 前缀缓存布局 (Textualization, Prefix-Cache Layout)
+# 所有场景共享的不变部分（指令、世界设定、故事大纲）放在系统消息中，逐场景变化的部分放在最后
+TEXTUALIZATION_SYSTEM_PROMPT = """你是一位文笔精湛的小说家。基于所有前置层级的信息，将场景渲染为优美的文学文本。
+
+请将用户给出的场景渲染为小说正文，要求：
+
+1. **文笔要求**
+   - 语言流畅优美，符合场景的情感基调
+   - 对话自然生动，符合角色性格
+   - 环境描写细腻，营造氛围
+
+2. **一致性检查**
+   - 严格遵守世界设定的规则
+   - 角色行为符合其当前阶段的人物弧光
+   - 保持与之前场景的连贯性
+
+3. **细节要求**
+   - 注意角色的细微表情、动作
+   - 通过细节展现人物心理
+   - 运用五感描写增强沉浸感
+
+4. **结构要求**
+   - 场景开篇要有明确的场景感
+   - 场景结尾要有适当的过渡或悬念
+   - 字数约800-1500字（根据场景复杂度调整）
+
+请直接输出场景的完整文字内容，不要添加额外的说明或注释。
+
+世界设定：
+{world_setting}
+
+故事大纲：
+{story_outline}
+"""
+
+TEXTUALIZATION_SCENE_PROMPT = """当前场景描述：
+{scene_description}
+
+角色历史/状态：
+{character_context}
+"""
+
+
+# 级联模式：草稿评审 (Cascade Review)
+SCENE_REVIEW_PROMPT = """你是一位严格的小说编辑。请评审以下场景草稿是否需要由更强的作者重写。
+
+场景描述：
+{scene_description}
+
+场景草稿：
+{draft_text}
+
+如果草稿存在以下任一问题，请判定为需要重写：
+- 未完成场景目标或没有体现场景冲突
+- 情感基调与场景描述不符
+- 人物、地点与场景描述不一致
+- 文笔粗糙、重复或明显不完整
+
+只输出一个单词：需要重写时输出 REWRITE，否则输出 KEEP。
+"""
+
+
+# 多语言分发：场景翻译 (Scene Translation)
+SCENE_TRANSLATION_PROMPT = """你是一位资深的文学翻译家。请将以下小说文本翻译为中文。
+
+要求：
+- 忠实传达原文的情节、对话和情感基调
+- 译文流畅自然，符合中文小说的表达习惯
+- 人名、地名在全书中保持统一的译法
+- 保留原文的段落结构和 Markdown 标记（例如以 ## 开头的标题）
+
+原文：
+{source_text}
+
+请直接输出译文，不要添加任何说明。
+"""
+
+
+# 长场景分段并行：单个段落（与 TEXTUALIZATION_SYSTEM_PROMPT 组成系统消息 + 段落消息）
+SCENE_BEAT_PROMPT = """当前场景描述：
+{scene_description}
+
+角色历史/状态：
+{character_context}
+
+本场景被拆分为以下几个段落，由多位作者同时写作，最后拼接为完整场景：
+{beat_plan}
+
+你负责第 {beat_position} 段：{beat}
+
+衔接要求：
+- 本段紧接在这之后开始（不要重复这部分内容）：{opening_hint}
+- 本段在这之前结束（不要提前写这部分内容）：{closing_hint}
+
+本段字数约{beat_length}字（这是本段的字数要求，取代系统消息中整个场景的字数要求）。请直接输出本段的正文，不要添加标题、段落编号或任何说明。
+"""
+
+# 长场景分段并行：拼接处润色
+BEAT_SEAM_PROMPT = """以下是同一场景中相邻两个段落的衔接处，分别由不同作者写成。
+
+前一段结尾：
+{previous_text}
+
+后一段开头：
+{next_text}
+
+请改写这两部分，使过渡自然流畅：删除重复的内容，统一语气和时态，保持情节、对话和人物动作不变，篇幅与原文相当。
+请直接输出改写后的文字，不要添加任何说明。
+"""
+
+
+# 分部并行的世界构建：核心前提（各部分共享）
+WORLD_PREMISE_PROMPT = """你是一位专业的世界观构建师。请根据用户需求，先确定一个简短的核心前提，之后世界设定的各个部分将由多位作者基于这份前提同时展开。
+
+用户需求：
+{user_input}
+
+请用300字以内输出：
+- 类型与基调
+- 世界的核心概念（魔法或科技水平、时代背景）
+- 主要人物的姓名及一句话定位
+- 主要地点的名称
+- 故事的核心冲突
+
+所有名称一经确定，后续各部分都必须沿用。请直接输出核心前提，不要添加任何说明。
+"""
+
+# 分部并行的世界构建：单个部分
+WORLD_SECTION_PROMPT = """你是一位专业的世界观构建师。世界设定被拆分为多个部分，由多位作者基于同一份核心前提同时展开。
+
+用户需求：
+{user_input}
+
+核心前提：
+{world_premise}
+
+你只负责以下这一部分：
+{section}
+
+要求：
+- 严格沿用核心前提中的名称和设定，不要引入与之矛盾的内容
+- 以上面这一部分的标题（## 开头的一行）原样开头，不要输出其他部分
+- 以结构化、清晰的格式输出
+"""
+
+# 分部并行的世界构建：跨部分一致性校对（由低成本模型执行）
+WORLD_RECONCILE_PROMPT = """你是一位严谨的设定校对。以下世界设定的各个部分由不同作者同时写成，请检查部分之间是否存在矛盾（例如人物姓名、年龄、能力与种族/职业体系不符，地点或规则前后不一致，违反长期约束）。
+
+世界设定：
+{world_setting}
+
+如果没有矛盾，只输出一个单词：CONSISTENT。
+如果存在矛盾，只输出需要修改的部分：每个部分以原标题（## 开头的一行）开头，给出修改后的完整内容，不要输出无需修改的部分，也不要添加任何说明。
+"""
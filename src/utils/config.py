@@ -1,4 +1,5 @@
 """配置管理工具"""
+import json
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -11,10 +12,27 @@ SUPPORTED_LANGUAGES = ["zh", "en", "ja"]
 DEFAULT_LANGUAGE = "zh"
 
 
+def get_prompts_dir():
+    """获取提示词覆盖目录（PROMPTS_DIR），未配置时返回None"""
+    return os.getenv("PROMPTS_DIR") or None
+
+
+def get_supported_languages() -> list:
+    """获取支持的语言：内置语言加上提示词覆盖目录中的语言子目录"""
+    languages = list(SUPPORTED_LANGUAGES)
+    prompts_dir = get_prompts_dir()
+    if prompts_dir and Path(prompts_dir).is_dir():
+        languages.extend(
+            path.name for path in sorted(Path(prompts_dir).iterdir())
+            if path.is_dir() and path.name not in languages
+        )
+    return languages
+
+
 def get_language() -> str:
     """获取语言设置，默认为中文"""
     language = os.getenv("LANGUAGE", DEFAULT_LANGUAGE).lower()
-    if language not in SUPPORTED_LANGUAGES:
+    if language not in get_supported_languages():
         print(f"警告: 不支持的语言 '{language}'，使用默认语言 '{DEFAULT_LANGUAGE}'")
         language = DEFAULT_LANGUAGE
     return language
@@ -49,3 +67,285 @@ def get_model_name() -> str:
     elif os.getenv("DEEPSEEK_API_KEY"):
         return os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
     return "gpt-4"
+
+
+# 常见模型的默认价格（美元 / 百万token：输入、输出、缓存命中输入），可通过 MODEL_PRICES 覆盖
+DEFAULT_MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0, 1.25),
+    "gpt-4o-mini": (0.15, 0.6, 0.075),
+    "deepseek-chat": (0.27, 1.1, 0.07),
+    "deepseek-reasoner": (0.55, 2.19, 0.14),
+}
+
+
+def _get_int(name: str, default: int) -> int:
+    """读取整数类型的环境变量，无效时使用默认值"""
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        print(f"警告: {name} 不是有效整数，使用默认值 {default}")
+        return default
+
+
+def _get_float(name: str, default: float) -> float:
+    """读取浮点类型的环境变量，无效时使用默认值"""
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        print(f"警告: {name} 不是有效数字，使用默认值 {default}")
+        return default
+
+
+def _get_bool(name: str, default: bool = False) -> bool:
+    """读取布尔类型的环境变量（true/1/yes/on 为真）"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("true", "1", "yes", "on")
+
+
+def get_scene_candidates() -> int:
+    """获取每个场景生成的候选数量，默认为1（不生成多候选）"""
+    return max(1, _get_int("SCENE_CANDIDATES", 1))
+
+
+def get_candidate_mode() -> str:
+    """
+    获取多候选的请求方式
+    - n: 单次请求中使用 n 参数返回多个候选（OpenAI支持）
+    - concurrent: 并发发起多个请求（适用于不支持 n 参数的服务商）
+    """
+    mode = os.getenv("SCENE_CANDIDATE_MODE", "n").lower()
+    if mode not in ("n", "concurrent"):
+        print(f"警告: 不支持的候选模式 '{mode}'，使用默认模式 'n'")
+        mode = "n"
+    return mode
+
+
+def get_model_prices() -> dict:
+    """
+    获取模型价格表，MODEL_PRICES 为JSON格式，例如 {"gpt-4o": [2.5, 10]}
+    
+    可选的第三个价格为缓存命中输入的价格，例如 {"gpt-4o": [2.5, 10, 1.25]}
+    """
+    prices = dict(DEFAULT_MODEL_PRICES)
+    custom = os.getenv("MODEL_PRICES")
+    if custom:
+        try:
+            prices.update({model: tuple(price) for model, price in json.loads(custom).items()})
+        except (ValueError, TypeError, AttributeError):
+            print("警告: MODEL_PRICES 不是有效的JSON价格表，使用默认价格")
+    return prices
+
+
+def is_cascade_enabled() -> bool:
+    """是否启用第四层的草稿-精修级联模式"""
+    return _get_bool("CASCADE_MODE", False)
+
+
+def get_draft_model_name() -> str:
+    """获取级联模式中用于起草的低成本模型名称"""
+    draft_model = os.getenv("DRAFT_MODEL")
+    if draft_model:
+        return draft_model
+    if os.getenv("OPENAI_API_KEY"):
+        return "gpt-4o-mini"
+    return "deepseek-chat"
+
+
+def get_cascade_judge() -> str:
+    """
+    获取级联模式中判断场景是否需要精修的方式
+    - heuristic: 本地启发式（冲突、情感基调和草稿评分）
+    - llm: 额外使用低成本模型进行一次评审
+    """
+    judge = os.getenv("CASCADE_JUDGE", "heuristic").lower()
+    if judge not in ("heuristic", "llm"):
+        print(f"警告: 不支持的评审方式 '{judge}'，使用默认方式 'heuristic'")
+        judge = "heuristic"
+    return judge
+
+
+def get_cascade_thresholds() -> tuple:
+    """获取级联模式的阈值：(复杂度阈值, 草稿最低评分)"""
+    return _get_int("CASCADE_COMPLEXITY_THRESHOLD", 2), _get_float("CASCADE_MIN_SCORE", 0.75)
+
+
+def get_prompt_layout() -> str:
+    """
+    获取第四层提示词布局
+    - classic: 使用单条 TEXTUALIZATION_PROMPT
+    - prefix_cache: 不变部分放在系统消息前缀中，便于服务商的自动前缀缓存命中
+    """
+    layout = os.getenv("PROMPT_LAYOUT", "classic").lower()
+    if layout not in ("classic", "prefix_cache"):
+        print(f"警告: 不支持的提示词布局 '{layout}'，使用默认布局 'classic'")
+        layout = "classic"
+    return layout
+
+
+def get_series_dir() -> str:
+    """获取系列（共享世界设定）的存储目录"""
+    return os.getenv("SERIES_DIR", "series")
+
+
+def get_fanout_concurrency() -> int:
+    """获取多语言分发时每种语言内并发翻译场景的最大数量"""
+    return max(1, _get_int("FANOUT_CONCURRENCY", 4))
+
+
+def is_consistency_check_enabled() -> bool:
+    """是否在第四层生成后使用本地一致性检查（不额外调用LLM）"""
+    return _get_bool("CONSISTENCY_CHECK", False)
+
+
+def get_consistency_max_retries() -> int:
+    """获取一致性检查未通过的场景最多自动重新生成的次数"""
+    return max(0, _get_int("CONSISTENCY_MAX_RETRIES", 1))
+
+
+def is_profiling_enabled() -> bool:
+    """是否记录各层的CPU剖析、内存峰值和等待LLM的时间（命令行参数 --profile 等同于 PROFILE=true）"""
+    return _get_bool("PROFILE", False)
+
+
+def is_beat_parallel_enabled() -> bool:
+    """是否把复杂的长场景拆分为多个段落并发生成"""
+    return _get_bool("BEAT_PARALLEL", False)
+
+
+def get_beat_settings() -> tuple:
+    """获取分段并行的设置：(场景复杂度阈值, 最多段落数)"""
+    return _get_int("BEAT_MIN_COMPLEXITY", 2), max(2, _get_int("BEAT_MAX_COUNT", 4))
+
+
+def get_beat_smoothing() -> str:
+    """
+    获取分段拼接处的润色方式
+    - local: 本地去除标题和拼接处的重复段落，不额外调用LLM
+    - llm: 额外由低成本模型（DRAFT_MODEL）并发改写每个拼接处
+    """
+    smoothing = os.getenv("BEAT_SMOOTHING", "local").lower()
+    if smoothing not in ("local", "llm"):
+        print(f"警告: 不支持的润色方式 '{smoothing}'，使用默认方式 'local'")
+        smoothing = "local"
+    return smoothing
+
+
+def is_degeneration_detection_enabled() -> bool:
+    """是否以流式方式调用LLM，并在线检测重复、语言漂移和超长（检测到时提前中止）"""
+    return _get_bool("DEGENERATION_DETECTION", False)
+
+
+def get_degeneration_action() -> str:
+    """
+    获取检测到退化后的处理方式
+    - retry: 重新生成（最多 DEGENERATION_MAX_RETRIES 次），仍失败时保留退化之前的内容
+    - continue: 直接保留退化之前的内容，继续后续流程
+    """
+    action = os.getenv("DEGENERATION_ACTION", "retry").lower()
+    if action not in ("retry", "continue"):
+        print(f"警告: 不支持的处理方式 '{action}'，使用默认方式 'retry'")
+        action = "retry"
+    return action
+
+
+def get_degeneration_max_retries() -> int:
+    """获取检测到退化后最多重新生成的次数"""
+    return max(0, _get_int("DEGENERATION_MAX_RETRIES", 1))
+
+
+def get_degeneration_thresholds() -> tuple:
+    """获取退化检测的阈值：(重复率, 目标语言最低占比, 超过目标长度的倍数)"""
+    return (_get_float("DEGENERATION_REPETITION", 0.5),
+            _get_float("DEGENERATION_LANGUAGE", 0.5),
+            _get_float("DEGENERATION_OVERSHOOT", 2.0))
+
+
+def is_token_budget_enabled() -> bool:
+    """是否按层和场景为每次LLM调用设置 max_tokens（根据目标长度和语言估算）"""
+    return _get_bool("TOKEN_BUDGET", True)
+
+
+def get_token_budget_headroom() -> float:
+    """获取 max_tokens 相对目标长度的余量倍数"""
+    return max(1.0, _get_float("TOKEN_BUDGET_HEADROOM", 2.0))
+
+
+def get_max_output_tokens() -> int:
+    """获取单次调用的 max_tokens 上限（0为使用已知模型的默认上限）"""
+    return max(0, _get_int("MAX_OUTPUT_TOKENS", 0))
+
+
+def is_scheduler_enabled() -> bool:
+    """是否让进程内所有生成器的LLM调用经过共享的加权公平调度器"""
+    return _get_bool("SCHEDULER", False)
+
+
+def get_scheduler_concurrency() -> int:
+    """获取调度器允许同时进行的LLM调用数量（服务商的并发额度）"""
+    return max(1, _get_int("SCHEDULER_CONCURRENCY", 8))
+
+
+def _get_json_map(name: str, value_type) -> dict:
+    """读取JSON格式的 {名称: 数值} 环境变量，无效时返回空字典"""
+    custom = os.getenv(name)
+    if not custom:
+        return {}
+    try:
+        return {key: value_type(value) for key, value in json.loads(custom).items()}
+    except (ValueError, TypeError, AttributeError):
+        print(f"警告: {name} 不是有效的JSON映射，已忽略")
+        return {}
+
+
+def get_tenant_weights() -> dict:
+    """获取租户权重，TENANT_WEIGHTS 为JSON格式，例如 {"book1": 2}，未配置的租户权重为1"""
+    return {tenant: weight for tenant, weight in _get_json_map("TENANT_WEIGHTS", float).items() if weight > 0}
+
+
+def get_tenant_token_quotas() -> dict:
+    """获取各租户的token配额，TENANT_TOKEN_QUOTAS 为JSON格式，例如 {"book1": 500000}"""
+    return _get_json_map("TENANT_TOKEN_QUOTAS", int)
+
+
+def get_default_tenant_quota() -> int:
+    """获取未单独配置的租户的token配额，0表示不限"""
+    return max(0, _get_int("TENANT_TOKEN_QUOTA", 0))
+
+
+def is_world_sections_enabled() -> bool:
+    """是否先生成核心前提，再并发生成世界设定的各个部分"""
+    return _get_bool("WORLD_SECTIONS", False)
+
+
+def is_world_reconcile_enabled() -> bool:
+    """分部并行的世界构建完成后，是否由低成本模型（DRAFT_MODEL）校对各部分之间的一致性"""
+    return _get_bool("WORLD_RECONCILE", True)
+
+
+def get_rate_limits() -> tuple:
+    """获取服务商的速率限制：(每分钟请求数, 每分钟token数)，0表示不限（用于运行前的耗时估算）"""
+    return max(0, _get_int("RATE_LIMIT_RPM", 0)), max(0, _get_int("RATE_LIMIT_TPM", 0))
+
+
+def get_run_history_path() -> str:
+    """获取运行历史文件的路径（每次运行追加一行指标汇总，用于校准运行前的估算）"""
+    return os.getenv("RUN_HISTORY_FILE", "intermediate/run_history.jsonl")
+
+
+def is_sharded_output_enabled() -> bool:
+    """是否把正文按场景分片保存（附带字节偏移索引），重新生成单个场景时只重写其所在的分片"""
+    return _get_bool("OUTPUT_SHARDED", False)
+
+
+def get_shard_scenes() -> int:
+    """获取每个分片包含的场景数（1为每个场景一个分片）"""
+    return max(1, _get_int("OUTPUT_SHARD_SCENES", 1))
+
+
+def is_monolithic_output_enabled() -> bool:
+    """分片输出时，是否在每次生成后同时流式拼接出完整的正文文件（否则使用 --assemble 按需生成）"""
+    return _get_bool("OUTPUT_MONOLITHIC", True)
@@ -23,9 +23,9 @@ def save_output_file(content: str, output_path: str = "output/小说正文.txt")
         f.write(content)
 
 
-def save_intermediate_file(content: str, filename: str):
+def save_intermediate_file(content: str, filename: str, intermediate_dir: str = "intermediate"):
     """保存中间文件（剧情、设定等）"""
-    intermediate_dir = Path("intermediate")
+    intermediate_dir = Path(intermediate_dir)
     intermediate_dir.mkdir(parents=True, exist_ok=True)
     
     output_path = intermediate_dir / filename
@@ -33,3 +33,13 @@ def save_intermediate_file(content: str, filename: str):
         f.write(content)
     
     return str(output_path)
+
+
+def read_intermediate_file(filename: str, intermediate_dir: str = "intermediate"):
+    """读取中间文件，文件不存在时返回None"""
+    path = Path(intermediate_dir) / filename
+    if not path.exists():
+        return None
+    
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()